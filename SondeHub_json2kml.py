@@ -29,7 +29,7 @@
 # Enjoy and modify as needed; credits at the bottom.
    
 import os
-import json
+import sondehub_stream
 import simplekml
 import sys
 import codecs
@@ -48,9 +48,11 @@ sys.stdout = codecs.getwriter("utf-8")(sys.stdout.detach())
 
 print ('Opening file "'+inputFile+'"')
 
-# Opens json file and loads as var 'data'
-with open (inputFile) as jsonFile:
-    data = json.load(jsonFile)
+# Opens json file and streams it packet by packet; only every 50th packet is kept
+# in var 'data' so memory stays small however long the flight is.
+# Adjust sample(<packets>,<count between points in data set>) for more or less linestring fidelity
+with open (inputFile, 'rb') as jsonFile:
+    data = list(sondehub_stream.sample(sondehub_stream.iter_packets(jsonFile), 50))
     
 kml = simplekml.Kml ()
 # array 'line' holds lon, lat, and alt varialbles from json
@@ -61,10 +63,9 @@ title = data[0]['serial']
 # Names document with var 'title'
 kml.document.name = title
 
-# for each record in var 'data', start with the first record
-# put lon, lat, alt into list 'points' then skip 50 to the next record.
-# Adjust this rate for more or less linestring fidelity
-for list in range(0,len(data),50):
+# for each sampled record in var 'data', start with the first record
+# put lon, lat, alt into list 'points' then move on to the next record.
+for list in range(len(data)):
     lon = data[list]['lon']
     lat = data[list]['lat']
     alt = data[list]['alt']
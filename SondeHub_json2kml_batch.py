@@ -0,0 +1,147 @@
+#####################################################################################
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License v3 as published by
+# the Free Software Foundation.
+#####################################################################################
+# Batch version of SondeHub_json2kml_v3-2.py: converts many radiosondes in one run.
+#
+# Running the v3-2 script once per sonde pays interpreter startup, the simplekml import
+# and a new TCP/TLS handshake every time.  This script downloads the sondes concurrently
+# (a bounded pool of worker threads, each reusing a keep-alive connection) and converts
+# each one to kml as soon as it arrives, while the rest are still downloading.
+#
+# Usage:
+#   python3 SondeHub_json2kml_batch.py V3250858 V1620896 ...
+#   python3 SondeHub_json2kml_batch.py -f serials.txt -j 16 -o kml/
+#   cat serials.txt | python3 SondeHub_json2kml_batch.py
+#
+# Serial files hold one serial per line; blank lines and lines starting with '#' are
+# skipped.  Use '-f -' to read serials from stdin.  --api-url points the script at a
+# mirror or at the local stand-in server in tools/sondehub_standin.py.  --merge FILE
+# writes all of the sondes into one kml instead, a folder per sonde (a station's launch
+# board), each added as soon as it is converted.  The conversion options are those of
+# v3-2; the packets go through the same sondehub_cli.Converter.
+#
+# Downloads are kept in the on-disk cache described in sondehub_cache.py: landed sondes
+# are never fetched twice, the rest are revalidated, and --offline works from the cache
+# alone.  Use --no-cache to always download.
+#
+# Enjoy and modify as needed; credits in SondeHub_json2kml_v3-2.py.
+
+import argparse
+import codecs
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import sondehub_cache
+import sondehub_cli
+import sondehub_fetch
+import sondehub_stream
+
+
+# Gathers serials from the command line, a serial file and/or stdin, dropping repeats
+def read_serials(args):
+    serials = list(args.serials)
+    lines = []
+    if args.file == '-' or (args.file is None and not serials and not sys.stdin.isatty()):
+        lines = sys.stdin.read().splitlines()
+    elif args.file:
+        with open(args.file) as f:
+            lines = f.read().splitlines()
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            serials.append(line)
+    return list(dict.fromkeys(serials))
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='Convert many SondeHub radiosondes to kml concurrently')
+    ap.add_argument('serials', nargs='*', help='radiosonde serials')
+    ap.add_argument('-f', '--file', help="file with one serial per line ('-' for stdin)")
+    ap.add_argument('-o', '--output-dir', default='.', help='directory the kml files are written to')
+    ap.add_argument('-j', '--concurrency', type=int, default=8, help='downloads in flight at once (default 8)')
+    ap.add_argument('--retries', type=int, default=3, help='retries per sonde after a failed download (default 3)')
+    ap.add_argument('--backoff', type=float, default=0.5, help='first retry delay in seconds, doubled each retry (default 0.5)')
+    ap.add_argument('--timeout', type=float, default=30, help='per-request timeout in seconds (default 30)')
+    sondehub_cli.add_arguments(ap)
+    ap.add_argument('--merge', metavar='FILE',
+                    help='write every sonde into this one kml in the output directory, each in a folder of its own')
+    ap.add_argument('--api-url', help='sonde history url; the serial is appended (default ' + sondehub_stream.API_URL + ')')
+    ap.add_argument('--archive-url', help="url of gz'd archived flights, '{0}' is the serial (default: SondeHub archive, none with --api-url)")
+    ap.add_argument('--no-cache', action='store_true', help='neither read nor fill the on-disk cache')
+    ap.add_argument('--offline', action='store_true', help='only use cached sondes; never touch the network')
+    ap.add_argument('--cache-dir', help='cache directory (default ' + sondehub_cache.default_directory() + ')')
+    ap.add_argument('--cache-mb', type=float, help='cache size cap in MB; least recently used sondes are evicted (default 500)')
+    args = ap.parse_args(argv)
+    sondehub_cli.check_arguments(ap, args)
+
+    # JSON Encoding is UTF-8. Change stdout to UTF-8 to prevent encoding error
+    # when calling print titles inside the loop
+    sys.stdout = codecs.getwriter("utf-8")(sys.stdout.detach())
+
+    if args.merge and (args.kmz or args.lod):
+        ap.error("--merge writes a plain kml; it can't be used with --kmz or --lod")
+
+    serials = read_serials(args)
+    if not serials:
+        print("Please enter at least one valid Radiosonde serial.")
+        return 1
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    cache = None
+    if not args.no_cache:
+        cache = sondehub_cache.from_environment(
+            args.cache_dir, offline=args.offline or None,
+            max_bytes=int(args.cache_mb * 1000 * 1000) if args.cache_mb else None)
+        if cache is None and args.offline:
+            print("--offline needs the cache; unset SONDEHUB_CACHE to turn it back on.")
+            return 1
+    elif args.offline:
+        print("--offline can't be used together with --no-cache.")
+        return 1
+
+    fetcher = sondehub_fetch.Fetcher(timeout=args.timeout, retries=args.retries,
+                                     backoff=args.backoff, api_url=args.api_url,
+                                     archive_url=args.archive_url, cache=cache)
+    print('Searching for {0} radiosondes...'.format(len(serials)))
+    start = time.perf_counter()
+    failed = []
+    # the same conversion as v3-2 (sondehub_cli.py), fed by the downloads: the packets are
+    # picked in the download threads as they stream in, and written here; with --merge
+    # every sonde goes into one document as its download finishes
+    converter = sondehub_cli.Converter(args.output_dir, merge=args.merge, **sondehub_cli.converter_options(args))
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as pool:
+            futures = {}
+            for serial in serials:
+                select = lambda packets, serial=serial: converter.select(packets, serial)
+                futures[pool.submit(fetcher.packets, serial, args.step, select)] = serial
+            # convert in this thread as each download finishes; the pool keeps downloading
+            for future in as_completed(futures):
+                serial = futures[future]
+                try:
+                    data = future.result()
+                    if not data:
+                        raise sondehub_fetch.FetchError(serial + ': no packets found')
+                    converter.write(data)
+                except Exception as e:
+                    print('Failed "{0}": {1}'.format(serial, e))
+                    failed.append(serial)
+        converter.close()
+    finally:
+        # the keep-alive connections of every download thread
+        fetcher.close()
+
+    print('Converted {0} of {1} radiosondes in {2:.1f} s'.format(
+        len(serials) - len(failed), len(serials), time.perf_counter() - start))
+    if failed:
+        print('Failed: ' + ' '.join(failed))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
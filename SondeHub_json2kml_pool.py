@@ -0,0 +1,159 @@
+#####################################################################################
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License v3 as published by
+# the Free Software Foundation.
+#####################################################################################
+# Multi-process version of SondeHub_json2kml_v3-2.py, for backfilling whole archives.
+#
+# Converting a sonde (parsing, sampling, formatting and writing the kml) is CPU bound,
+# so SondeHub_json2kml_batch.py, which overlaps downloads in threads, still converts on
+# one core.  This script spreads the work over a pool of processes instead: every json
+# file (directories are expanded to the files in them), tarball or serial is one task,
+# tasks are handed out in chunks, and each worker writes its kml files itself, sending
+# back only a short result.  A summary of throughput, failures and per-source timings is
+# printed at the end.  Each task runs sondehub_cli.convert_source(), so the conversion
+# options are those of v3-2 (bar --merge, which one process has to write).
+#
+# Usage:
+#   python3 SondeHub_json2kml_pool.py archive/ -o kml/
+#   python3 SondeHub_json2kml_pool.py -j 8 --chunksize 16 season.tar.gz V3250858 ...
+#   python3 SondeHub_json2kml_pool.py -f serials.txt
+#
+# Serials are looked up like v3-2 does, through the on-disk cache (sondehub_cache.py);
+# set SONDEHUB_OFFLINE=1 to convert a season of cached sondes without the network.
+#
+# Enjoy and modify as needed; credits in SondeHub_json2kml_v3-2.py.
+
+import argparse
+import codecs
+import io
+import multiprocessing
+import os
+import sys
+import time
+from contextlib import nullcontext, redirect_stdout
+
+import sondehub_cli
+import sondehub_profile
+import sondehub_stream
+
+# options of the run, set in each worker by _init()
+_options = None
+
+
+# Gathers sources from the command line and/or a file listing one per line; directories
+# become the json files in them so each one is a task of its own
+def read_sources(args):
+    sources = list(args.sources)
+    if args.file:
+        with (nullcontext(sys.stdin) if args.file == '-' else open(args.file)) as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    sources.append(line)
+    tasks = []
+    for source in sources:
+        if os.path.isdir(source) and not _is_saved(source):
+            for root, dirs, files in os.walk(source):
+                dirs[:] = sorted(name for name in dirs if not name.endswith(sondehub_stream.COLUMNS_SUFFIX))
+                tasks.extend(os.path.join(root, name) for name in sorted(files)
+                             if name.lower().endswith(sondehub_stream.JSON_SUFFIXES))
+        else:
+            tasks.append(source)
+    return list(dict.fromkeys(tasks))
+
+
+# True when directory 'path' is a flight saved with --save-columns, one task of its own
+def _is_saved(path):
+    import sondehub_flightcache
+    return sondehub_flightcache.is_saved(path)
+
+
+def _init(options):
+    global _options
+    _options = options
+
+
+# Worker: converts every sonde in 'source' with sondehub_cli.convert_source(), the
+# conversion v3-2 runs.  Returns (source, paths written, packets read, seconds, error
+# message or None).
+def convert_source(source):
+    options = _options
+    counts = sondehub_profile.Counts()
+    start = time.perf_counter()
+    try:
+        # the "Saving file" lines would interleave; the main process reports instead
+        with redirect_stdout(io.StringIO()):
+            paths = sondehub_cli.convert_source(source, options.output_dir, profile=counts,
+                                                **sondehub_cli.converter_options(options))
+        error = None if paths else 'no packets found'
+    except Exception as e:
+        paths, error = [], str(e)
+    return source, paths, counts.counts['packets seen'], time.perf_counter() - start, error
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='Convert many SondeHub radiosondes to kml on all cores')
+    ap.add_argument('sources', nargs='*', help='json files, directories of them, tarballs or serials')
+    ap.add_argument('-f', '--file', help="file with one source per line ('-' for stdin)")
+    ap.add_argument('-o', '--output-dir', default='.', help='directory the kml files are written to')
+    ap.add_argument('-j', '--processes', type=int, default=os.cpu_count() or 1,
+                    help='worker processes (default: one per core, {0})'.format(os.cpu_count() or 1))
+    ap.add_argument('--chunksize', type=int,
+                    help='sources handed to a worker at a time (default: about 4 chunks per worker, at most 32)')
+    ap.add_argument('-q', '--quiet', action='store_true', help='only print failures and the summary')
+    sondehub_cli.add_arguments(ap)
+    args = ap.parse_args(argv)
+    sondehub_cli.check_arguments(ap, args)
+
+    # JSON Encoding is UTF-8. Change stdout to UTF-8 to prevent encoding error
+    # when calling print titles inside the loop
+    sys.stdout = codecs.getwriter("utf-8")(sys.stdout.detach())
+
+    tasks = read_sources(args)
+    if not tasks:
+        print("Please enter at least one json file, directory, tarball or Radiosonde serial.")
+        return 1
+    os.makedirs(args.output_dir, exist_ok=True)
+    processes = max(1, min(args.processes, len(tasks)))
+    chunksize = args.chunksize or max(1, min(32, len(tasks) // (processes * 4)))
+
+    print('Converting {0} sources with {1} processes...'.format(len(tasks), processes))
+    start = time.perf_counter()
+    results = []
+    with multiprocessing.Pool(processes, initializer=_init, initargs=(args,)) as pool:
+        # results stream back as each chunk finishes, in whatever order that is
+        for source, paths, packets, seconds, error in pool.imap_unordered(convert_source, tasks, chunksize):
+            results.append((source, paths, packets, seconds, error))
+            if error:
+                print('Failed "{0}": {1}'.format(source, error))
+            elif not args.quiet:
+                print('Saved "{0}" ({1} packets, {2:.2f} s)'.format('", "'.join(paths), packets, seconds))
+    elapsed = time.perf_counter() - start
+
+    summary(results, processes, elapsed)
+    return 1 if any(r[4] for r in results) else 0
+
+
+# Prints totals, throughput and the spread of per-source times
+def summary(results, processes, elapsed):
+    done = [r for r in results if not r[4]]
+    failed = [r for r in results if r[4]]
+    packets = sum(r[2] for r in results)
+    busy = sum(r[3] for r in results)
+    print('Converted {0} of {1} sources in {2:.1f} s with {3} processes'.format(
+        len(done), len(results), elapsed, processes))
+    if elapsed > 0:
+        print('  {0} packets read: {1:.0f} packets/s, {2:.1f} sources/s; workers busy {3:.0%} of the time'.format(
+            packets, packets / elapsed, len(done) / elapsed, busy / (elapsed * processes)))
+    if done:
+        times = sorted(r[3] for r in done)
+        slowest = max(done, key=lambda r: r[3])
+        print('  per source: median {0:.2f} s, 95th percentile {1:.2f} s, slowest {2:.2f} s ("{3}")'.format(
+            times[len(times) // 2], times[min(len(times) - 1, int(len(times) * 0.95))], slowest[3], slowest[0]))
+    if failed:
+        print('Failed: ' + ' '.join(r[0] for r in failed))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
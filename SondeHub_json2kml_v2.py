@@ -22,8 +22,7 @@
 # Enjoy and modify as needed; credits at the bottom.
 
 
-import json
-import urllib.request
+import sondehub_stream
 import simplekml
 import sys
 import codecs
@@ -42,14 +41,16 @@ except:
 # when calling print titles inside the loop
 sys.stdout = codecs.getwriter("utf-8")(sys.stdout.detach())
 
-# Change in v2 is this:  script navigates to the json directly using this url
-# and the radiosonde serial
-url = "https://api.v2.sondehub.org/sonde/" + inputFile
+# Change in v2 is this:  script navigates to the json directly using the radiosonde
+# serial (https://api.v2.sondehub.org/sonde/<serial>); gz'd archive records and local
+# json files (plain or compressed) are read too.
 print ('Found "'+inputFile+'"')
 
-# Opens url with serial and pulls down json data loads as var 'data'
-with urllib.request.urlopen(url) as jsonData:
-    data = json.load(jsonData)
+# Opens the sonde json and streams it packet by packet; only every 50th packet
+# is kept in var 'data' so memory stays small however long the flight is.
+# Adjust sample(<packets>,<count between points in data set>) for more or less linestring fidelity
+with sondehub_stream.open_source(inputFile) as jsonData:
+    data = list(sondehub_stream.sample(sondehub_stream.iter_packets(jsonData), 50))
 
 kml = simplekml.Kml()
 # array 'line' holds lon, lat, and alt varialbles from json
@@ -60,10 +61,9 @@ title = data[0]['serial']
 # Names document with var 'title'
 kml.document.name = title
 
-# for each record in var 'data', start with the first record
-# put lon, lat, alt into list 'points' then skip 50 to the next record.
-# Adjust this rate for more or less linestring fidelity
-for list in range(0,len(data),50):
+# for each sampled record in var 'data', start with the first record
+# put lon, lat, alt into list 'points' then move on to the next record.
+for list in range(len(data)):
     lon = data[list]['lon']
     lat = data[list]['lat']
     alt = data[list]['alt']
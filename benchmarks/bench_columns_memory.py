@@ -0,0 +1,61 @@
+#####################################################################################
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License v3 as published by
+# the Free Software Foundation.
+#####################################################################################
+# Memory per packet: a list of parsed json dicts against sondehub_columns.Packets,
+# measured with tracemalloc on a synthetic flight (200k packets by default).
+#
+# Usage:
+#   python3 benchmarks/bench_columns_memory.py [--packets N]
+
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import sondehub_columns
+
+
+def packets(count):
+    for i in range(count):
+        yield {
+            "software_name": "radiosonde_auto_rx", "software_version": "1.5.5",
+            "uploader_callsign": "BENCH", "time_received": "2021-05-04T11:42:05.123456Z",
+            "datetime": "2021-05-04T%02d:%02d:%02d.000000Z" % (i // 3600 % 24, i // 60 % 60, i % 60),
+            "manufacturer": "Vaisala", "type": "RS41", "serial": "V0000001", "subtype": "RS41-SGP",
+            "frame": i, "lat": 40.46 + i * 1e-6, "lon": -3.58 + i * 1e-6, "alt": 800.0 + i * 0.03,
+            "temp": 9.2, "humidity": 63.1, "vel_v": 5.1, "vel_h": 4.2, "heading": 75.0, "sats": 9,
+            "batt": 2.9, "frequency": 403.002, "snr": 12.3, "rssi": -80.1,
+        }
+
+
+def measure(build, count):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build(packets(count))
+    elapsed = time.perf_counter() - start
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return size, peak, elapsed
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Columnar packet store memory benchmark')
+    ap.add_argument('--packets', type=int, default=200000)
+    args = ap.parse_args()
+
+    for name, build in (('dicts', list), ('columns', sondehub_columns.Packets.from_packets)):
+        size, peak, elapsed = measure(build, args.packets)
+        print('%-8s %7.1f bytes/packet held  %8.1f MB peak  %6.2f s' %
+              (name, size / args.packets, peak / 1e6, elapsed))
+
+
+if __name__ == '__main__':
+    main()
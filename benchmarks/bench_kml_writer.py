@@ -0,0 +1,87 @@
+#####################################################################################
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License v3 as published by
+# the Free Software Foundation.
+#####################################################################################
+# KML backend benchmark: sondehub_convert.convert() through simplekml against the
+# streaming sondehub_kmlwriter, on a synthetic flight kept at full resolution (--step 1)
+# so every packet becomes a point.
+#
+# Usage:
+#   python3 benchmarks/bench_kml_writer.py [--packets N] [--step N]
+#
+# Each backend runs in its own interpreter so the peak RSS figures don't mix; the
+# packets are read into columns before the clock starts, so the figures are for
+# building and writing the kml alone.  The two kml files are compared byte for byte.
+
+import argparse
+import filecmp
+import io
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import sondehub_convert
+import sondehub_simplify
+import sondehub_stream
+from bench_stream_memory import write_flight
+
+
+def child(writer, path, step, outdir):
+    with open(path, 'rb') as jsonFile:
+        data = sondehub_simplify.select(sondehub_stream.iter_packets(jsonFile), step)
+    # ru_maxrss is in KiB on Linux
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    with redirect_stdout(io.StringIO()):
+        sondehub_convert.convert(data, outdir, writer)
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({'writer': writer, 'points': len(data), 'seconds': elapsed,
+                      'peak_kib': peak, 'growth_kib': peak - before}))
+
+
+def main():
+    ap = argparse.ArgumentParser(description='simplekml vs streaming kml writer benchmark')
+    ap.add_argument('--packets', type=int, default=100000)
+    ap.add_argument('--step', type=int, default=1, help='keep every STEP-th packet (default 1: all of them)')
+    ap.add_argument('--child', nargs=4, metavar=('WRITER', 'FILE', 'STEP', 'OUTDIR'), help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.child:
+        writer, path, step, outdir = args.child
+        child(writer, path, int(step), outdir)
+        return
+
+    workdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(workdir, 'flight.json')
+        print('Writing %d packets to %s' % (args.packets, path))
+        write_flight(path, args.packets)
+        outputs = []
+        for writer in sondehub_convert.WRITERS:
+            outdir = os.path.join(workdir, writer)
+            os.mkdir(outdir)
+            out = subprocess.run([sys.executable, __file__, '--child', writer, path, str(args.step), outdir],
+                                 check=True, capture_output=True, text=True).stdout
+            r = json.loads(out)
+            kml = os.path.join(outdir, os.listdir(outdir)[0])
+            outputs.append(kml)
+            print('%-10s %7d points  %7.2f s  peak RSS %8.1f MB (+%.1f MB while writing)  %6.1f MB kml' %
+                  (r['writer'], r['points'], r['seconds'], r['peak_kib'] / 1024, r['growth_kib'] / 1024,
+                   os.path.getsize(kml) / 1e6))
+        print('Outputs identical: %s' % filecmp.cmp(outputs[0], outputs[1], shallow=False))
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+#####################################################################################
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License v3 as published by
+# the Free Software Foundation.
+#####################################################################################
+# Regression benchmark of the conversion pipeline (sondehub_convert) on a large
+# synthetic flight from flightgen.py, kept at full resolution (--step 1) so every
+# packet becomes a point.
+#
+# Usage:
+#   python3 benchmarks/bench_pipeline.py [--packets 200000] [--step 1] [--repeat 3] [--writers stream,simplekml]
+#   python3 benchmarks/bench_pipeline.py --save before.json
+#   python3 benchmarks/bench_pipeline.py --compare before.json [--threshold 10]
+#
+# Timed, as the fastest of --repeat runs, for both point schemas (v3-2 and v3):
+#
+#   columns  sampling the parsed packets into columns (sondehub_simplify.select())
+#   saved    the same from the flight saved with --save-columns (sondehub_flightcache.py),
+#            memory-mapped, in place of the json
+#   extract  the track and the point values in one pass (Schema.extract())
+#   convert  sondehub_convert.convert() end to end, per writer (--writers, default
+#            stream; simplekml takes minutes at this size)
+#
+# The json is parsed once, before the clock starts.  --compare prints the change
+# against an earlier --save and exits with status 1 when any figure got more than
+# --threshold percent slower, so a job can run it after each change.
+
+import argparse
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import sondehub_columns
+import sondehub_convert
+import sondehub_flightcache
+import sondehub_simplify
+import sondehub_stream
+from flightgen import write_flight
+
+SCHEMAS = {'v3-2': sondehub_convert.V32, 'v3': sondehub_convert.V3}
+
+
+# Fastest of 'repeat' runs of 'func'
+def best(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def measure(packets, step, repeat, writers, outdir):
+    results = {}
+    data = sondehub_simplify.select(iter(packets), step)
+    results['columns'] = best(lambda: sondehub_simplify.select(iter(packets), step), repeat)
+    saved = sondehub_flightcache.save(sondehub_columns.Packets.from_packets(packets),
+                                      os.path.join(outdir, 'flight' + sondehub_flightcache.SUFFIX))
+    results['saved'] = best(lambda: sondehub_simplify.select_columns(sondehub_flightcache.load(saved), step), repeat)
+    title = data.string('serial', 0)
+    for name, schema in SCHEMAS.items():
+        def extract():
+            line, points = schema.extract(data, title)
+            for _ in points:
+                pass
+        results[name + ' extract'] = best(extract, repeat)
+        for writer in writers:
+            def convert():
+                with redirect_stdout(io.StringIO()):
+                    sondehub_convert.convert(data, outdir, writer, schema=schema)
+            results['%s convert %s' % (name, writer)] = best(convert, repeat)
+    return len(data), results
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Regression benchmark of the conversion pipeline')
+    ap.add_argument('--packets', type=int, default=200000)
+    ap.add_argument('--step', type=int, default=1, help='keep every STEP-th packet (default 1: all of them)')
+    ap.add_argument('--repeat', type=int, default=3, help='runs per figure; the fastest counts')
+    ap.add_argument('--writers', default='stream',
+                    help='comma separated kml writers to time (default stream; any of {0})'.format(
+                        ','.join(sondehub_convert.WRITERS)))
+    ap.add_argument('--save', help='write the figures to this json file')
+    ap.add_argument('--compare', help='json file of an earlier --save to compare against')
+    ap.add_argument('--threshold', type=float, default=10,
+                    help='with --compare: percent slowdown that counts as a regression (default 10)')
+    args = ap.parse_args()
+    writers = args.writers.split(',')
+    for writer in writers:
+        if writer not in sondehub_convert.WRITERS:
+            ap.error('unknown writer {0!r}'.format(writer))
+
+    workdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(workdir, 'flight.json')
+        print('Writing %d packets to %s' % (args.packets, path))
+        write_flight(path, args.packets)
+        with open(path, 'rb') as jsonFile:
+            packets = list(sondehub_stream.iter_packets(jsonFile))
+        points, results = measure(packets, args.step, args.repeat, writers, workdir)
+    finally:
+        shutil.rmtree(workdir)
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+    print('%d packets, %d kept, fastest of %d' % (len(packets), points, args.repeat))
+    regressions = []
+    for name, seconds in results.items():
+        line = '  %-26s %8.3f s' % (name, seconds)
+        before = baseline.get(name)
+        if before:
+            change = (seconds - before) / before * 100
+            line += '  %+6.0f%%  (%.2fx)' % (change, before / seconds)
+            if change > args.threshold:
+                regressions.append(name)
+        print(line)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'python': sys.version.split()[0], 'packets': args.packets, 'step': args.step,
+                       'results': results}, f, indent=1)
+        print('Saved the figures to %s' % args.save)
+    if regressions:
+        print('Slower by more than %g%%: %s' % (args.threshold, ', '.join(regressions)))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
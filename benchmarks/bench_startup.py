@@ -0,0 +1,116 @@
+#####################################################################################
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License v3 as published by
+# the Free Software Foundation.
+#####################################################################################
+# Startup benchmark for SondeHub_json2kml_v3-2.py: what a batch job running the
+# converter thousands of times on small flights pays per run before any work is done.
+#
+# Usage:
+#   python3 benchmarks/bench_startup.py [--runs 20] [--packets 1000] [-- --writer stream ...]
+#   python3 benchmarks/bench_startup.py --script /path/to/old/checkout/SondeHub_json2kml_v3-2.py
+#
+# Reported, as medians of --runs fresh interpreters:
+#
+#   python   'python3 -c pass', the floor no script can go below
+#   import   the script's imports alone (-X importtime, the self time of every module it loads)
+#   run      converting a small synthetic flight end to end
+#
+# plus the slowest imports of one run, by self time (the module's own code, not the
+# modules it imports in turn, which are listed on their own), and, for comparison, the
+# time per flight when the same flight is converted --runs times in one process through
+# sondehub_cli.convert_source().
+# --script points at another checkout (e.g. a git worktree of an older commit) to
+# compare against.
+
+import argparse
+import io
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from flightgen import write_flight
+
+_IMPORT_LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+# Median wall time of 'runs' runs of 'command' in 'cwd'
+def timed(command, runs, cwd):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=cwd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+# (module, self microseconds) of every import -X importtime reports for 'command',
+# slowest first; imports done by the interpreter before the script are left out.  Self
+# time charges each module only for its own code, so a module that merely imports a
+# slow one doesn't rank with it.
+def imports(command, cwd):
+    stderr = subprocess.run(command[:1] + ['-X', 'importtime'] + command[1:], cwd=cwd, check=True,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True).stderr
+    floor = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'pass'], check=True,
+                           stderr=subprocess.PIPE, text=True).stderr
+    startup = {m.group(4) for m in map(_IMPORT_LINE.match, floor.splitlines()) if m}
+    top = []
+    for m in map(_IMPORT_LINE.match, stderr.splitlines()):
+        if m and m.group(4) not in startup:
+            top.append((m.group(4), int(m.group(1))))
+    return sorted(top, key=lambda item: -item[1])
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Startup cost of SondeHub_json2kml_v3-2.py')
+    ap.add_argument('--runs', type=int, default=20)
+    ap.add_argument('--packets', type=int, default=1000, help='size of the synthetic flight (default 1000)')
+    ap.add_argument('--script', default=os.path.join(ROOT, 'SondeHub_json2kml_v3-2.py'),
+                    help='converter script to run (default this checkout\'s v3-2)')
+    ap.add_argument('--top', type=int, default=10, help='slowest imports to list')
+    ap.add_argument('options', nargs='*', help='options passed on to the converter (after --)')
+    args = ap.parse_args()
+
+    script = os.path.abspath(args.script)
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, 'flight.json')
+        write_flight(path, args.packets)
+        command = [sys.executable, script, path] + args.options
+
+        floor = timed([sys.executable, '-c', 'pass'], args.runs, workdir)
+        top = imports(command, workdir)
+        run = timed(command, args.runs, workdir)
+        print('%s, %d packets, median of %d runs' % (script, args.packets, args.runs))
+        print('  python   %7.1f ms' % (floor * 1000))
+        print('  import   %7.1f ms' % (sum(us for _, us in top) / 1000))
+        print('  run      %7.1f ms  (%.1f ms over the bare interpreter)' % (run * 1000, (run - floor) * 1000))
+        print('Slowest imports:')
+        for name, us in top[:args.top]:
+            print('  %-32s %7.1f ms' % (name, us / 1000))
+
+        # the same flight converted again and again in one process
+        if os.path.dirname(script) == os.path.abspath(ROOT):
+            import sondehub_cli
+            cli = sondehub_cli.parser().parse_args([path] + args.options)
+            outdir = os.path.join(workdir, 'out')
+            os.mkdir(outdir)
+            times = []
+            for _ in range(args.runs):
+                start = time.perf_counter()
+                with redirect_stdout(io.StringIO()):
+                    sondehub_cli.convert_source(path, outdir, **sondehub_cli.converter_options(cli))
+                times.append(time.perf_counter() - start)
+            print('In process (sondehub_cli.convert_source): %.1f ms per flight after the first' %
+                  (statistics.median(times[1:] or times) * 1000))
+
+
+if __name__ == '__main__':
+    main()
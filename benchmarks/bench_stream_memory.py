@@ -0,0 +1,84 @@
+#####################################################################################
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License v3 as published by
+# the Free Software Foundation.
+#####################################################################################
+# Memory benchmark: json.load() + range(0,len(data),50) against the streaming reader
+# in sondehub_stream.py on a synthetic flight (1M packets by default), generated by
+# flightgen.py like the other benchmarks use.
+#
+# Usage:
+#   python3 benchmarks/bench_stream_memory.py [--packets N] [--keep]
+#
+# Each method runs in its own interpreter so the peak RSS figures don't mix.
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import sondehub_stream
+from flightgen import write_flight
+
+
+def run_json_load(path):
+    with open(path, 'rb') as jsonFile:
+        data = json.load(jsonFile)
+    return [data[i] for i in range(0, len(data), 50)]
+
+
+def run_stream(path):
+    with open(path, 'rb') as jsonFile:
+        return list(sondehub_stream.sample(sondehub_stream.iter_packets(jsonFile), 50))
+
+
+METHODS = {'json.load': run_json_load, 'stream': run_stream}
+
+
+def child(method, path):
+    start = time.perf_counter()
+    kept = METHODS[method](path)
+    elapsed = time.perf_counter() - start
+    # ru_maxrss is in KiB on Linux
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({'method': method, 'kept': len(kept), 'seconds': elapsed, 'peak_kib': peak}))
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Streaming ingest memory benchmark')
+    ap.add_argument('--packets', type=int, default=1000000)
+    ap.add_argument('--keep', action='store_true', help="keep the synthetic json file")
+    ap.add_argument('--child', nargs=2, metavar=('METHOD', 'FILE'), help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.child:
+        child(*args.child)
+        return
+
+    fd, path = tempfile.mkstemp(suffix='.json')
+    os.close(fd)
+    try:
+        print('Writing %d packets to %s' % (args.packets, path))
+        write_flight(path, args.packets)
+        print('File size: %.1f MB' % (os.path.getsize(path) / 1e6))
+        for method in METHODS:
+            out = subprocess.run([sys.executable, __file__, '--child', method, path],
+                                 check=True, capture_output=True, text=True).stdout
+            r = json.loads(out)
+            print('%-10s kept %7d  %7.2f s  peak RSS %8.1f MB' %
+                  (r['method'], r['kept'], r['seconds'], r['peak_kib'] / 1024))
+    finally:
+        if args.keep:
+            print('Kept ' + path)
+        else:
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
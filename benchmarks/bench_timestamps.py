@@ -0,0 +1,79 @@
+#####################################################################################
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License v3 as published by
+# the Free Software Foundation.
+#####################################################################################
+# Micro-benchmark: per-packet cost of turning a SondeHub 'datetime' string into the
+# 'Sonde Time' shown in the descriptions, before (dateutil + strftime, as v3-2 did)
+# and after (sondehub_time).
+#
+# Usage:
+#   python3 benchmarks/bench_timestamps.py [--packets N]
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import sondehub_time
+
+
+def with_dateutil(texts):
+    import dateutil.parser as parser
+    return [datetime.strftime(parser.parse(dt), '%Y-%m-%d %H:%M:%S %Z') for dt in texts]
+
+
+def with_fromisoformat(texts):
+    return [datetime.strftime(sondehub_time.to_datetime(sondehub_time.parse(dt)), '%Y-%m-%d %H:%M:%S %Z')
+            for dt in texts]
+
+
+def with_parse_many(texts):
+    return sondehub_time.format_many(sondehub_time.parse_many(texts))
+
+
+def parse_only_scalar(texts):
+    return [sondehub_time.parse(dt) for dt in texts]
+
+
+def parse_only_vectorised(texts):
+    return sondehub_time.parse_many(texts)
+
+
+METHODS = (
+    ('dateutil parse + strftime (before)', with_dateutil),
+    ('fromisoformat parse + strftime', with_fromisoformat),
+    ('parse_many + format_many (after)', with_parse_many),
+    ('parse() only', parse_only_scalar),
+    ('parse_many() only', parse_only_vectorised),
+)
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Timestamp parsing micro-benchmark')
+    ap.add_argument('--packets', type=int, default=100000)
+    args = ap.parse_args()
+
+    texts = ['2021-05-04T%02d:%02d:%02d.%06dZ' % (i // 3600 % 24, i // 60 % 60, i % 60, i % 1000000)
+             for i in range(args.packets)]
+    expected = with_parse_many(texts[:1000])
+    for name, method in METHODS:
+        try:
+            if name.endswith('(before)'):
+                import dateutil.parser
+        except ImportError:
+            print('%-38s skipped (python-dateutil not installed)' % name)
+            continue
+        start = time.perf_counter()
+        result = method(texts)
+        elapsed = time.perf_counter() - start
+        if 'format' in name or 'strftime' in name:
+            assert list(result[:1000]) == expected, name + ' disagrees'
+        print('%-38s %8.3f us/packet' % (name, elapsed / len(texts) * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,216 @@
+#####################################################################################
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License v3 as published by
+# the Free Software Foundation.
+#####################################################################################
+# End-to-end benchmark of every converter version (SondeHub_json2kml.py, _v2, _v3 and
+# _v3-2) on synthetic flights from flightgen.py, from 1k packets up to millions.
+#
+# Usage:
+#   python3 benchmarks/bench_versions.py [--sizes 1000,10000,100000] [--versions v1,v3-2]
+#   python3 benchmarks/bench_versions.py --sizes 1000000,5000000 --save after.json --compare before.json
+#
+# Each script runs unchanged, as from the command line, in its own interpreter (so the
+# peak RSS figures don't mix) and in a scratch directory it saves its kml into.  The
+# stages are timed by wrapping the shared functions every version goes through:
+#
+#   startup  imports, argument handling, opening the input
+#   parse    inside sondehub_stream.iter_packets(): reading and decoding the json
+#   sample   the rest of reading the flight in: sampling, columns, simplification
+#   build    from the sampled data to the kml document (simplekml objects); for the
+#            versions writing the kml directly (sondehub_kmlwriter) the writing too
+#   save     simplekml.Kml.save(): formatting and writing the kml, 0 without simplekml
+#
+# Besides those: wall time, packets read per second, peak RSS and the size of the
+# output.  --save writes the figures as json; --compare prints the change against
+# such a file from an earlier run (e.g. before a change).
+
+import argparse
+import json
+import os
+import resource
+import runpy
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from flightgen import write_flight
+
+VERSIONS = {
+    'v1': 'SondeHub_json2kml.py',
+    'v2': 'SondeHub_json2kml_v2.py',
+    'v3': 'SondeHub_json2kml_v3.py',
+    'v3-2': 'SondeHub_json2kml_v3-2.py',
+}
+STAGES = ('startup', 'parse', 'sample', 'build', 'save')
+
+
+# Runs one version on 'path' in the current directory and writes its figures to 'result'
+def child(version, path, result):
+    start = time.perf_counter()
+    import simplekml
+    import sondehub_simplify
+    import sondehub_stream
+
+    marks = {'parse': 0.0, 'packets': 0}
+    iter_packets, sample, select, save = (sondehub_stream.iter_packets, sondehub_stream.sample,
+                                          sondehub_simplify.select, simplekml.Kml.save)
+
+    def timed_iter_packets(*args, **kwargs):
+        marks.setdefault('ingest_start', time.perf_counter())
+        packets = iter_packets(*args, **kwargs)
+        while True:
+            t = time.perf_counter()
+            try:
+                packet = next(packets)
+            except StopIteration:
+                marks['parse'] += time.perf_counter() - t
+                return
+            marks['parse'] += time.perf_counter() - t
+            marks['packets'] += 1
+            yield packet
+
+    def timed_sample(*args, **kwargs):
+        yield from sample(*args, **kwargs)
+        marks['ingest_end'] = time.perf_counter()
+
+    def timed_select(*args, **kwargs):
+        data = select(*args, **kwargs)
+        marks['ingest_end'] = time.perf_counter()
+        return data
+
+    def timed_save(self, *args, **kwargs):
+        marks['save_start'] = time.perf_counter()
+        save(self, *args, **kwargs)
+        marks['save_end'] = time.perf_counter()
+
+    sondehub_stream.iter_packets = timed_iter_packets
+    sondehub_stream.sample = timed_sample
+    sondehub_simplify.select = timed_select
+    simplekml.Kml.save = timed_save
+
+    script = os.path.join(ROOT, VERSIONS[version])
+    sys.argv = [script, path]
+    try:
+        runpy.run_path(script, run_name='__main__')
+    except SystemExit as e:
+        if e.code:
+            raise
+    end = time.perf_counter()
+    # the stream writer writes as it goes; no separate save
+    marks.setdefault('save_start', end)
+    marks.setdefault('save_end', end)
+
+    stages = {
+        'startup': marks['ingest_start'] - start,
+        'parse': marks['parse'],
+        'sample': marks['ingest_end'] - marks['ingest_start'] - marks['parse'],
+        'build': marks['save_start'] - marks['ingest_end'],
+        'save': marks['save_end'] - marks['save_start'],
+    }
+    output = sum(os.path.getsize(name) for name in os.listdir('.') if name.endswith(('.kml', '.kmz')))
+    # ru_maxrss is in KiB on Linux
+    with open(result, 'w') as f:
+        json.dump({'version': version, 'packets': marks['packets'], 'seconds': end - start,
+                   'stages': stages, 'peak_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                   'output_bytes': output}, f)
+
+
+# Runs 'version' on the flight in 'path' 'repeat' times in fresh interpreters and
+# returns the figures of the fastest run
+def run(version, path, size, workdir, repeat):
+    best = None
+    for _ in range(repeat):
+        outdir = tempfile.mkdtemp(dir=workdir)
+        result = os.path.join(outdir, 'result.json')
+        try:
+            subprocess.run([sys.executable, os.path.abspath(__file__), '--child', version, path, result],
+                           cwd=outdir, check=True, stdout=subprocess.DEVNULL)
+            with open(result) as f:
+                r = json.load(f)
+        finally:
+            shutil.rmtree(outdir)
+        if best is None or r['seconds'] < best['seconds']:
+            best = r
+    best['size'] = size
+    return best
+
+
+def report(r, baseline):
+    stages = '  '.join('%s %7.3f' % (stage, r['stages'][stage]) for stage in STAGES)
+    line = '%-5s %8d packets  %8.2f s  %9.0f packets/s  peak RSS %7.1f MB  %8.1f KB kml  |  %s' % (
+        r['version'], r['size'], r['seconds'], r['packets'] / r['seconds'], r['peak_kib'] / 1024,
+        r['output_bytes'] / 1e3, stages)
+    print(line)
+    before = baseline.get((r['version'], r['size']))
+    if before:
+        changes = '  '.join('%s %s' % (stage, change(before['stages'][stage], r['stages'][stage]))
+                            for stage in STAGES)
+        print('      vs baseline: time %s  peak RSS %s  output %s  |  %s' % (
+            change(before['seconds'], r['seconds']), change(before['peak_kib'], r['peak_kib']),
+            change(before['output_bytes'], r['output_bytes']), changes))
+
+
+def change(before, after):
+    if not before:
+        return '   n/a'
+    return '%+5.0f%%' % ((after - before) / before * 100)
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Benchmark every converter version on synthetic flights')
+    ap.add_argument('--sizes', default='1000,10000,100000',
+                    help='comma separated flight sizes in packets (default 1000,10000,100000; up to 5000000 and beyond)')
+    ap.add_argument('--versions', default=','.join(VERSIONS),
+                    help='comma separated versions to run (default all: {0})'.format(','.join(VERSIONS)))
+    ap.add_argument('--repeat', type=int, default=1, help='runs per version and size; the fastest counts')
+    ap.add_argument('--save', help='write the figures to this json file')
+    ap.add_argument('--compare', help='json file of an earlier --save to compare against')
+    ap.add_argument('--flights', help='keep the generated flights in this directory and reuse them')
+    ap.add_argument('--child', nargs=3, metavar=('VERSION', 'FILE', 'RESULT'), help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.child:
+        child(*args.child)
+        return
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    versions = args.versions.split(',')
+    for version in versions:
+        if version not in VERSIONS:
+            ap.error('unknown version {0!r}'.format(version))
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = {(r['version'], r['size']): r for r in json.load(f)['results']}
+
+    workdir = tempfile.mkdtemp()
+    flights = args.flights or workdir
+    os.makedirs(flights, exist_ok=True)
+    results = []
+    try:
+        for size in sizes:
+            path = os.path.abspath(os.path.join(flights, 'flight-%d.json' % size))
+            if not os.path.exists(path):
+                print('Writing %d packets to %s' % (size, path))
+                write_flight(path, size)
+            for version in versions:
+                r = run(version, path, size, workdir, args.repeat)
+                results.append(r)
+                report(r, baseline)
+    finally:
+        shutil.rmtree(workdir)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'python': sys.version.split()[0], 'results': results}, f, indent=1)
+        print('Saved the figures to %s' % args.save)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+#####################################################################################
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License v3 as published by
+# the Free Software Foundation.
+#####################################################################################
+# Synthetic SondeHub flights for the benchmarks, so nothing needs the network.
+#
+# A flight is a radiosonde launched from Madrid-ish: an ascent at ~5 m/s to a burst at
+# ~30 km, a fast fall that slows as the air thickens, a landing, drifting with a wind
+# that changes with height.  Temperature and humidity follow a standard atmosphere with
+# some noise.  Like the real API data:
+#
+#  * some packets lack temp/humidity (sensor boom trouble) or batt,
+#  * a share of frames is uploaded by two or three stations (duplicates with their own
+#    uploader_callsign, snr and rssi) and the list is only roughly in time order.
+#
+# Any size can be asked for (1k .. 5M packets and beyond); the flight always lasts
+# 'duration' seconds, bigger flights just have more frames per second.  The output is
+# written as it is generated, so the size is not limited by memory, and the same seed
+# always gives the same file.
+#
+# Usage:
+#   python3 benchmarks/flightgen.py flight.json --packets 100000 [--gzip]
+#
+#   import flightgen
+#   flightgen.write_flight('flight.json', 100000)
+
+import argparse
+import gzip
+import heapq
+import json
+import math
+import random
+from datetime import datetime, timedelta, timezone
+
+LAUNCH = (-3.58, 40.46, 650.0)  # lon, lat, alt
+BURST_ALT = 30500.0
+ASCENT_RATE = 5.2  # m/s
+DESCENT_RATE = 5.0  # m/s at sea level
+DEFAULT_DURATION = 9000  # s; launch to landing
+START = datetime(2021, 5, 4, 11, 0, 0, tzinfo=timezone.utc)
+
+RECEIVERS = ('EA4GPZ', 'EA1ABC', 'EB4XYZ', 'F4KLM', 'CT1DEF')
+
+
+# Yields the packets of a flight of 'count' packets (duplicates included).
+# 'duplicates' is the share of frames heard by more than one station, 'missing' the
+# share lacking temp/humidity, 'jitter' how many positions a packet may be out of order.
+def packets(count, serial='V0000001', duration=DEFAULT_DURATION, duplicates=0.3, missing=0.05,
+            jitter=20, seed=1):
+    rng = random.Random(seed)
+    # frames needed for 'count' packets at 1 + duplicates*1.5 copies per frame
+    frames = max(2, int(count / (1 + duplicates * 1.5)))
+    dt = duration / frames
+    ascent_time = (BURST_ALT - LAUNCH[2]) / ASCENT_RATE
+    lon, lat, alt = LAUNCH
+    out = 0
+    pending = []
+    frame = 0
+    while out < count:
+        t = frame * dt
+        if t < ascent_time:
+            vel_v = ASCENT_RATE + rng.gauss(0, 0.3)
+        else:
+            # terminal velocity grows with thinner air (scale height ~7 km)
+            vel_v = -DESCENT_RATE * math.exp(alt / 14600.0) + rng.gauss(0, 0.3)
+        alt = max(LAUNCH[2] - 50, alt + vel_v * dt)
+        # wind: westerly, strongest around the jet stream at ~11 km
+        wind = 5 + 25 * math.exp(-((alt - 11000) / 4000) ** 2)
+        heading = (80 + 20 * math.sin(alt / 5000)) % 360
+        vel_h = wind + rng.gauss(0, 0.5)
+        if t >= ascent_time and alt <= LAUNCH[2] - 50:
+            # landed; still heard for a while
+            vel_v = vel_h = 0.0
+        lon += vel_h * dt * math.sin(math.radians(heading)) / (111320 * math.cos(math.radians(lat)))
+        lat += vel_h * dt * math.cos(math.radians(heading)) / 111320
+        temp = 15 - 6.5 * min(alt, 11000) / 1000 + (0.001 * (alt - 20000) if alt > 20000 else 0)
+        when = START + timedelta(seconds=t)
+        packet = {
+            "software_name": "radiosonde_auto_rx", "software_version": "1.5.5",
+            "uploader_callsign": RECEIVERS[0],
+            "time_received": (when + timedelta(seconds=0.8)).strftime('%Y-%m-%dT%H:%M:%S.%fZ'),
+            "datetime": when.strftime('%Y-%m-%dT%H:%M:%S.%fZ'),
+            "manufacturer": "Vaisala", "type": "RS41", "serial": serial, "subtype": "RS41-SGP",
+            "frame": frame, "lat": round(lat, 5), "lon": round(lon, 5), "alt": round(alt, 1),
+            "temp": round(temp + rng.gauss(0, 0.3), 1), "humidity": round(max(0.0, 80 - alt / 400 + rng.gauss(0, 2)), 1),
+            "vel_v": round(vel_v, 1), "vel_h": round(vel_h, 1), "heading": round(heading, 1),
+            "sats": rng.randint(6, 12), "batt": round(2.9 - t / duration * 0.3, 1), "frequency": 403.002,
+            "snr": round(rng.uniform(5, 25), 1), "rssi": round(rng.uniform(-110, -70), 1),
+        }
+        if rng.random() < missing:
+            del packet['temp'], packet['humidity']
+        if rng.random() < missing / 5:
+            packet['batt'] = None
+        copies = 1
+        if rng.random() < duplicates:
+            copies = rng.choice((2, 3))
+        for receiver in RECEIVERS[:min(copies, count - out)]:
+            copy = dict(packet, uploader_callsign=receiver,
+                        snr=round(rng.uniform(5, 25), 1), rssi=round(rng.uniform(-110, -70), 1))
+            heapq.heappush(pending, (out + rng.uniform(0, jitter), out, copy))
+            out += 1
+        # release what can no longer be overtaken by later packets
+        while pending and pending[0][0] < out - jitter:
+            yield heapq.heappop(pending)[2]
+        frame += 1
+    while pending:
+        yield heapq.heappop(pending)[2]
+
+
+# Writes a flight of 'count' packets to 'path' as SondeHub json (gzip'd with 'gz');
+# the other arguments go to packets().  Returns the number of packets written.
+def write_flight(path, count, gz=False, **options):
+    opener = gzip.open if gz else open
+    written = 0
+    with opener(path, 'wt') as f:
+        f.write('[')
+        for packet in packets(count, **options):
+            if written:
+                f.write(', ')
+            f.write(json.dumps(packet))
+            written += 1
+        f.write(']')
+    return written
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Write a synthetic SondeHub flight')
+    ap.add_argument('path')
+    ap.add_argument('--packets', type=int, default=100000)
+    ap.add_argument('--serial', default='V0000001')
+    ap.add_argument('--duplicates', type=float, default=0.3, help='share of frames heard by 2-3 stations')
+    ap.add_argument('--missing', type=float, default=0.05, help='share of packets without temp/humidity')
+    ap.add_argument('--seed', type=int, default=1)
+    ap.add_argument('--gzip', action='store_true')
+    args = ap.parse_args()
+    written = write_flight(args.path, args.packets, args.gzip, serial=args.serial,
+                           duplicates=args.duplicates, missing=args.missing, seed=args.seed)
+    print('Wrote {0} packets to {1}'.format(written, args.path))
+
+
+if __name__ == '__main__':
+    main()
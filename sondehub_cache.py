@@ -0,0 +1,290 @@
+#####################################################################################
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License v3 as published by
+# the Free Software Foundation.
+#####################################################################################
+# On-disk cache of SondeHub API responses, keyed by radiosonde serial.
+#
+# Each entry is the raw response body, kept compressed (gzip'd responses are stored as
+# they came in; plain json is gzip'd on the way to disk), plus a small .meta json file
+# holding the ETag / Last-Modified validators, when it was fetched and last used, and
+# the time of the newest packet.  Storing a response doesn't parse it: the newest packet
+# time is picked out of the json as the conversion reads it back from the cache (see
+# open()), so a download is parsed once, on its way to the kml.
+#
+#  * Online, a cached sonde is revalidated with If-None-Match / If-Modified-Since; a
+#    '304 Not Modified' answer re-uses the cached body without downloading it again.
+#  * A sonde whose newest packet is older than 'immutable_after' seconds (6 hours by
+#    default) has landed; its data will not change, so it is never asked for again.
+#  * Offline mode only ever reads the cache.
+#  * The cache is capped at 'max_bytes'; least recently used entries are evicted.
+#
+# Environment:
+#   SONDEHUB_CACHE_DIR   cache directory (default ~/.cache/sondehub_json2kml)
+#   SONDEHUB_CACHE       set to 0/off/no to turn the cache off
+#   SONDEHUB_CACHE_MB    size cap in MB (default 500)
+#   SONDEHUB_OFFLINE     set to 1 to never touch the network
+
+import gzip
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+
+import sondehub_stream
+import sondehub_time
+
+DEFAULT_MAX_BYTES = 500 * 1000 * 1000
+DEFAULT_IMMUTABLE_AFTER = 6 * 3600
+
+_SAFE_NAME = re.compile(r'[^A-Za-z0-9_.-]')
+
+# A packet's 'datetime', found in the json text as it streams past without parsing it
+_DATETIME = re.compile(rb'"datetime"\s*:\s*"([^"\\]*)"')
+# bytes of each chunk searched again with the next, so a 'datetime' cut in two is found
+_OVERLAP = 128
+
+
+# A cached sonde: 'path' is the raw body, the rest comes from the .meta file
+class Entry:
+    def __init__(self, serial, path, meta):
+        self.serial = serial
+        self.path = path
+        self.meta = meta
+
+    @property
+    def immutable(self):
+        return self.meta.get('immutable', False)
+
+    # True when the server had no packets for the sonde ('[]')
+    @property
+    def empty(self):
+        # entries written by older versions counted the packets instead
+        return self.meta.get('empty', not self.meta.get('packets'))
+
+
+class Cache:
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES,
+                 immutable_after=DEFAULT_IMMUTABLE_AFTER, offline=False):
+        self.directory = directory or default_directory()
+        self.max_bytes = max_bytes
+        self.immutable_after = immutable_after
+        self.offline = offline
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    # Returns the Entry for 'serial', or None when it isn't cached
+    def lookup(self, serial):
+        path, meta_path = self._paths(serial)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not os.path.exists(path):
+            return None
+        return Entry(serial, path, meta)
+
+    # True when 'entry' can be used without asking the server
+    def usable_offline(self, entry):
+        return entry is not None and (self.offline or entry.immutable)
+
+    # Conditional request headers that let the server answer '304 Not Modified'
+    def request_headers(self, entry):
+        headers = {}
+        if entry is not None:
+            if entry.meta.get('etag'):
+                headers['If-None-Match'] = entry.meta['etag']
+            if entry.meta.get('last_modified'):
+                headers['If-Modified-Since'] = entry.meta['last_modified']
+        return headers
+
+    # Copies a response body ('body' is a binary stream) into the cache together with
+    # its validators; 'headers' is any mapping with a get() method.  Returns the Entry.
+    # 'immutable' marks data that will never change (archived flights).
+    def store(self, serial, body, headers=None, url=None, immutable=False):
+        path, meta_path = self._paths(serial)
+        body = sondehub_stream.buffered(body)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                if sondehub_stream.is_compressed(body):
+                    shutil.copyfileobj(body, out)
+                else:
+                    with gzip.GzipFile(fileobj=out, mode='wb', compresslevel=6) as gz:
+                        shutil.copyfileobj(body, gz)
+            # the API answers '[]' for flights moved to the archive; that's all the
+            # callers need to know before converting, and the first bytes tell
+            with sondehub_stream.decompress(open(tmp, 'rb')) as jsonFile:
+                empty = b''.join(jsonFile.read(64).split()) in (b'', b'[]')
+            os.replace(tmp, path)
+        except BaseException:
+            os.remove(tmp)
+            raise
+        headers = headers or {}
+        now = time.time()
+        meta = {
+            'serial': serial,
+            'url': url,
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'fetched': now,
+            'used': now,
+            'size': os.path.getsize(path),
+            'empty': empty,
+            # filled in by open() once the body has been read through
+            'last_packet': None,
+            'immutable': immutable,
+        }
+        self._write_meta(meta_path, meta)
+        self.evict(keep=serial)
+        return Entry(serial, path, meta)
+
+    # Records a '304 Not Modified' (or an offline hit) for 'entry'; returns the entry
+    def revalidated(self, entry, checked=True):
+        now = time.time()
+        entry.meta['used'] = now
+        if checked:
+            entry.meta['fetched'] = now
+            entry.meta['immutable'] = entry.immutable or self._landed(entry.meta, now)
+        self._write_meta(self._paths(entry.serial)[1], entry.meta)
+        self.evict(keep=entry.serial)
+        return entry
+
+    # Opens the cached body as a decompressed json stream.  While the newest packet time
+    # of the entry isn't known yet, it is picked out of the json as the stream is read
+    # and recorded once it has been read to the end.
+    def open(self, entry):
+        jsonFile = sondehub_stream.decompress(open(entry.path, 'rb'))
+        if entry.meta.get('last_packet') is not None or entry.empty:
+            return jsonFile
+        return io.BufferedReader(_Recording(jsonFile, self, entry))
+
+    # Records 'last_packet' (epoch seconds) for 'entry', whose body has been read through,
+    # and whether the sonde has landed by then.  Skipped when the body has been replaced
+    # in the meantime.
+    def _record(self, entry, last_packet):
+        current = self.lookup(entry.serial)
+        if current is None or current.meta.get('fetched') != entry.meta.get('fetched'):
+            return
+        meta = current.meta
+        meta['last_packet'] = last_packet
+        meta['immutable'] = meta.get('immutable', False) or self._landed(meta, time.time())
+        self._write_meta(self._paths(entry.serial)[1], meta)
+        entry.meta.update(last_packet=last_packet, immutable=meta['immutable'])
+
+    # Removes least recently used entries until the cache fits in max_bytes; the entry
+    # for serial 'keep' (the one just stored) is never removed
+    def evict(self, keep=None):
+        keep = _SAFE_NAME.sub('_', keep) if keep else None
+        with self._lock:
+            entries = []
+            total = 0
+            for name in os.listdir(self.directory):
+                if not name.endswith('.meta'):
+                    continue
+                try:
+                    with open(os.path.join(self.directory, name)) as f:
+                        meta = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                entries.append((meta.get('used', 0), name[:-len('.meta')], meta.get('size', 0)))
+                total += meta.get('size', 0)
+            for used, stem, size in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                if stem == keep:
+                    continue
+                for suffix in ('.raw', '.meta'):
+                    try:
+                        os.remove(os.path.join(self.directory, stem + suffix))
+                    except OSError:
+                        pass
+                total -= size
+
+    def _landed(self, meta, now):
+        return meta.get('last_packet') is not None and now - meta['last_packet'] > self.immutable_after
+
+    def _paths(self, serial):
+        stem = os.path.join(self.directory, _SAFE_NAME.sub('_', serial))
+        return stem + '.raw', stem + '.meta'
+
+    def _write_meta(self, meta_path, meta):
+        tmp = meta_path + '.tmp-' + str(threading.get_ident())
+        with open(tmp, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp, meta_path)
+
+
+# Cache directory from SONDEHUB_CACHE_DIR or the user's cache directory
+def default_directory():
+    directory = os.environ.get('SONDEHUB_CACHE_DIR')
+    if directory:
+        return directory
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'sondehub_json2kml')
+
+
+# Cache set up from the environment variables above, or None when it's turned off.
+# Arguments that aren't None override the environment.
+def from_environment(directory=None, offline=None, max_bytes=None):
+    if os.environ.get('SONDEHUB_CACHE', '').lower() in ('0', 'off', 'no', 'false'):
+        return None
+    if offline is None:
+        offline = os.environ.get('SONDEHUB_OFFLINE', '').lower() in ('1', 'on', 'yes', 'true')
+    if max_bytes is None:
+        max_bytes = DEFAULT_MAX_BYTES
+        if os.environ.get('SONDEHUB_CACHE_MB'):
+            max_bytes = int(float(os.environ['SONDEHUB_CACHE_MB']) * 1000 * 1000)
+    return Cache(directory, max_bytes=max_bytes, offline=offline)
+
+
+# A cached body being read for a conversion: passes the decompressed json through and
+# keeps the newest packet 'datetime' seen, compared as times ('...:05Z' and '...:05.1Z'
+# both appear in one flight, and don't sort as strings).  Reaching the end records it.
+class _Recording(io.RawIOBase):
+    def __init__(self, reader, cache, entry):
+        self._reader = reader
+        self._cache = cache
+        self._entry = entry
+        self._tail = b''
+        self._newest = sondehub_time.MISSING
+        self._done = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        data = self._reader.read(len(b))
+        b[:len(data)] = data
+        if data:
+            self._scan(data)
+        else:
+            self._finish()
+        return len(data)
+
+    def _scan(self, data):
+        text = self._tail + data
+        found = [m.decode('ascii', 'replace') for m in _DATETIME.findall(text)]
+        if found:
+            newest = int(sondehub_time.parse_many(found).max())
+            if newest > self._newest:
+                self._newest = newest
+        self._tail = text[-_OVERLAP:]
+
+    def _finish(self):
+        if not self._done:
+            self._done = True
+            self._cache._record(self._entry, None if self._newest == sondehub_time.MISSING else self._newest / 1e6)
+
+    def close(self):
+        if not self.closed:
+            # the json reader stops at the closing ']'; what's left is whitespace at most
+            if not self._done and not self._reader.read(_OVERLAP).strip():
+                self._finish()
+            self._reader.close()
+        super().close()
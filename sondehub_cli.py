@@ -0,0 +1,395 @@
+#####################################################################################
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License v3 as published by
+# the Free Software Foundation.
+#####################################################################################
+# The SondeHub_json2kml_v3-2.py converter as an importable module.
+#
+# SondeHub_json2kml_v3-2.py only calls main() here.  Other programs can call
+# convert_source() to convert any number of flights in one process, without paying the
+# interpreter start and the imports again for each one:
+#
+#   import sondehub_cli
+#   for serial in serials:
+#       sondehub_cli.convert_source(serial, outdir='kml')
+#
+# Startup is kept lean for the thousands of short runs a batch job makes: modules only
+# some options need (de-duplication, level of detail, live watch, profiling, export,
+# saved flights, simplekml, the network and decompression modules) are imported where
+# they are first used, so a plain local file never loads urllib, zipfile, dateutil, csv
+# or tracemalloc.  See benchmarks/bench_startup.py.
+
+import os
+import sys
+
+import sondehub_columns
+import sondehub_convert
+import sondehub_profile
+import sondehub_simplify
+import sondehub_stream
+import sondehub_time
+
+# Defaults and choices of the options whose modules are only imported when the option
+# is given; they match sondehub_dedup.DEFAULT_WINDOW, sondehub_lod.DEFAULT_MAX_POINTS,
+# sondehub_live.DEFAULT_INTERVAL and sondehub_export.FORMATS
+DEFAULT_WINDOW = 300
+DEFAULT_LOD_POINTS = 500
+DEFAULT_WATCH_INTERVAL = 30
+EXPORT_FORMATS = ('csv', 'parquet', 'feather')
+
+# Options a --watch can't honour
+WATCH_IGNORES = ('simplify', 'points', 'tolerance', 'writer', 'kmz', 'lod', 'lod_points', 'window',
+                 'start', 'end', 'last', 'phase', 'min_alt', 'max_alt', 'bbox', 'save_columns', 'export',
+                 'merge', 'profile', 'profile_file')
+
+
+def parser():
+    import argparse
+    ap = argparse.ArgumentParser(description='Convert SondeHub radiosonde json to kml')
+    ap.add_argument('inputFile', nargs='?', help='radiosonde serial, json file, directory or tarball')
+    add_arguments(ap)
+    ap.add_argument('--merge', metavar='FILE',
+                    help='write every sonde into this one kml instead, each in a folder of its own with its own track colour')
+    ap.add_argument('--watch', nargs='?', type=float, const=DEFAULT_WATCH_INTERVAL, metavar='SECONDS',
+                    help='follow a sonde in flight: poll for new packets every SECONDS (default {0}) and add them to the kml; '
+                         'open <serial>_live.kml in Google Earth'.format(DEFAULT_WATCH_INTERVAL))
+    ap.add_argument('--profile', nargs='?', const='text', choices=sondehub_profile.FORMATS,
+                    help='report time, traced memory and counts per stage (fetch, decompress, decode, filter, points, write) '
+                         'on stderr, as text or json; tracing memory slows the run down')
+    ap.add_argument('--profile-file', help='with --profile: write the report to this file instead')
+    return ap
+
+
+# Adds the options of the conversion itself (sampling, output, de-duplication, filters,
+# export) to the argparse parser 'ap'; v3-2, the batch and the pool converters share
+# them.  converter_options() reads them back.
+def add_arguments(ap):
+    ap.add_argument('--step', type=positive_int, default=50, help='keep every STEP-th packet (default 50)')
+    ap.add_argument('--simplify', choices=sondehub_simplify.METHODS,
+                    help='keep a shape-preserving subset instead: Visvalingam-Whyatt or Ramer-Douglas-Peucker')
+    ap.add_argument('--points', type=positive_int, help='with --simplify: number of points to keep (default packets/50)')
+    ap.add_argument('--tolerance', type=float, help='with --simplify: allowed error in metres')
+    ap.add_argument('--writer', choices=sondehub_convert.WRITERS, default='stream',
+                    help='kml backend (default stream, the fast one; both write the same kml)')
+    ap.add_argument('--kmz', action='store_true',
+                    help='write a compressed kmz (icon inside, values in a shared balloon) instead of a kml')
+    ap.add_argument('--lod', action='store_true',
+                    help='plot every packet, as an overview plus tiles loaded on zooming in (a directory, or with --kmz a kmz)')
+    ap.add_argument('--lod-points', type=positive_int, default=DEFAULT_LOD_POINTS,
+                    help='with --lod: most points per tile (default {0})'.format(DEFAULT_LOD_POINTS))
+    ap.add_argument('--dedup', action='store_true',
+                    help='put packets in time order and merge the copies uploaded by several stations')
+    ap.add_argument('--window', type=float, default=DEFAULT_WINDOW,
+                    help='with --dedup: reorder window in seconds of sonde time (default {0})'.format(DEFAULT_WINDOW))
+    ap.add_argument('--start', type=sonde_time, metavar='TIME',
+                    help='only plot packets from this sonde time on (ISO 8601, UTC unless given)')
+    ap.add_argument('--end', type=sonde_time, metavar='TIME', help='only plot packets up to this sonde time')
+    ap.add_argument('--last', type=float, metavar='MINUTES', help='only plot the last MINUTES before landing')
+    ap.add_argument('--phase', choices=('ascent', 'descent'), help='only plot the ascent (up to burst) or the descent')
+    ap.add_argument('--min-alt', type=float, metavar='METRES', help='only plot packets at or above this altitude')
+    ap.add_argument('--max-alt', type=float, metavar='METRES', help='only plot packets at or below this altitude')
+    # four values rather than one 'W,S,E,N': argparse takes '-3.6' for a number but
+    # '-3.6,40.3,...' for an option
+    ap.add_argument('--bbox', nargs=4, type=float, metavar=('W', 'S', 'E', 'N'),
+                    help='only plot packets inside this box (degrees west south east north), e.g. around the landing site')
+    ap.add_argument('--save-columns', action='store_true',
+                    help='also save each whole flight as <serial>.columns, binary columns that a later run can be '
+                         'given instead of the serial to plot it again without the json')
+    ap.add_argument('--export', action='append', choices=EXPORT_FORMATS, default=[],
+                    help='also write every packet, typed, to <serial>.csv/.parquet/.feather in the same pass '
+                         '(may be repeated; parquet and feather need pyarrow)')
+
+
+# --step/--points value -> int; argparse reports anything below 1 as a usage error
+def positive_int(text):
+    value = int(text)
+    if value < 1:
+        import argparse
+        raise argparse.ArgumentTypeError('must be a positive whole number, not {0}'.format(text))
+    return value
+
+
+# --start/--end value -> microseconds since the epoch
+def sonde_time(text):
+    micros = sondehub_time.parse(text)
+    if micros == sondehub_time.MISSING:
+        raise ValueError(text)
+    return micros
+
+
+# Reports the options add_arguments() (and parser()) added that don't go together as
+# usage errors of the argparse parser 'ap'; call it on the parsed command line 'args'
+def check_arguments(ap, args):
+    if args.bbox and args.bbox[1] > args.bbox[3]:
+        ap.error('--bbox: south ({1}) must not be greater than north ({3})'.format(*args.bbox))
+    if getattr(args, 'profile_file', None) and not args.profile:
+        ap.error('--profile-file needs --profile')
+    # a watch draws every 'step'th packet, de-duplicated, the way v3-2 does by default
+    if getattr(args, 'watch', None) is not None:
+        ignored = [name for name in WATCH_IGNORES if getattr(args, name, None) != ap.get_default(name)]
+        if ignored:
+            ap.error('--watch does not go with ' + ', '.join('--' + name.replace('_', '-') for name in ignored))
+
+
+# The sondehub_index.focus() filters given on the command line, as a dict (empty for none)
+def focus_options(args):
+    focus = {'start': args.start, 'end': args.end, 'last': args.last * 60 if args.last is not None else None,
+             'phase': args.phase, 'min_alt': args.min_alt, 'max_alt': args.max_alt,
+             'bbox': tuple(args.bbox) if args.bbox else None}
+    return {name: value for name, value in focus.items() if value is not None}
+
+
+# The convert_source() keyword arguments (bar 'outdir', 'merge' and 'profile') set by
+# the options add_arguments() added to the parsed command line 'args'
+def converter_options(args):
+    return dict(step=args.step, simplify=args.simplify, points=args.points, tolerance=args.tolerance,
+                writer=args.writer, kmz=args.kmz, lod=args.lod, lod_points=args.lod_points, dedup=args.dedup,
+                window=args.window, export=args.export, focus=focus_options(args), save_columns=args.save_columns)
+
+
+# Runs the converter with the command line 'argv' (default sys.argv[1:]); returns the
+# exit status
+def main(argv=None):
+    ap = parser()
+    args = ap.parse_args(argv)
+    check_arguments(ap, args)
+    if args.merge and (args.kmz or args.lod):
+        ap.error('--merge writes a plain kml; it can\'t be used with --kmz or --lod')
+    if args.inputFile and _is_saved(args.inputFile) and (args.dedup or args.save_columns):
+        ap.error('--dedup and --save-columns work on the json; a saved flight already holds the packets as saved')
+
+    # var 'inputFile' equals the first value read by argparse
+    inputFile = args.inputFile
+    # if the value is missing, print message and exit
+    if not inputFile:
+        print("Please enter a valid Radiosonde serial.")
+        return 1
+    print('Searching for radiosonde...')
+
+    # JSON Encoding is UTF-8. Change stdout to UTF-8 to prevent encoding error
+    # when calling print titles inside the loop
+    # (reconfigured in place, so main() can be called again in the same process)
+    reconfigure = getattr(sys.stdout, 'reconfigure', None)
+    if reconfigure:
+        reconfigure(encoding='utf-8')
+
+    # Change in v2 is this:  script navigates to the json directly using the radiosonde
+    # serial (https://api.v2.sondehub.org/sonde/<serial>).  A local file, a directory or a
+    # tarball works too; open_sources() yields one json stream per sonde.
+    print ('Found "'+inputFile+'"')
+
+    # --watch keeps the kml of a sonde in flight up to date until it lands; see sondehub_live.py
+    if args.watch is not None:
+        import sondehub_live
+        return sondehub_live.watch(inputFile, args.watch, args.step)
+
+    # --profile times each stage and counts what goes through it; see sondehub_profile.py
+    profile = None
+    if args.profile:
+        profile = sondehub_profile.Profile()
+        profile.install()
+    try:
+        convert_source(inputFile, merge=args.merge, profile=profile, **converter_options(args))
+    except OSError as e:
+        # the network failing (urllib's URLError and HTTPError are OSErrors), a serial
+        # missing from the cache in offline mode or an unwritable output: one line, not
+        # a traceback
+        print('Failed "{0}": {1}'.format(inputFile, getattr(e, 'reason', None) or e))
+        return 1
+    finally:
+        if profile:
+            profile.uninstall()
+    if profile:
+        if args.profile_file:
+            with open(args.profile_file, 'w') as f:
+                profile.report(f, args.profile)
+        else:
+            profile.report(sys.stderr, args.profile)
+    return 0
+
+
+# Converts every sonde in 'source' (a serial, json file, directory or tarball) to kml
+# in directory 'outdir', with the options of the command line; 'export' lists the
+# sondehub_export formats to write every packet to as well, and 'focus' holds the
+# sondehub_index.focus() filters (start, end, last, phase, min_alt, max_alt, bbox) to
+# plot only part of each flight.  With 'merge', a file name, all the sondes go into
+# that one kml (see sondehub_convert.Merged).  'save_columns' also saves each whole
+# flight as <serial>.columns (sondehub_flightcache.py); 'source' can be such a saved
+# flight, which is then memory-mapped instead of parsed.  Returns the paths written.
+# 'profile', a sondehub_profile.Profile, records the stages when given.
+def convert_source(source, outdir='', step=50, simplify=None, points=None, tolerance=None,
+                   writer='stream', kmz=False, lod=False, lod_points=DEFAULT_LOD_POINTS,
+                   dedup=False, window=DEFAULT_WINDOW, export=(), focus=None, merge=None,
+                   save_columns=False, profile=None):
+    converter = Converter(outdir, step, simplify, points, tolerance, writer, kmz, lod, lod_points,
+                          dedup, window, export, focus, merge, save_columns, profile)
+    try:
+        converter.convert_source(source)
+    finally:
+        converter.close()
+    return converter.written
+
+
+# The conversion behind convert_source(), in steps, for converters that get their
+# packets some other way (SondeHub_json2kml_batch.py downloads them in threads):
+#
+#   converter = sondehub_cli.Converter(outdir, step=10, merge='day.kml')
+#   data = converter.select(sondehub_stream.iter_packets(jsonFile), serial)
+#   converter.write(data)
+#   converter.close()
+#
+# The arguments are convert_source()'s; 'written' collects the paths written.
+class Converter:
+    def __init__(self, outdir='', step=50, simplify=None, points=None, tolerance=None,
+                 writer='stream', kmz=False, lod=False, lod_points=DEFAULT_LOD_POINTS,
+                 dedup=False, window=DEFAULT_WINDOW, export=(), focus=None, merge=None,
+                 save_columns=False, profile=None):
+        self.outdir = outdir
+        self.step = step
+        self.simplify = simplify
+        self.points = points
+        self.tolerance = tolerance
+        self.writer = writer
+        self.kmz = kmz
+        self.lod = lod
+        self.lod_points = lod_points
+        self.dedup = dedup
+        self.window = window
+        self.export = export
+        self.focus = focus
+        self.save_columns = save_columns
+        self.profile = profile or sondehub_profile.OFF
+        self.written = []
+        self.merged = sondehub_convert.Merged(os.path.join(outdir, merge)) if merge else None
+
+    # Converts every sonde in 'source'; returns the paths written for them
+    def convert_source(self, source):
+        profile = self.profile
+        first = len(self.written)
+        # Opens each source and streams the json packet by packet; only every 50th packet
+        # (step) is kept in var 'data' so memory stays small however long the flight is.
+        # The kml itself is built by sondehub_convert.convert(); see sondehub_convert.py
+        for name, jsonFile in profile.iterate(open_sources(source), 'fetch', 'sources'):
+            if jsonFile is None:
+                data = self.load(name)
+            else:
+                with profile.reader(jsonFile, 'decompress', 'json bytes') as jsonFile:
+                    data = self.select(profile.iterate(sondehub_stream.iter_packets(jsonFile), 'decode', 'packets seen'),
+                                       name)
+            if not data:
+                print ('No packets found in "'+name+'"')
+                continue
+            self.write(data)
+        return self.written[first:]
+
+    # The packets to plot (a sondehub_columns.Packets) out of 'packets', an iterable of
+    # the packet dicts of the flight read from 'name'
+    def select(self, packets, name):
+        profile = self.profile
+        # several ground stations upload the same frame; dedup keeps one of each, in time order
+        stats = {}
+        if self.dedup:
+            import sondehub_dedup
+            packets = sondehub_dedup.dedup(packets, self.window, stats=stats)
+        # every packet, not just the sampled ones, goes to the --export files on the way
+        exporter = None
+        if self.export:
+            import sondehub_export
+            exporter = sondehub_export.Exporter(self.export, self.outdir, profile=profile)
+            packets = exporter.tap(packets)
+        full = None
+        with profile.stage('filter'):
+            if self.focus or self.save_columns:
+                # the whole flight, as columns, to be saved or filtered
+                full = sondehub_columns.Packets.from_packets(packets)
+            elif self.lod:
+                # every packet; sondehub_lod splits them into tiles
+                data = sondehub_simplify.select(packets, 1)
+            else:
+                # With simplify the whole flight is read (into compact columns, see
+                # sondehub_columns.py) and simplified to the points that matter.
+                data = sondehub_simplify.select(packets, self.step, self.simplify, self.points, self.tolerance)
+        if exporter:
+            exporter.close()
+            self.written.extend(exporter.paths)
+        if stats:
+            profile.count('duplicates', stats['duplicates'])
+            profile.count('late', stats['late'])
+            print ('Merged {duplicates} duplicate packets; dropped {late} arriving too late'.format(**stats))
+        if full is not None:
+            if self.save_columns and len(full):
+                import sondehub_flightcache
+                path = sondehub_flightcache.path_for(full.string('serial', 0) or 'sonde', self.outdir)
+                print ('Saving file "'+path+'"')
+                with profile.stage('export'):
+                    self.written.append(sondehub_flightcache.save(full, path, name))
+            data = self._columns(full)
+        profile.count('packets kept', len(data))
+        return data
+
+    # select() for the flight saved in directory 'path' (sondehub_flightcache.py),
+    # memory-mapped: there is no json to decode
+    def load(self, path):
+        import sondehub_flightcache
+        profile = self.profile
+        with profile.stage('decode'):
+            full = sondehub_flightcache.load(path)
+        profile.count('packets seen', len(full))
+        if self.export:
+            import sondehub_export
+            exporter = sondehub_export.Exporter(self.export, self.outdir, profile=profile)
+            exporter.write(full)
+            exporter.close()
+            self.written.extend(exporter.paths)
+        data = self._columns(full)
+        profile.count('packets kept', len(data))
+        return data
+
+    # The packets to plot out of a whole flight held as columns
+    def _columns(self, full):
+        with self.profile.stage('filter'):
+            data = full
+            if self.focus:
+                # the whole flight, indexed by time and position; the filters pick
+                # out the part wanted, which is then sampled as usual
+                import sondehub_index
+                index = sondehub_index.FlightIndex(full)
+                print (index.summary())
+                data = index.data.take(sondehub_index.focus(index, **self.focus))
+            if not self.lod:
+                data = sondehub_simplify.select_columns(data, self.step, self.simplify, self.points, self.tolerance)
+        return data
+
+    # Writes the kml (kmz, lod tree) of 'data', the packets select() picked, or adds it
+    # to the merged kml
+    def write(self, data):
+        if self.merged:
+            self.merged.add(data, self.profile)
+        elif self.lod:
+            import sondehub_lod
+            with self.profile.stage('write'):
+                self.written.append(sondehub_lod.convert(data, self.outdir, kmz=self.kmz, max_points=self.lod_points))
+        else:
+            self.written.append(sondehub_convert.convert(data, self.outdir, writer=self.writer, kmz=self.kmz,
+                                                         profile=self.profile))
+
+    # Finishes the merged kml, if any
+    def close(self):
+        if self.merged and self.merged.path not in self.written:
+            self.merged.close()
+            self.written.append(self.merged.path)
+
+
+# sondehub_stream.open_sources(), plus (path, None) when 'source' is a saved flight
+def open_sources(source):
+    if _is_saved(source):
+        return iter([(source, None)])
+    return sondehub_stream.open_sources(source)
+
+
+# sondehub_flightcache.is_saved(), importing the module only for a directory
+def _is_saved(path):
+    if not os.path.isdir(path):
+        return False
+    import sondehub_flightcache
+    return sondehub_flightcache.is_saved(path)
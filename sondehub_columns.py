@@ -0,0 +1,169 @@
+#####################################################################################
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License v3 as published by
+# the Free Software Foundation.
+#####################################################################################
+# Columnar (NumPy) store for the packets of one radiosonde flight.
+#
+# A parsed SondeHub packet is a dict of ~25 keys, well over a kilobyte of Python
+# objects, and the converter used to look every value up one dict at a time.  Packets
+# turns a stream of packets into one array per field, built once at ingest:
+#
+#   floats   lon, lat, alt, temp, humidity, vel_h, vel_v, heading, batt, frequency as
+#            float64, NaN where a packet has no (numeric) value
+#   ints     per float field, True where the json held an integer (so '3' isn't
+#            written back out as '3.0')
+#   nulls    per float field, True where the json held the key with a null value
+#            (v3 tells those from packets without the key)
+#   time     'datetime' as int64 microseconds since the epoch (UTC), MISSING_TIME
+#            where it is missing or unreadable; parsed in vectorised batches by
+#            sondehub_time.parse_many()
+#   codes    serial, manufacturer and subtype as int32 indices into one interned
+#            string table ('strings'); -1 where missing
+#
+# That is about 110 bytes per packet, and NA handling, rounding and filtering become
+# array operations.
+#
+# Usage:
+#
+#   cols = sondehub_columns.Packets.from_packets(sondehub_stream.iter_packets(jsonFile))
+#   ok = cols.present('temp') & (cols['alt'] > 10000)
+#   high = cols.take(ok)
+
+import array
+
+import numpy as np
+
+import sondehub_time
+
+FLOAT_FIELDS = ('lon', 'lat', 'alt', 'temp', 'humidity', 'vel_h', 'vel_v', 'heading', 'batt', 'frequency')
+STRING_FIELDS = ('serial', 'manufacturer', 'subtype')
+
+MISSING_TIME = sondehub_time.MISSING
+
+# 'datetime' strings are parsed this many at a time
+TIME_BATCH = 8192
+
+_NAN = float('nan')
+
+
+class Packets:
+    def __init__(self, floats, ints, time, codes, strings, nulls):
+        self.floats = floats
+        self.ints = ints
+        self.nulls = nulls
+        self.time = time
+        self.codes = codes
+        self.strings = strings
+
+    def __len__(self):
+        return len(self.time)
+
+    # cols['alt'] is the float64 column for 'alt'
+    def __getitem__(self, name):
+        return self.floats[name]
+
+    # Boolean mask of the packets that have a value for 'name'
+    def present(self, name):
+        if name == 'datetime':
+            return self.time != MISSING_TIME
+        if name in self.codes:
+            return self.codes[name] >= 0
+        return ~np.isnan(self.floats[name])
+
+    # Boolean mask of the packets whose json has the key 'name' (float fields), even
+    # if only with a null value
+    def has(self, name):
+        return self.present(name) | self.nulls[name]
+
+    # The string field 'name' of packet 'i', or None
+    def string(self, name, i):
+        code = self.codes[name][i]
+        return self.strings[code] if code >= 0 else None
+
+    # Column 'name' as a list of Python numbers, ints where the json had ints;
+    # 'values' overrides the column (e.g. with rounded values)
+    def values(self, name, values=None):
+        out = (self.floats[name] if values is None else values).tolist()
+        for i in np.flatnonzero(self.ints[name]).tolist():
+            out[i] = int(out[i])
+        return out
+
+    # New Packets holding the rows picked by 'index' (a mask, slice or index array)
+    def take(self, index):
+        return Packets({k: v[index] for k, v in self.floats.items()},
+                       {k: v[index] for k, v in self.ints.items()},
+                       self.time[index],
+                       {k: v[index] for k, v in self.codes.items()},
+                       self.strings,
+                       {k: v[index] for k, v in self.nulls.items()})
+
+    # Builds the columns from an iterable of packet dicts in a single pass
+    @classmethod
+    def from_packets(cls, packets):
+        floats = {name: array.array('d') for name in FLOAT_FIELDS}
+        ints = {name: array.array('b') for name in FLOAT_FIELDS}
+        time = array.array('q')
+        codes = {name: array.array('i') for name in STRING_FIELDS}
+        strings = []
+        interned = {}
+        pending = []
+        for packet in packets:
+            if not isinstance(packet, dict):
+                continue
+            for name in FLOAT_FIELDS:
+                value = packet.get(name)
+                kind = type(value)
+                if kind is float:
+                    floats[name].append(value)
+                    ints[name].append(0)
+                elif kind is int:
+                    floats[name].append(value)
+                    ints[name].append(1)
+                else:
+                    floats[name].append(_NAN)
+                    # 2: null, told apart below
+                    ints[name].append(2 if value is None and name in packet else 0)
+            for name in STRING_FIELDS:
+                value = packet.get(name)
+                if value is None:
+                    codes[name].append(-1)
+                    continue
+                value = str(value)
+                code = interned.get(value)
+                if code is None:
+                    code = interned[value] = len(strings)
+                    strings.append(value)
+                codes[name].append(code)
+            pending.append(packet.get('datetime'))
+            if len(pending) >= TIME_BATCH:
+                time.frombytes(sondehub_time.parse_many(pending).tobytes())
+                pending = []
+        if pending:
+            time.frombytes(sondehub_time.parse_many(pending).tobytes())
+        ints = {k: _column(v, np.int8) for k, v in ints.items()}
+        return cls({k: _column(v, np.float64) for k, v in floats.items()},
+                   {k: v == 1 for k, v in ints.items()},
+                   _column(time, np.int64),
+                   {k: _column(v, np.int32) for k, v in codes.items()},
+                   strings,
+                   {k: v == 2 for k, v in ints.items()})
+
+
+# array.array -> NumPy array without copying
+def _column(values, dtype):
+    if not len(values):
+        return np.empty(0, dtype=dtype)
+    return np.frombuffer(values, dtype=dtype)
+
+
+# Vectorised round() that matches Python's round() digit for digit.  np.round scales
+# by 10**ndigits first, which can tip values sitting next to a .5 the other way, so
+# those few are redone with round().
+def py_round(values, ndigits=0):
+    rounded = np.round(values, ndigits)
+    scaled = values * 10.0 ** ndigits
+    near_half = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    for i in np.flatnonzero(near_half).tolist():
+        rounded[i] = round(float(values[i]), ndigits)
+    return rounded
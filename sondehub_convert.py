@@ -0,0 +1,325 @@
+#####################################################################################
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License v3 as published by
+# the Free Software Foundation.
+#####################################################################################
+# The radiosonde json -> kml conversion, shared by SondeHub_json2kml_v3.py,
+# SondeHub_json2kml_v3-2.py and the batch and pool converters.  What the points show
+# is a Schema (V32, the v3-2 description box, or V3); its fields are worked out a
+# whole column at a time, in one pass that also gives the track.
+#
+# Usage from a script:
+#
+#   import sondehub_stream, sondehub_simplify, sondehub_convert
+#   with sondehub_stream.open_source(inputFile) as jsonFile:
+#       data = sondehub_simplify.select(sondehub_stream.iter_packets(jsonFile), 50)
+#   sondehub_convert.convert(data)
+#
+#   with sondehub_convert.Merged('launches.kml') as merged:
+#       for data in flights:
+#           merged.add(data)
+
+import os
+
+import numpy as np
+
+import sondehub_columns
+import sondehub_kmlwriter
+import sondehub_profile
+import sondehub_time
+
+# 'simplekml' builds the kml as simplekml objects; 'stream' writes the same bytes
+# directly with sondehub_kmlwriter, using far less memory and time
+WRITERS = ('simplekml', 'stream')
+
+ICON_HREF = 'http://maps.google.com/mapfiles/kml/pal4/icon30.png'
+
+# Custom Description box in Google Earth.  The URI for the icon does not work properly but hope it gets fixed (may see about hosting it on my GitHub page.)
+# KML will render html for formmatting within the Description box
+DESCRIPTION = "<b>{0}</b><br/><br/><u>Make: </u>{10}<br/><u>Model:</u> {11}<br/>Sonde Time:<br/>{1}<br/>TX freq: {2} MHz<br/><br/>Altitude: {6} m<br/>Heading: {7} deg<br/>Horizontal Velocity: {8} m/s<br/>Vertical Velocity: {9} m/s<br/><br/><b>WX Metrics</b><br/>Tempurature: {3}C <br/>Humidity: {4}% <br/>Battery: {5} VDC<br/>"
+
+# Names of the DESCRIPTION fields, as the kmz carries them in each point's
+# <ExtendedData>; the serial (None) is the same for every point and goes in the balloon
+FIELDS = (None, 'time', 'freq', 'temp', 'humidity', 'batt', 'alt', 'heading', 'vel_h', 'vel_v', 'make', 'model')
+
+# The v3 description box: the wx values as the json has them
+V3_DESCRIPTION = "<b>{0}</b><br/>TX freq: {1} MHz<br/><br/>Tempurature: {2}C <br/>Humidity: {3}% <br/>Battery: {4} VDC<br/><br/>Heading: {5:.0f} Deg<br/>Horizontal Velocity: {6:.1f} m/s<br/>Vertical Velocity: {7:.1f} m/s"
+
+
+class Schema:
+    # What goes into a point: 'description' is the str.format() template of its
+    # description box and 'fields' gives, in order, the value of each of its fields as
+    # (name, kind, column, arg): the name the kmz carries it under (None for the
+    # serial), how it is worked out of the sondehub_columns column (one of KINDS) and
+    # the kind's argument.  A point is drawn for every packet with a position, all of
+    # the columns 'required' and the keys 'keys' (which may be null); its altitude is
+    # rounded to 'alt_digits' unless None.
+    def __init__(self, description, fields, required, keys=(), alt_digits=None):
+        for name, kind, column, arg in fields:
+            if kind not in KINDS:
+                raise ValueError('Unknown field kind "{0}"; use one of {1}'.format(kind, ', '.join(KINDS)))
+        self.description = description
+        self.fields = fields
+        self.names = tuple(name for name, kind, column, arg in fields)
+        self.required = tuple(required)
+        self.keys = tuple(keys)
+        self.alt_digits = alt_digits
+        # the extraction, compiled once: a function per field
+        self._extract = [(KINDS[kind], column, arg) for name, kind, column, arg in fields]
+
+    # The track and the points of 'data' in one pass over its columns: a list of
+    # (lon, lat, alt) tuples for the linestring, and ((lon, lat, alt), values) for each
+    # point to draw.  'escape', when given, is applied to every string value (once per
+    # distinct string where it can).
+    def extract(self, data, title, escape=None):
+        track = data.take(data.present('lon') & data.present('lat') & data.present('alt'))
+        line = list(zip(track.values('lon'), track.values('lat'), track.values('alt')))
+        return line, self.points(track, title, escape)
+
+    # ((lon, lat, alt), values) for each point of 'data' to draw
+    def points(self, data, title, escape=None):
+        escape = escape or _unescaped
+        ok = data.present('lon') & data.present('lat') & data.present('alt')
+        for column in self.required:
+            ok &= data.present(column)
+        for column in self.keys:
+            ok &= data.has(column)
+        wx = data.take(ok)
+        alt = wx['alt'] if self.alt_digits is None else sondehub_columns.py_round(wx['alt'], self.alt_digits)
+        coords = zip(wx.values('lon'), wx.values('lat'), wx.values('alt', alt))
+        columns = [extract(wx, column, arg, title, escape) for extract, column, arg in self._extract]
+        return zip(coords, zip(*columns)) if columns else ((coord, ()) for coord in coords)
+
+
+# Converts the selected packets of one radiosonde (a sondehub_columns.Packets in var
+# 'data') into <serial>.kml, written to directory 'outdir' by the backend 'writer'
+# (one of WRITERS).  With 'kmz' a compressed <serial>.kmz is written instead, with the
+# icon inside and the description box as a shared balloon template ('writer' doesn't
+# apply).  'schema' sets what the points show (default V32, the v3-2 description box).
+# Returns the path of the kml/kmz.  'profile', a sondehub_profile.Profile, gets the
+# time spent on the points and on writing, and the points drawn and skipped.
+def convert(data, outdir='', writer='stream', kmz=False, profile=None, schema=None):
+    if writer not in WRITERS:
+        raise ValueError('Unknown kml writer "{0}"; use one of {1}'.format(writer, ', '.join(WRITERS)))
+    profile = profile or sondehub_profile.OFF
+    with profile.stage('write'):
+        outputFile = _convert(data, outdir, writer, kmz, profile, schema or V32)
+    return outputFile
+
+
+def _convert(data, outdir, writer, kmz, profile, schema):
+    # Grabs the serial from the first record in json file for var title
+    title = data.string('serial', 0)
+
+    # one pass over the sampled records gives both the linestring (every record with a
+    # lon, lat and alt; array 'line' holds (lon, lat, alt) tuples) and the points.  The
+    # stream writer takes the values escaped, which is done per column.
+    escaped = writer == 'stream' and not kmz
+    line, points = _extract(data, title, schema, escaped, profile)
+
+    outputFile = os.path.join(outdir, title + '.' + ('kmz' if kmz else 'kml'))
+    print ('Saving file "'+outputFile+'"')
+    if kmz:
+        with sondehub_kmlwriter.KmzWriter(outputFile, title, schema.description, schema.names) as kml:
+            kml.linestring(line)
+            for coord, values in points:
+                kml.point(coord, values)
+        return outputFile
+    if writer == 'stream':
+        with sondehub_kmlwriter.KmlWriter(outputFile, title, ICON_HREF, schema.description) as kml:
+            kml.linestring(line)
+            for coord, values in points:
+                kml.point(coord, values, escaped=True)
+        return outputFile
+
+    # invoke simplekml; imported here as the other writers don't need it
+    import simplekml
+    # simplekml numbers its objects from one counter for the whole process; restart it so
+    # each flight gets the ids a fresh run gives it (and the stream writer writes), however
+    # many flights were converted before
+    simplekml.base.Kmlable._globalid = 0
+    kml = simplekml.Kml()
+    style = simplekml.Style()
+    style.iconstyle.icon.href = ICON_HREF
+
+    # Names document with var 'title'
+    kml.document.name = title
+
+    # Create a new simplekml linestring, naming it with var 'title'
+    linestring = kml.newlinestring(name=title)
+    # put array 'line' into simplekml var 'coords'
+    linestring.coords = line
+    # Set simplekml altitude mode to be relative to ground
+    linestring.altitudemode = simplekml.AltitudeMode.absolute
+    # Extrude linestring to the ground
+    linestring.extrude = 1
+    # Set simplekml linestring color to red
+    linestring.style.linestyle.color = simplekml.Color.red
+    # Set simplekml linestring width to 10 pixels
+    linestring.style.linestyle.width = 5
+
+    for coord, values in points:
+        # Creates points that correspond to the linestring above; wx data is captured and displayed
+        # Makes for a long kml file and kinda klugie.
+        pnt = kml.newpoint()
+        pnt.snippet.content = "{0} WX Readings".format(title)
+        pnt.coords = [coord]
+        pnt.altitudemode = simplekml.AltitudeMode.absolute
+        pnt.description = schema.description.format(*values)
+        pnt.style = style
+
+    kml.save(outputFile)
+    return outputFile
+
+
+# The track and the points of 'data' as 'schema' has them, profiled
+def _extract(data, title, schema, escaped, profile):
+    with profile.stage('points'):
+        line, points = schema.extract(data, title, sondehub_kmlwriter.escape if escaped else None)
+    profile.count('track points', len(line))
+    return line, _counted(profile.iterate(points, 'points', 'points'), len(data), profile)
+
+
+class Merged:
+    # Several radiosondes in the one kml 'path' (the launch board of a station): each
+    # flight goes in a <Folder> of its own as it is added, the styles are written once
+    # and the tracks take the colours of sondehub_kmlwriter.PALETTE in turn.  'name'
+    # names the document (default the file name); 'schema' is as for convert().
+    def __init__(self, path, name=None, schema=None):
+        self.path = path
+        self.schema = schema or V32
+        print ('Saving file "'+path+'"')
+        self._kml = sondehub_kmlwriter.MergedKmlWriter(
+            path, name or os.path.splitext(os.path.basename(path))[0], ICON_HREF, self.schema.description)
+
+    # Adds the selected packets of one radiosonde (a sondehub_columns.Packets), as
+    # convert() would write them, in a folder named after the serial.  'profile' is as
+    # for convert().
+    def add(self, data, profile=None):
+        profile = profile or sondehub_profile.OFF
+        with profile.stage('write'):
+            title = data.string('serial', 0)
+            line, points = _extract(data, title, self.schema, True, profile)
+            print ('Adding "'+title+'"')
+            self._kml.folder(title)
+            self._kml.linestring(line)
+            for coord, values in points:
+                self._kml.point(coord, values, escaped=True)
+
+    @property
+    def flights(self):
+        return self._kml.flights
+
+    def close(self):
+        self._kml.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# Passes 'points' on, then counts the packets of the 'kept' that didn't make a point
+def _counted(points, kept, profile):
+    drawn = 0
+    for point in points:
+        drawn += 1
+        yield point
+    profile.count('packets skipped', kept - drawn)
+
+
+#Points Section; additional information based on rx'd wx readings from the sonde.
+# Yields ((lon, lat, alt), description values) for each point of 'data' to draw, as
+# 'schema' has it (default V32, the v3-2 description box)
+def wx_points(data, title, schema=None):
+    return (schema or V32).points(data, title)
+
+
+def _unescaped(text):
+    return text
+
+
+# The field kinds of a Schema, each a function (data, column, arg, title, escape)
+# returning the field's values for every packet of 'data'
+
+# The sonde's serial
+def _title(data, column, arg, title, escape):
+    return [escape(title)] * len(data)
+
+
+# GPS time from radiosonde, made more readable ('YYYY-MM-DD HH:MM:SS UTC', nothing to escape)
+def _time(data, column, arg, title, escape):
+    return sondehub_time.format_many(data.time)
+
+
+# The value as the json had it
+def _value(data, column, arg, title, escape):
+    return data.values(column)
+
+
+# The value as the json had it, "None" where it is null (as v3 printed it)
+def _raw(data, column, arg, title, escape):
+    values = data.values(column)
+    for i in np.flatnonzero(np.isnan(data[column])).tolist():
+        values[i] = "None"
+    return values
+
+
+# round(value, arg)
+def _round(data, column, arg, title, escape):
+    return data.values(column, sondehub_columns.py_round(data[column], arg))
+
+
+# Column rounded like round(value, arg) (arg None: to a whole number), "NA" where the
+# value is missing or zero
+def _rounded(data, column, arg, title, escape):
+    values = data[column]
+    if arg is None:
+        out = [int(v) for v in sondehub_columns.py_round(np.nan_to_num(values)).tolist()]
+    else:
+        out = data.values(column, sondehub_columns.py_round(values, arg))
+    for i in np.flatnonzero(np.isnan(values) | (values == 0)).tolist():
+        out[i] = "NA"
+    return out
+
+
+# String column with "NA" where it is missing or empty
+def _label(data, column, arg, title, escape):
+    strings = [escape(s) if s else "NA" for s in data.strings] + ["NA"]
+    # code -1 (missing) picks the trailing "NA"
+    return [strings[code] for code in data.codes[column].tolist()]
+
+
+KINDS = {'title': _title, 'time': _time, 'value': _value, 'raw': _raw, 'round': _round, 'rounded': _rounded, 'label': _label}
+
+# The v3-2 points: DESCRIPTION filled in with rounded values and "NA" for the missing
+# ones; a point needs a position and a readable GPS time, and the battery voltage and
+# tx freq keys (printed "None" when null, as v3-2 always did)
+V32 = Schema(DESCRIPTION,
+             ((None, 'title', 'serial', None),
+              ('time', 'time', 'datetime', None),
+              ('freq', 'raw', 'frequency', None), # tx freq of the sonde
+              ('temp', 'rounded', 'temp', 1), # temperature
+              ('humidity', 'rounded', 'humidity', 1), # humidity
+              ('batt', 'raw', 'batt', None), # battery voltage
+              ('alt', 'round', 'alt', 1), # altitude
+              ('heading', 'rounded', 'heading', None), # direction of travel
+              ('vel_h', 'rounded', 'vel_h', 1), # horizontal velocity of the radiosonde (+/-)
+              ('vel_v', 'rounded', 'vel_v', 1), # vertical velocity of the radiosonde (+/-)
+              ('make', 'label', 'manufacturer', None), # make of radioonde
+              ('model', 'label', 'subtype', None)), # model of radiosonde
+             required=('datetime',), keys=('batt', 'frequency'), alt_digits=1)
+
+# The v3 points: V3_DESCRIPTION with the values as they are, "None" for the null ones;
+# a point needs a position, heading and velocities, and the keys of the rest
+V3 = Schema(V3_DESCRIPTION,
+            ((None, 'title', 'serial', None),
+             ('freq', 'raw', 'frequency', None),
+             ('temp', 'raw', 'temp', None),
+             ('humidity', 'raw', 'humidity', None),
+             ('batt', 'raw', 'batt', None),
+             ('heading', 'value', 'heading', None), # direction sonde is moving
+             ('vel_h', 'value', 'vel_h', None), # horizontal speed of the sonde (+/-)
+             ('vel_v', 'value', 'vel_v', None)), # vertical speed of the sonde (+/-)
+            required=('heading', 'vel_h', 'vel_v'), keys=('frequency', 'temp', 'humidity', 'batt'))
@@ -0,0 +1,108 @@
+#####################################################################################
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License v3 as published by
+# the Free Software Foundation.
+#####################################################################################
+# De-duplication and time-ordering of SondeHub packets.
+#
+# Every ground station in range uploads the frames it hears, so the API list holds the
+# same frame several times, and not in time order; sampling every 50th packet of that
+# picks arbitrary copies and can draw zig-zags.  dedup() sits between the parser and
+# the sampling:
+#
+#  * packets are put in sonde time ('datetime') order through a sliding reorder window:
+#    a packet is passed on once the stream has moved 'window' seconds of sonde time past
+#    it (or 'max_buffered' packets are waiting), so memory stays bounded however long
+#    the flight is;
+#  * copies of a frame (same serial and frame number, or datetime when there is no
+#    frame number) are collapsed into the first one; its 'uploaders' list then holds the
+#    receiver fields (callsign, snr, rssi, ...) of every station that heard it, and
+#    telemetry fields the first copy lacked are filled in from the others;
+#  * a packet that turns up after the window has already moved past its time is dropped
+#    (counted as 'late'); packets without a readable time are passed straight on.
+#
+# Usage:
+#
+#   stats = {}
+#   packets = sondehub_dedup.dedup(sondehub_stream.iter_packets(jsonFile), stats=stats)
+#   data = sondehub_simplify.select(packets, 50)
+
+import collections
+import heapq
+
+import sondehub_time
+
+DEFAULT_WINDOW = 300
+DEFAULT_MAX_BUFFERED = 50000
+
+# per-receiver fields, gathered into 'uploaders' when copies are merged
+RECEIVER_FIELDS = ('uploader_callsign', 'time_received', 'snr', 'rssi', 'uploader_position',
+                   'uploader_alt', 'uploader_antenna', 'software_name', 'software_version')
+
+
+# Yields the packets of 'packets' in time order, with duplicates merged.  'stats', a
+# dict, gets the counts 'packets' (read), 'duplicates', 'late' and 'untimed'.
+def dedup(packets, window=DEFAULT_WINDOW, max_buffered=DEFAULT_MAX_BUFFERED, stats=None):
+    if stats is None:
+        stats = {}
+    for name in ('packets', 'duplicates', 'late', 'untimed'):
+        stats[name] = 0
+    window = int(window * 1000000)
+    heap = []  # (time, sequence, key) of the buffered packets
+    buffered = {}  # key -> packet
+    # keys passed on within the last 'window', so late copies are still recognised
+    recent = set()
+    recent_order = collections.deque()
+    newest = last_out = sondehub_time.MISSING
+    sequence = 0
+    for packet in packets:
+        stats['packets'] += 1
+        if not isinstance(packet, dict):
+            continue
+        time = sondehub_time.parse(packet.get('datetime'))
+        if time == sondehub_time.MISSING:
+            stats['untimed'] += 1
+            yield packet
+            continue
+        frame = packet.get('frame')
+        key = (packet.get('serial'), time if frame is None else frame)
+        if key in buffered:
+            stats['duplicates'] += 1
+            _merge(buffered[key], packet)
+            continue
+        if key in recent:
+            stats['duplicates'] += 1
+            continue
+        if time < last_out:
+            stats['late'] += 1
+            continue
+        buffered[key] = packet
+        heapq.heappush(heap, (time, sequence, key))
+        sequence += 1
+        if time > newest:
+            newest = time
+        # pass on everything the window has moved past
+        while heap and (heap[0][0] < newest - window or len(buffered) > max_buffered):
+            last_out, _, key = heapq.heappop(heap)
+            yield buffered.pop(key)
+            recent.add(key)
+            recent_order.append((last_out, key))
+            while recent_order[0][0] < last_out - window:
+                recent.discard(recent_order.popleft()[1])
+    while heap:
+        yield buffered.pop(heapq.heappop(heap)[2])
+
+
+# Folds the copy 'other' into 'packet'
+def _merge(packet, other):
+    uploaders = packet.get('uploaders')
+    if uploaders is None:
+        uploaders = packet['uploaders'] = [_receiver(packet)]
+    uploaders.append(_receiver(other))
+    for name, value in other.items():
+        if value is not None and packet.get(name) is None and name not in RECEIVER_FIELDS:
+            packet[name] = value
+
+
+def _receiver(packet):
+    return {name: packet[name] for name in RECEIVER_FIELDS if name in packet}
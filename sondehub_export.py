@@ -0,0 +1,186 @@
+#####################################################################################
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License v3 as published by
+# the Free Software Foundation.
+#####################################################################################
+# Full-resolution columnar export of a flight, written alongside the kml.
+#
+# The kml only keeps a sample of the packets, and their values end up as html in the
+# descriptions.  An Exporter taps the packet stream on its way to the sampling and
+# writes every packet, typed, to one or more of
+#
+#   csv      plain text, streamed out batch by batch
+#   parquet  compressed (zstd by default), one row group per batch
+#   feather  Arrow IPC file (Feather v2), compressed, one record batch per batch
+#
+# so one download and one parse feed both the map and the analysis.  Packets are
+# turned into columns (sondehub_columns.Packets) 'batch_size' at a time, so memory
+# stays bounded however long the flight is.  The files are <serial>.csv/.parquet/
+# .feather in 'outdir'.  Parquet and feather need the 'pyarrow' module.
+#
+# Usage:
+#
+#   with sondehub_export.Exporter(('csv', 'parquet')) as exporter:
+#       data = sondehub_simplify.select(exporter.tap(sondehub_stream.iter_packets(jsonFile)), 50)
+
+import csv
+import os
+
+import numpy as np
+
+import sondehub_columns
+import sondehub_profile
+
+FORMATS = ('csv', 'parquet', 'feather')
+SUFFIXES = {'csv': '.csv', 'parquet': '.parquet', 'feather': '.feather'}
+
+# exported columns, in order; 'datetime' is the sonde time as a UTC timestamp
+FLOAT_COLUMNS = ('lat', 'lon', 'alt', 'temp', 'humidity', 'heading', 'vel_h', 'vel_v', 'batt', 'frequency')
+COLUMNS = ('datetime', 'serial') + FLOAT_COLUMNS + ('manufacturer', 'subtype')
+
+DEFAULT_BATCH_SIZE = 50000
+DEFAULT_COMPRESSION = 'zstd'
+
+
+class Exporter:
+    # 'formats' is any of FORMATS; 'compression' applies to parquet and feather.
+    # 'profile', a sondehub_profile.Profile, gets the writing time as stage 'export'.
+    def __init__(self, formats, outdir='', compression=DEFAULT_COMPRESSION, batch_size=DEFAULT_BATCH_SIZE,
+                 profile=None):
+        for format in formats:
+            if format not in FORMATS:
+                raise ValueError('Unknown export format "{0}"; use one of {1}'.format(format, ', '.join(FORMATS)))
+        if set(formats) & {'parquet', 'feather'}:
+            # fail before the download rather than after it
+            _pyarrow()
+        self.formats = list(dict.fromkeys(formats))
+        self.outdir = outdir
+        self.compression = compression
+        self.batch_size = batch_size
+        self.profile = profile or sondehub_profile.OFF
+        self.paths = []
+        self._sinks = None
+
+    # Yields 'packets' unchanged, writing every one of them out on the way
+    def tap(self, packets):
+        batch = []
+        for packet in packets:
+            batch.append(packet)
+            if len(batch) >= self.batch_size:
+                self._write(batch)
+                batch = []
+            yield packet
+        if batch:
+            self._write(batch)
+        self.close()
+
+    # Writes the packets of 'cols', a sondehub_columns.Packets (e.g. a saved flight),
+    # batch_size at a time
+    def write(self, cols):
+        for start in range(0, len(cols), self.batch_size):
+            self._write_columns(cols.take(slice(start, start + self.batch_size)))
+
+    def _write(self, batch):
+        with self.profile.stage('export'):
+            self._write_columns(sondehub_columns.Packets.from_packets(batch))
+
+    def _write_columns(self, cols):
+        with self.profile.stage('export'):
+            if not len(cols):
+                return
+            if self._sinks is None:
+                # named after the sonde, known once the first packets are in
+                title = cols.string('serial', 0) or 'sonde'
+                self._sinks = []
+                for format in self.formats:
+                    path = os.path.join(self.outdir, title + SUFFIXES[format])
+                    print ('Saving file "'+path+'"')
+                    sink = _CsvSink(path) if format == 'csv' else _ArrowSink(path, format, self.compression)
+                    self._sinks.append(sink)
+                    self.paths.append(path)
+            for sink in self._sinks:
+                sink.write(cols)
+
+    def close(self):
+        for sink in self._sinks or ():
+            sink.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class _CsvSink:
+    def __init__(self, path):
+        self._file = open(path, 'w', newline='', encoding='utf-8')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(COLUMNS)
+
+    def write(self, cols):
+        times = np.datetime_as_string(cols.time.astype('datetime64[us]'))
+        columns = [[t + 'Z' if t != 'NaT' else '' for t in times.tolist()], _strings(cols, 'serial', '')]
+        for name in FLOAT_COLUMNS:
+            # NaN != NaN; missing values are left empty
+            columns.append([v if v == v else '' for v in cols.values(name)])
+        columns.append(_strings(cols, 'manufacturer', ''))
+        columns.append(_strings(cols, 'subtype', ''))
+        self._writer.writerows(zip(*columns))
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+
+class _ArrowSink:
+    def __init__(self, path, format, compression):
+        pa = self._pa = _pyarrow()
+        self._schema = pa.schema([('datetime', pa.timestamp('us', tz='UTC')), ('serial', pa.string())] +
+                                 [(name, pa.float64()) for name in FLOAT_COLUMNS] +
+                                 [('manufacturer', pa.string()), ('subtype', pa.string())])
+        if format == 'parquet':
+            import pyarrow.parquet
+            self._writer = pyarrow.parquet.ParquetWriter(path, self._schema, compression=compression)
+        else:
+            import pyarrow.ipc
+            options = pyarrow.ipc.IpcWriteOptions(compression=compression)
+            self._writer = pyarrow.ipc.new_file(path, self._schema, options=options)
+        self._closed = False
+
+    def write(self, cols):
+        pa = self._pa
+        arrays = [pa.array(cols.time, pa.timestamp('us', tz='UTC'), mask=cols.time == sondehub_columns.MISSING_TIME),
+                  self._strings(cols, 'serial')]
+        for name in FLOAT_COLUMNS:
+            arrays.append(pa.array(cols[name], pa.float64(), mask=np.isnan(cols[name])))
+        arrays.append(self._strings(cols, 'manufacturer'))
+        arrays.append(self._strings(cols, 'subtype'))
+        self._writer.write_table(pa.Table.from_arrays(arrays, schema=self._schema))
+
+    # String column from the interned codes, without a Python string per row
+    def _strings(self, cols, name):
+        pa = self._pa
+        codes = cols.codes[name]
+        return pa.DictionaryArray.from_arrays(pa.array(codes, mask=codes < 0),
+                                              pa.array(cols.strings, pa.string())).dictionary_decode()
+
+    def close(self):
+        if not self._closed:
+            self._writer.close()
+            self._closed = True
+
+
+# String column 'name' as a list, with 'missing' where there is no value
+def _strings(cols, name, missing):
+    strings = cols.strings + [missing]
+    # code -1 (missing) picks the trailing 'missing'
+    return [strings[code] for code in cols.codes[name].tolist()]
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise RuntimeError("parquet and feather export need the 'pyarrow' module (pip install pyarrow)")
+    return pyarrow
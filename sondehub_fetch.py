@@ -0,0 +1,195 @@
+#####################################################################################
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License v3 as published by
+# the Free Software Foundation.
+#####################################################################################
+# Concurrent-friendly fetcher for the SondeHub API, used by SondeHub_json2kml_batch.py.
+#
+# urllib.request.urlopen() opens a fresh TCP/TLS connection for every sonde.  A Fetcher
+# keeps one keep-alive connection per host for each worker thread, applies a timeout to
+# every request and retries failed downloads with exponential backoff.  The response is
+# streamed straight into sondehub_stream.iter_packets(), so only the sampled packets are
+# ever held in memory.  Given a sondehub_cache.Cache, responses are stored on disk and
+# revalidated (or, for landed sondes and offline mode, not asked for at all) next time.
+#
+# Usage:
+#
+#   fetcher = sondehub_fetch.Fetcher(timeout=30, retries=3, cache=sondehub_cache.Cache())
+#   data = fetcher.packets('V3250858', step=50)
+
+import http.client
+import json
+import threading
+import time
+import urllib.parse
+
+import sondehub_stream
+
+# Status codes worth another try; anything else that isn't 200 fails straight away
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+# Raised when a sonde can't be downloaded (after retries, where they apply)
+class FetchError(Exception):
+    pass
+
+
+# Stand-in result for a '304 Not Modified' answer
+_NOT_MODIFIED = object()
+
+
+# A retryable failure: connection problems, timeouts, a truncated body or a RETRY_STATUS
+class _Retry(Exception):
+    def __init__(self, message, delay=None):
+        super().__init__(message)
+        self.delay = delay
+
+
+class Fetcher:
+    def __init__(self, timeout=30, retries=3, backoff=0.5, api_url=None, archive_url=None, cache=None,
+                 telemetry_url=None):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.api_url = api_url or sondehub_stream.API_URL
+        if telemetry_url is None:
+            telemetry_url = (api_url.rstrip('/').rsplit('/', 1)[0] + '/sondes/telemetry' if api_url
+                             else sondehub_stream.TELEMETRY_URL)
+        self.telemetry_url = telemetry_url
+        # a custom api_url (a mirror or stand-in server) has no archive unless one is given
+        if archive_url is None:
+            archive_url = sondehub_stream.ARCHIVE_URL if not api_url else ''
+        self.archive_url = archive_url
+        self.cache = cache
+        # connections are not thread safe; each worker thread gets its own per host.
+        # All of them are also listed in _open, so close() can reach every thread's.
+        self._local = threading.local()
+        self._open = []
+        self._lock = threading.Lock()
+
+    # Downloads the history of 'serial' and returns every 'step'th packet, retrying
+    # with exponential backoff (backoff, 2*backoff, 4*backoff ... seconds).
+    # 'select', if given, picks the packets instead: select(packet iterator) -> list.
+    def packets(self, serial, step=50, select=None):
+        if select is None:
+            select = lambda packets: list(sondehub_stream.sample(packets, step))
+        cache = self.cache
+        entry = cache.lookup(serial) if cache else None
+        if cache and cache.usable_offline(entry):
+            return self._cached(cache.revalidated(entry, checked=False), select)
+        if cache and cache.offline:
+            raise FetchError(serial + ': not in the cache (offline mode)')
+
+        def download():
+            if cache:
+                return self._cached(self._download_to_cache(serial, entry), select)
+            sample = lambda response: select(
+                sondehub_stream.iter_packets(sondehub_stream.decompress(response)))
+            data = self._get(self.api_url + urllib.parse.quote(serial), sample)
+            # the API answers '[]' for flights that have been moved to the archive
+            if not data and self.archive_url:
+                data = self._get(self.archive_url.format(urllib.parse.quote(serial)), sample, missing_ok=True) or []
+            return data
+        return self._retrying(serial, download)
+
+    # The packets of 'serial' from the last 'duration' (a SondeHub duration such as '15m'
+    # or '3h') as a list in no particular order; never cached.  Retries like packets().
+    def recent(self, serial, duration):
+        url = '{0}?{1}'.format(self.telemetry_url, urllib.parse.urlencode({'serial': serial, 'duration': duration}))
+        # the answer is {serial: {datetime: packet}}
+        consume = lambda response: json.load(sondehub_stream.decompress(response))
+        return self._retrying(serial, lambda: list(self._get(url, consume).get(serial, {}).values()))
+
+    # Calls download() until it succeeds, sleeping backoff, 2*backoff, 4*backoff ...
+    # seconds (or what the server asked for) between attempts
+    def _retrying(self, serial, download):
+        attempt = 0
+        while True:
+            try:
+                return download()
+            except _Retry as e:
+                if attempt >= self.retries:
+                    raise FetchError('{0}: {1} (gave up after {2} attempts)'.format(serial, e, attempt + 1))
+                time.sleep(e.delay if e.delay is not None else self.backoff * 2 ** attempt)
+                attempt += 1
+
+    # Closes the connections of every thread; call it once the downloads are done.  A
+    # later download opens new ones.
+    def close(self):
+        with self._lock:
+            conns, self._open = self._open, []
+            self._local = threading.local()
+        for conn in conns:
+            conn.close()
+
+    # Revalidates or downloads 'serial' into the cache; returns the fresh cache Entry
+    def _download_to_cache(self, serial, entry):
+        url = self.api_url + urllib.parse.quote(serial)
+        store = lambda response: self.cache.store(serial, response, response.headers, url)
+        result = self._get(url, store, self.cache.request_headers(entry))
+        if result is _NOT_MODIFIED:
+            return self.cache.revalidated(entry)
+        # the API answers '[]' for flights that have been moved to the archive
+        if result.empty and self.archive_url:
+            url = self.archive_url.format(urllib.parse.quote(serial))
+            store = lambda response: self.cache.store(serial, response, response.headers, url, immutable=True)
+            result = self._get(url, store, missing_ok=True) or result
+        return result
+
+    def _cached(self, entry, select):
+        with self.cache.open(entry) as jsonFile:
+            return select(sondehub_stream.iter_packets(jsonFile))
+
+    # GETs 'url' on this thread's connection to its host and returns consume(response)
+    # for a 200 answer, _NOT_MODIFIED for a 304 and None for a 404 when 'missing_ok'
+    def _get(self, url, consume, headers=None, missing_ok=False):
+        parts = urllib.parse.urlsplit(url)
+        path = parts.path + ('?' + parts.query if parts.query else '')
+        key = (parts.scheme, parts.netloc)
+        conn = self._connection(key)
+        try:
+            conn.request('GET', path, headers=dict(headers or {}, **{'Accept-Encoding': 'gzip'}))
+            response = conn.getresponse()
+            if response.status == 200:
+                result = consume(response)
+            elif response.status == 304:
+                result = _NOT_MODIFIED
+            elif response.status == 404 and missing_ok:
+                result = None
+            else:
+                response.read()
+                if response.will_close:
+                    self._drop(key)
+                message = 'HTTP {0} {1} for {2}'.format(response.status, response.reason, url)
+                if response.status in RETRY_STATUS:
+                    retry_after = response.getheader('Retry-After')
+                    raise _Retry(message, float(retry_after) if retry_after and retry_after.isdigit() else None)
+                raise FetchError(message)
+            # drain what's left (trailing whitespace) so the connection can be reused
+            response.read()
+            if response.will_close:
+                self._drop(key)
+            return result
+        except (OSError, http.client.HTTPException, ValueError, EOFError) as e:
+            # timeouts, resets, truncated json/gzip: start over on a new connection
+            self._drop(key)
+            raise _Retry('{0}: {1}'.format(type(e).__name__, e))
+
+    def _connection(self, key):
+        conns = self._local.__dict__.setdefault('conns', {})
+        conn = conns.get(key)
+        if conn is None:
+            scheme, netloc = key
+            cls = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+            conn = conns[key] = cls(netloc, timeout=self.timeout)
+            with self._lock:
+                self._open.append(conn)
+        return conn
+
+    def _drop(self, key):
+        conn = getattr(self._local, 'conns', {}).pop(key, None)
+        if conn is not None:
+            with self._lock:
+                if conn in self._open:
+                    self._open.remove(conn)
+            conn.close()
@@ -0,0 +1,124 @@
+#####################################################################################
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License v3 as published by
+# the Free Software Foundation.
+#####################################################################################
+# A flight saved as binary columns, for re-rendering it without the json.
+#
+# Parsing the json is most of the time a conversion takes, and drawing the same flight
+# again with another --step, --simplify, filter or --kmz used to parse it all over
+# again.  save() writes the whole flight (a sondehub_columns.Packets) once, next to the
+# kml, as a directory <serial>.columns of NumPy .npy files:
+#
+#   floats.npy   float64, one row per FLOAT_FIELDS column (NaN where missing)
+#   ints.npy     bool, the same rows: the json held an integer
+#   nulls.npy    bool, the same rows: the json held a null
+#   time.npy     int64 microseconds since the epoch
+#   codes.npy    int32, one row per STRING_FIELDS column, into 'strings' below
+#   flight.json  format version, field names, the string table and the packet count
+#
+# load() memory-maps the arrays read-only, so opening a flight of millions of packets
+# reads no data at all: the operating system pages in only the rows the sampling,
+# the filters and the kml actually touch, and a flight saved earlier in the same run
+# or by another process is shared through the page cache.  Each column is a
+# contiguous row of its file, so the columns are plain (zero-copy) array views.
+#
+# Usage:
+#
+#   sondehub_flightcache.save(data, sondehub_flightcache.path_for('V3250858', 'kml'))
+#   data = sondehub_flightcache.load('kml/V3250858.columns')
+#   data = sondehub_simplify.select_columns(data, 10)
+
+import json
+import os
+import shutil
+
+import numpy as np
+
+import sondehub_columns
+
+SUFFIX = '.columns'
+VERSION = 1
+
+_META = 'flight.json'
+
+
+# Directory a flight named 'title' is saved to in 'outdir'
+def path_for(title, outdir=''):
+    return os.path.join(outdir, title + SUFFIX)
+
+
+# True when 'path' is a flight written by save(): a <title>.columns directory holding
+# its flight.json.  The suffix matters; a directory of sonde json files can well hold
+# one named flight.json.
+def is_saved(path):
+    return os.path.normpath(path).endswith(SUFFIX) and os.path.isfile(os.path.join(path, _META))
+
+
+# Writes 'data' (a sondehub_columns.Packets) to directory 'path', replacing any flight
+# saved there before.  The files are written to a temporary directory first, so a run
+# that is interrupted never leaves a half-written flight behind.  'source' is recorded
+# for reference (where the packets were read from).
+def save(data, path, source=None):
+    tmp = path + '.tmp-' + str(os.getpid())
+    os.makedirs(tmp)
+    try:
+        floats = sondehub_columns.FLOAT_FIELDS
+        strings = sondehub_columns.STRING_FIELDS
+        np.save(os.path.join(tmp, 'floats.npy'), _rows(data.floats, floats, np.float64, len(data)))
+        np.save(os.path.join(tmp, 'ints.npy'), _rows(data.ints, floats, np.bool_, len(data)))
+        np.save(os.path.join(tmp, 'nulls.npy'), _rows(data.nulls, floats, np.bool_, len(data)))
+        np.save(os.path.join(tmp, 'time.npy'), np.ascontiguousarray(data.time, dtype=np.int64))
+        np.save(os.path.join(tmp, 'codes.npy'), _rows(data.codes, strings, np.int32, len(data)))
+        meta = {'version': VERSION, 'packets': len(data), 'source': source,
+                'float_fields': list(floats), 'string_fields': list(strings), 'strings': data.strings}
+        with open(os.path.join(tmp, _META), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        os.rename(tmp, path)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    return path
+
+
+# Opens the flight saved in directory 'path' as a sondehub_columns.Packets whose
+# columns are views of the memory-mapped files ('mmap' False reads them into memory)
+def load(path, mmap=True):
+    try:
+        with open(os.path.join(path, _META), encoding='utf-8') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        raise ValueError('"{0}" is not a saved flight'.format(path))
+    if not isinstance(meta, dict):
+        raise ValueError('"{0}" is not a saved flight'.format(path))
+    if meta.get('version') != VERSION:
+        raise ValueError('"{0}" was saved in format {1}; this version reads format {2}'.format(
+            path, meta.get('version'), VERSION))
+    floats = meta['float_fields']
+    strings = meta['string_fields']
+    if set(floats) != set(sondehub_columns.FLOAT_FIELDS) or set(strings) != set(sondehub_columns.STRING_FIELDS):
+        raise ValueError('"{0}" holds other fields than this version uses'.format(path))
+    # an empty file can't be mapped
+    mode = 'r' if mmap and meta['packets'] else None
+
+    def array(name):
+        # np.asarray drops the np.memmap subclass; the data stays mapped
+        return np.asarray(np.load(os.path.join(path, name), mmap_mode=mode))
+
+    values, ints, nulls, codes = array('floats.npy'), array('ints.npy'), array('nulls.npy'), array('codes.npy')
+    return sondehub_columns.Packets({name: values[i] for i, name in enumerate(floats)},
+                                    {name: ints[i] for i, name in enumerate(floats)},
+                                    array('time.npy'),
+                                    {name: codes[i] for i, name in enumerate(strings)},
+                                    meta['strings'],
+                                    {name: nulls[i] for i, name in enumerate(floats)})
+
+
+# The columns 'names' of 'columns' stacked into one C-ordered 2D array, one row each
+def _rows(columns, names, dtype, n):
+    rows = np.empty((len(names), n), dtype=dtype)
+    for i, name in enumerate(names):
+        rows[i] = columns[name]
+    return rows
@@ -0,0 +1,181 @@
+#####################################################################################
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License v3 as published by
+# the Free Software Foundation.
+#####################################################################################
+# Time and space index over the packets of a flight, for plotting only part of it:
+# the descent, the last minutes before landing, an altitude band or the packets inside
+# a box around the recovery area.
+#
+# A FlightIndex holds the packets with a time and a position (sondehub_columns.Packets)
+# in time order, plus two lookups built once, in O(n log n):
+#
+#   altitude  the rows sorted by altitude
+#   grid      the rows sorted by lon/lat grid cell (about GRID_LOAD packets per cell)
+#
+# A time window is a binary search on the time column, an altitude band one on the
+# sorted altitudes and a box a binary search per grid column it spans; the smallest of
+# the candidate sets is then checked against the other filters.  The searches are
+# O(log n), but building each candidate set (the row numbers of a time window, the
+# slice of the altitude order, the rows of the grid cells) is linear in its size, so a
+# query costs O(log n) plus the candidates of every filter given, which for a wide
+# filter is most of the flight.  Burst (the highest packet) and landing (the last one)
+# are worked out while the index is built.
+#
+# Usage:
+#
+#   index = sondehub_index.FlightIndex(sondehub_columns.Packets.from_packets(packets))
+#   descent = index.data.take(index.query(start=index.time(index.burst)))
+#   last10 = index.data.take(index.query(start=index.time(index.landing) - 600 * 1000000))
+#   box = index.data.take(index.query(bbox=(-3.7, 40.3, -3.5, 40.5)))
+#   rows = sondehub_index.focus(index, phase='descent', last=600)
+
+import numpy as np
+
+import sondehub_time
+
+# packets per grid cell, on average
+GRID_LOAD = 16
+
+# flight phases focus() takes: up to the burst, from the burst on
+PHASES = ('ascent', 'descent')
+
+
+class FlightIndex:
+    def __init__(self, data):
+        ok = (data.present('datetime') & data.present('lon') & data.present('lat') & data.present('alt'))
+        data = data.take(np.flatnonzero(ok))
+        # time order; a stable sort keeps the copies of a frame as they came
+        self.data = data = data.take(np.argsort(data.time, kind='stable'))
+        self._time = data.time
+        self._lon = data['lon']
+        self._lat = data['lat']
+        self._alt = data['alt']
+        n = len(data)
+
+        # burst is the highest packet (the first of them, if it was level for a while),
+        # landing the last one
+        self.burst = int(np.argmax(self._alt)) if n else None
+        self.landing = n - 1 if n else None
+
+        self._by_alt = np.argsort(self._alt, kind='stable')
+        self._sorted_alt = self._alt[self._by_alt]
+
+        # lon/lat grid: cell (ix, iy) has key ix * ny + iy; rows sorted by key
+        side = max(1, int((n / GRID_LOAD) ** 0.5))
+        self._nx = self._ny = side
+        if n:
+            self._west, self._south = float(self._lon.min()), float(self._lat.min())
+            self._dx = (float(self._lon.max()) - self._west) / side or 1.0
+            self._dy = (float(self._lat.max()) - self._south) / side or 1.0
+        else:
+            self._west = self._south = 0.0
+            self._dx = self._dy = 1.0
+        keys = self._cell(self._lon, self._west, self._dx, self._nx) * self._ny + \
+            self._cell(self._lat, self._south, self._dy, self._ny)
+        self._by_cell = np.argsort(keys, kind='stable')
+        self._sorted_keys = keys[self._by_cell]
+
+    def __len__(self):
+        return len(self._time)
+
+    # Sonde time of row 'i', in microseconds since the epoch
+    def time(self, i):
+        return int(self._time[i])
+
+    # (lon, lat, alt) of row 'i'
+    def position(self, i):
+        return float(self._lon[i]), float(self._lat[i]), float(self._alt[i])
+
+    # Row numbers (into self.data, in time order) of the packets from 'start' to 'end'
+    # (microseconds since the epoch, both included), between 'min_alt' and 'max_alt'
+    # metres and inside 'bbox' (west, south, east, north; west > east crosses the
+    # antimeridian).  Filters left at None don't apply.
+    def query(self, start=None, end=None, min_alt=None, max_alt=None, bbox=None):
+        n = len(self)
+        candidates = []
+        if start is not None or end is not None:
+            lo = 0 if start is None else int(np.searchsorted(self._time, start, 'left'))
+            hi = n if end is None else int(np.searchsorted(self._time, end, 'right'))
+            candidates.append(np.arange(lo, max(lo, hi)))
+        if min_alt is not None or max_alt is not None:
+            lo = 0 if min_alt is None else int(np.searchsorted(self._sorted_alt, min_alt, 'left'))
+            hi = n if max_alt is None else int(np.searchsorted(self._sorted_alt, max_alt, 'right'))
+            candidates.append(self._by_alt[lo:max(lo, hi)])
+        if bbox is not None:
+            candidates.append(self._in_box(*bbox))
+        if not candidates:
+            return np.arange(n)
+
+        rows = min(candidates, key=len)
+        keep = np.ones(len(rows), dtype=bool)
+        if start is not None:
+            keep &= self._time[rows] >= start
+        if end is not None:
+            keep &= self._time[rows] <= end
+        if min_alt is not None:
+            keep &= self._alt[rows] >= min_alt
+        if max_alt is not None:
+            keep &= self._alt[rows] <= max_alt
+        if bbox is not None:
+            keep &= self._inside(rows, *bbox)
+        return np.sort(rows[keep])
+
+    # Candidate rows for the box: those in the grid cells it touches
+    def _in_box(self, west, south, east, north):
+        if west > east:
+            # across the antimeridian: the two halves (whose cells clipped to the grid
+            # can be the same)
+            return np.unique(np.concatenate((self._in_box(west, south, 180.0, north),
+                                             self._in_box(-180.0, south, east, north))))
+        if not len(self):
+            return np.arange(0)
+        ix0, ix1 = self._cell(np.array([west, east]), self._west, self._dx, self._nx).tolist()
+        iy0, iy1 = self._cell(np.array([south, north]), self._south, self._dy, self._ny).tolist()
+        columns = np.arange(ix0, ix1 + 1) * self._ny
+        lo = np.searchsorted(self._sorted_keys, columns + iy0, 'left')
+        hi = np.searchsorted(self._sorted_keys, columns + iy1, 'right')
+        if not len(lo):
+            return np.arange(0)
+        return np.concatenate([self._by_cell[a:b] for a, b in zip(lo.tolist(), hi.tolist())])
+
+    def _inside(self, rows, west, south, east, north):
+        lon, lat = self._lon[rows], self._lat[rows]
+        in_lon = (lon >= west) | (lon <= east) if west > east else (lon >= west) & (lon <= east)
+        return in_lon & (lat >= south) & (lat <= north)
+
+    # Grid cell numbers of 'values' along one axis, clipped to the grid
+    @staticmethod
+    def _cell(values, origin, size, cells):
+        return np.clip(np.floor((values - origin) / size), 0, cells - 1).astype(np.int64)
+
+    # One line on burst and landing, for the console
+    def summary(self):
+        if not len(self):
+            return 'No positions'
+        lon, lat, alt = self.position(self.burst)
+        text = 'Burst at {0:.0f} m ({1})'.format(alt, sondehub_time.format_many([self.time(self.burst)])[0])
+        lon, lat, alt = self.position(self.landing)
+        return text + '; landed at {0:.5f}, {1:.5f}, {2:.0f} m ({3})'.format(
+            lat, lon, alt, sondehub_time.format_many([self.time(self.landing)])[0])
+
+
+# Row numbers of the packets of 'index' picked by the command line filters: sonde
+# times 'start' and 'end' (microseconds since the epoch), the 'last' seconds before
+# landing, a 'phase' (one of PHASES), the altitude band 'min_alt'..'max_alt' and
+# 'bbox' (west, south, east, north).  All of those given apply.
+def focus(index, start=None, end=None, last=None, phase=None, min_alt=None, max_alt=None, bbox=None):
+    if phase is not None and phase not in PHASES:
+        raise ValueError('Unknown flight phase "{0}"; use one of {1}'.format(phase, ', '.join(PHASES)))
+    if not len(index):
+        return np.arange(0)
+    starts, ends = [start], [end]
+    if last is not None:
+        starts.append(index.time(index.landing) - int(last * 1000000))
+    if phase == 'ascent':
+        ends.append(index.time(index.burst))
+    elif phase == 'descent':
+        starts.append(index.time(index.burst))
+    starts = [t for t in starts if t is not None]
+    ends = [t for t in ends if t is not None]
+    return index.query(max(starts) if starts else None, min(ends) if ends else None, min_alt, max_alt, bbox)
@@ -0,0 +1,553 @@
+#####################################################################################
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License v3 as published by
+# the Free Software Foundation.
+#####################################################################################
+# Streaming kml writer, the 'stream' backend of sondehub_convert.convert().
+#
+# simplekml builds a Point, Placemark, Snippet and description object per packet, turns
+# the whole tree into one string, re-parses that with minidom and pretty-prints it; for
+# full-resolution tracks that object graph is most of the run's memory and time.
+# KmlWriter writes the same document straight to the file instead, one placemark at a
+# time: the styles are written once and shared, and the description template is escaped
+# once so only the values filled into it need escaping per point.
+#
+# The output is byte for byte what kml.save() writes for a document laid out like the
+# v3-2 one (same ids, element order, indentation and escaping), so the two backends can
+# be swapped freely.  The ids are the ones simplekml gives the first document of a
+# process; sondehub_convert restarts simplekml's process-wide id counter for each
+# flight, so later flights of a directory, batch or convert_source() loop match too.
+# Run benchmarks/bench_kml_writer.py to compare them.
+#
+# MergedKmlWriter puts many flights in one document, each in a <Folder> of its own,
+# for a station's launch board: the point style and the track styles (one per colour
+# of PALETTE, handed out in turn) are written once at the top, and the flights are
+# streamed in one after the other as they are converted.
+#
+# KmzWriter writes the compact kmz flavour instead: the document is zip-compressed, the
+# point icon is stored inside the archive and the description box is a <BalloonStyle>
+# template shared by all points, each of which only carries its values as <ExtendedData>.
+#
+# Usage:
+#
+#   with sondehub_kmlwriter.KmlWriter(path, title, ICON_HREF, DESCRIPTION) as kml:
+#       kml.linestring(coords)
+#       for coord, values in points:
+#           kml.point(coord, values)
+#
+#   with sondehub_kmlwriter.KmzWriter(path, title, DESCRIPTION, FIELDS) as kmz:
+#       ... the same calls ...
+#
+#   with sondehub_kmlwriter.MergedKmlWriter(path, 'Launches', ICON_HREF, DESCRIPTION) as kml:
+#       for title, coords, points in flights:
+#           kml.folder(title)
+#           ... the same calls ...
+
+import io
+import os
+import re
+import string
+import struct
+import zlib
+
+# ids as simplekml hands them out in a fresh process: Document 1, the shared point
+# style 2 (IconStyle 3, Icon 4), the LineString 5 and its Placemark 6, the line style 7
+# (LineStyle 8); each point then takes two more (Point, Placemark)
+_FIRST_POINT_ID = 9
+
+_HEADER = '''<?xml version="1.0" encoding="UTF-8"?>
+<kml xmlns="http://www.opengis.net/kml/2.2" xmlns:gx="http://www.google.com/kml/ext/2.2">
+    <Document id="1">
+        <Style id="7">
+            <LineStyle id="8">
+                <color>{line_color}</color>
+                <colorMode>normal</colorMode>
+                <width>{line_width}</width>
+            </LineStyle>
+        </Style>
+        <Style id="2">
+            <IconStyle id="3">
+                <colorMode>normal</colorMode>
+                <scale>1</scale>
+                <heading>0</heading>
+                <Icon id="4">
+                    {href}
+                </Icon>
+            </IconStyle>
+        </Style>
+        {name}
+'''
+
+_LINESTRING = '''        <Placemark id="6">
+            {name}
+            <styleUrl>#7</styleUrl>
+            <LineString id="5">
+                <extrude>1</extrude>
+                <altitudeMode>absolute</altitudeMode>
+                {coordinates}
+            </LineString>
+        </Placemark>
+'''
+
+# %(description)s and %(snippet)s are filled in once per writer (see _point_template())
+_POINT = '''        <Placemark id="{1}">
+            %(description)s
+            %(snippet)s
+            <styleUrl>#2</styleUrl>
+            <Point id="{0}">
+                <coordinates>{2},{3},{4}</coordinates>
+                <altitudeMode>absolute</altitudeMode>
+            </Point>
+        </Placemark>
+'''
+
+_FOOTER = '''    </Document>
+</kml>
+'''
+
+
+_NETWORK_LINK = '''        <NetworkLink>
+            {name}
+            <Region>
+                <LatLonAltBox>
+                    <north>{north}</north>
+                    <south>{south}</south>
+                    <east>{east}</east>
+                    <west>{west}</west>
+                    <minAltitude>{min_alt}</minAltitude>
+                    <maxAltitude>{max_alt}</maxAltitude>
+                    <altitudeMode>absolute</altitudeMode>
+                </LatLonAltBox>
+                <Lod>
+                    <minLodPixels>{min_pixels}</minLodPixels>
+                    <maxLodPixels>-1</maxLodPixels>
+                </Lod>
+            </Region>
+            <Link>
+                {href}
+                <viewRefreshMode>onRegion</viewRefreshMode>
+            </Link>
+        </NetworkLink>
+'''
+
+
+_SEGMENT = '''        <Placemark id="{1}">
+            {2}
+            <styleUrl>#7</styleUrl>
+            <LineString id="{0}">
+                <extrude>1</extrude>
+                <altitudeMode>absolute</altitudeMode>
+                {3}
+            </LineString>
+        </Placemark>
+'''
+
+_UPDATE = '''<?xml version="1.0" encoding="UTF-8"?>
+<kml xmlns="http://www.opengis.net/kml/2.2">
+    <NetworkLinkControl>
+        <Update>
+            {target}
+{delete}            <Create>
+                <Document targetId="1">
+{placemarks}                </Document>
+            </Create>
+        </Update>
+    </NetworkLinkControl>
+</kml>
+'''
+
+_LOADER = '''<?xml version="1.0" encoding="UTF-8"?>
+<kml xmlns="http://www.opengis.net/kml/2.2">
+    <Document>
+        {name}
+        <NetworkLink>
+            {name}
+            <Link>
+                {href}
+            </Link>
+        </NetworkLink>
+        <NetworkLink>
+            <name>updates</name>
+            <Link>
+                {update}
+                <refreshMode>onInterval</refreshMode>
+                <refreshInterval>{interval}</refreshInterval>
+            </Link>
+        </NetworkLink>
+    </Document>
+</kml>
+'''
+
+
+class KmlWriter:
+    # 'description' is the str.format() template of every point's description box.
+    # 'path' may also be an open text stream, which close() closes.  With 'header' False
+    # only placemarks are written (no document around them), numbered from 'next_id'.
+    def __init__(self, path, title, icon_href, description, snippet='{0} WX Readings',
+                 line_color='ff0000ff', line_width=5, header=True, next_id=_FIRST_POINT_ID):
+        self.path = path
+        self.title = title
+        self.next_id = next_id
+        self._point = _point_template(description, _element('Snippet', snippet.format(title)))
+        self._header = header
+        if isinstance(path, str):
+            self._out = open(path, 'w', encoding='utf-8', newline='')
+        else:
+            self._out = path
+        if header:
+            self._out.write(_HEADER.format(line_color=line_color, line_width=line_width,
+                                           href=_element('href', icon_href), name=_element('name', title)))
+
+    # The track; 'coords' is a list of (lon, lat, alt) tuples
+    def linestring(self, coords):
+        if coords:
+            text = ' '.join('{0},{1},{2}'.format(*cd) for cd in coords)
+        else:
+            text = '0.0, 0.0, 0.0'
+        self._out.write(_LINESTRING.format(name=_element('name', self.title),
+                                           coordinates=_element('coordinates', text)))
+
+    # A further piece of track in a placemark of its own (the live mode's additions)
+    def segment(self, coords):
+        text = ' '.join('{0},{1},{2}'.format(*cd) for cd in coords)
+        self._out.write(_SEGMENT.format(self.next_id, self.next_id + 1, _element('name', self.title),
+                                        _element('coordinates', text)))
+        self.next_id += 2
+
+    # One point at 'coord' (lon, lat, alt), its description filled in with 'values';
+    # 'escaped' says the strings among them are escaped already (sondehub_convert
+    # escapes whole columns at a time)
+    def point(self, coord, values, escaped=False):
+        if not escaped:
+            values = [escape(v) if type(v) is str else v for v in values]
+        self._out.write(self._point.format(self.next_id, self.next_id + 1, *coord, *values))
+        self.next_id += 2
+
+    # A <NetworkLink> to the kml at 'href', loaded once the box 'region' (north, south,
+    # east, west, min_alt, max_alt) takes up 'min_pixels' on screen.  Not something
+    # simplekml documents have; used by the level-of-detail tiles (sondehub_lod.py).
+    def network_link(self, name, href, region, min_pixels=256):
+        north, south, east, west, min_alt, max_alt = region
+        self._out.write(_NETWORK_LINK.format(name=_element('name', name), href=_element('href', href),
+                                             north=north, south=south, east=east, west=west,
+                                             min_alt=min_alt, max_alt=max_alt, min_pixels=min_pixels))
+
+    def close(self):
+        if not self._out.closed:
+            if self._header:
+                self._out.write(_FOOTER)
+            self._out.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# Adds 'placemarks' (text written by a KmlWriter without header) to the end of the
+# document in the kml at 'path', rewriting only its tail
+def append(path, placemarks):
+    footer = _FOOTER.encode('utf-8')
+    with open(path, 'r+b') as f:
+        f.seek(-len(footer), 2)
+        if f.read() != footer:
+            raise ValueError('"{0}" does not end like a KmlWriter document'.format(path))
+        f.seek(-len(footer), 2)
+        f.write(placemarks.encode('utf-8') + footer)
+        f.truncate()
+
+
+# Writes the <NetworkLinkControl> <Update> kml adding 'placemarks' to the document of
+# the kml at 'target' (its url or path relative to the update file).  The placemarks
+# with the ids 'ids' are deleted first, so an update that deletes the ones it creates
+# can be applied any number of times.
+def write_update(path, target, placemarks, ids=()):
+    delete = ''.join('                <Placemark targetId="{0}"/>\n'.format(i) for i in ids)
+    if delete:
+        delete = '            <Delete>\n' + delete + '            </Delete>\n'
+    _write_replacing(path, _UPDATE.format(target=_element('targetHref', target), delete=delete,
+                                          placemarks=placemarks))
+
+
+# Writes the kml to open in Google Earth for a live flight: the document at 'href'
+# plus a link re-reading the updates at 'update' every 'interval' seconds
+def write_loader(path, title, href, update, interval):
+    _write_replacing(path, _LOADER.format(name=_element('name', title), href=_element('href', href),
+                                          update=_element('href', update), interval=interval))
+
+
+# Writes 'text' to 'path' in one go, so nobody ever reads it half written
+def _write_replacing(path, text):
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8', newline='') as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+# Track colours (aabbggrr) of MergedKmlWriter, one per flight in turn: the ten
+# colours of matplotlib's 'tab10' palette, which stay apart on the satellite imagery
+PALETTE = ('ffb4771f', 'ff0e7fff', 'ff2ca02c', 'ff2827d6', 'ffbd6794',
+           'ff4b568c', 'ffc277e3', 'ff7f7f7f', 'ff22bdbc', 'ffcfbe17')
+
+_MERGED_HEADER = '''<?xml version="1.0" encoding="UTF-8"?>
+<kml xmlns="http://www.opengis.net/kml/2.2">
+    <Document>
+        {name}
+        <Style id="wx">
+            <IconStyle>
+                <Icon>
+                    {href}
+                </Icon>
+            </IconStyle>
+        </Style>
+'''
+
+_MERGED_LINE_STYLE = '''        <Style id="track{0}">
+            <LineStyle>
+                <color>{1}</color>
+                <width>{2}</width>
+            </LineStyle>
+        </Style>
+'''
+
+_FOLDER = '''        <Folder>
+            {0}
+'''
+
+_FOLDER_END = '''        </Folder>
+'''
+
+_MERGED_LINESTRING = '''            <Placemark>
+                {name}
+                <styleUrl>#track{style}</styleUrl>
+                <LineString>
+                    <extrude>1</extrude>
+                    <altitudeMode>absolute</altitudeMode>
+                    {coordinates}
+                </LineString>
+            </Placemark>
+'''
+
+# as _POINT, without ids
+_MERGED_POINT = '''            <Placemark>
+                %(description)s
+                %(snippet)s
+                <styleUrl>#wx</styleUrl>
+                <Point>
+                    <coordinates>{0},{1},{2}</coordinates>
+                    <altitudeMode>absolute</altitudeMode>
+                </Point>
+            </Placemark>
+'''
+
+
+class MergedKmlWriter:
+    # 'name' names the document; 'description' and 'snippet' are as for KmlWriter,
+    # 'palette' the track colours, used in turn
+    def __init__(self, path, name, icon_href, description, snippet='{0} WX Readings', palette=PALETTE,
+                 line_width=5):
+        self.path = path
+        self.title = None
+        self.flights = 0
+        self._description = description
+        self._snippet = snippet
+        self._palette = palette
+        self._point = None
+        self._out = open(path, 'w', encoding='utf-8', newline='')
+        self._out.write(_MERGED_HEADER.format(name=_element('name', name), href=_element('href', icon_href)))
+        for i, color in enumerate(palette):
+            self._out.write(_MERGED_LINE_STYLE.format(i, color, line_width))
+
+    # Starts the folder of the flight 'title'; the calls after it add to that folder
+    def folder(self, title):
+        if self._point:
+            self._out.write(_FOLDER_END)
+        self.title = title
+        self._style = self.flights % len(self._palette)
+        self.flights += 1
+        self._point = _point_template(self._description, _element('Snippet', self._snippet.format(title)),
+                                      _MERGED_POINT, 3)
+        self._out.write(_FOLDER.format(_element('name', title)))
+
+    # The track of the current flight; 'coords' is a list of (lon, lat, alt) tuples
+    def linestring(self, coords):
+        if coords:
+            text = ' '.join('{0},{1},{2}'.format(*cd) for cd in coords)
+            self._out.write(_MERGED_LINESTRING.format(name=_element('name', self.title), style=self._style,
+                                                      coordinates=_element('coordinates', text)))
+
+    # A point of the current flight, as KmlWriter.point()
+    def point(self, coord, values, escaped=False):
+        if not escaped:
+            values = [escape(v) if type(v) is str else v for v in values]
+        self._out.write(self._point.format(*coord, *values))
+
+    def close(self):
+        if not self._out.closed:
+            if self._point:
+                self._out.write(_FOLDER_END)
+            self._out.write(_FOOTER)
+            self._out.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+_KMZ_HEADER = '''<?xml version="1.0" encoding="UTF-8"?>
+<kml xmlns="http://www.opengis.net/kml/2.2">
+<Document>
+{name}
+<Style id="line"><LineStyle><color>{line_color}</color><width>{line_width}</width></LineStyle></Style>
+<Style id="wx"><IconStyle><Icon><href>{icon}</href></Icon></IconStyle><BalloonStyle><text><![CDATA[{balloon}]]></text></BalloonStyle></Style>
+'''
+
+_KMZ_LINESTRING = '''<Placemark>{name}<styleUrl>#line</styleUrl><LineString><extrude>1</extrude><altitudeMode>absolute</altitudeMode>{coordinates}</LineString></Placemark>
+'''
+
+_KMZ_FOOTER = '''</Document>
+</kml>
+'''
+
+
+class KmzWriter:
+    # 'description' is the same str.format() template KmlWriter takes and 'fields'
+    # names its fields; a field named None is filled in with the title once, in the
+    # balloon, rather than carried by every point.  'icon' is PNG data (default: a
+    # small generated sun, see sun_icon()).
+    def __init__(self, path, title, description, fields, icon=None, icon_name='wx.png',
+                 snippet='{0} WX Readings', line_color='ff0000ff', line_width=5):
+        self.path = path
+        self.title = title
+        self._fields = fields
+        self._snippet = _element('Snippet', snippet.format(title))
+        self._icon = icon if icon is not None else sun_icon()
+        self._icon_name = 'files/' + icon_name
+        # imported here, like zipfile in close(); plain kml output doesn't need it
+        import zipfile
+        self._zip = zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED)
+        # Earth fills $[name] in from the point's <Data name="name">.  It can't apply a
+        # format spec ('{5:.0f}'), so the specs are taken out of the balloon and applied
+        # to the values each point carries instead.
+        self._specs = [''] * len(fields)
+        balloon = []
+        auto = 0
+        for literal, field, spec, conversion in string.Formatter().parse(description):
+            balloon.append(literal)
+            if field is None:
+                continue
+            if field:
+                index = int(field)
+            else:
+                index, auto = auto, auto + 1
+            self._specs[index] = spec
+            # the balloon is html: the title is escaped like the <name>, so a title with
+            # markup in it shows as it is (and can't close the CDATA section)
+            balloon.append(escape(format(title, spec)) if fields[index] is None else '$[{0}]'.format(fields[index]))
+        balloon = ''.join(balloon)
+        # doc.kml is streamed into the archive; Earth reads the first .kml in a kmz
+        self._out = io.TextIOWrapper(self._zip.open('doc.kml', 'w'), encoding='utf-8', newline='')
+        self._out.write(_KMZ_HEADER.format(name=_element('name', title), line_color=line_color,
+                                           line_width=line_width, icon=self._icon_name,
+                                           balloon=balloon.replace(']]>', ']]]]><![CDATA[>')))
+
+    def linestring(self, coords):
+        text = ' '.join('{0},{1},{2}'.format(*cd) for cd in coords)
+        self._out.write(_KMZ_LINESTRING.format(name=_element('name', self.title),
+                                               coordinates=_element('coordinates', text)))
+
+    def point(self, coord, values):
+        data = ''.join('<Data name="{0}"><value>{1}</value></Data>'.format(field, escape(format(value, spec)))
+                       for field, value, spec in zip(self._fields, values, self._specs) if field is not None)
+        self._out.write('<Placemark>{0}<styleUrl>#wx</styleUrl><ExtendedData>{1}</ExtendedData>'
+                        '<Point><altitudeMode>absolute</altitudeMode><coordinates>{2},{3},{4}</coordinates>'
+                        '</Point></Placemark>\n'.format(self._snippet, data, *coord))
+
+    def close(self):
+        if not self._out.closed:
+            self._out.write(_KMZ_FOOTER)
+            self._out.close()
+            import zipfile
+            # png is compressed already
+            self._zip.writestr(self._icon_name, self._icon, compress_type=zipfile.ZIP_STORED)
+            self._zip.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# A 32x32 yellow sun on a transparent background as PNG data, the kmz's point icon
+def sun_icon(size=32):
+    c = (size - 1) / 2.0
+    rows = []
+    for y in range(size):
+        row = bytearray([0])  # filter type: none
+        for x in range(size):
+            dx, dy = x - c, y - c
+            r2 = dx * dx + dy * dy
+            # disk, plus eight rays around it
+            ray = r2 < (0.47 * size) ** 2 and r2 > (0.3 * size) ** 2 and \
+                (abs(dx) < 1.5 or abs(dy) < 1.5 or abs(abs(dx) - abs(dy)) < 1.5)
+            if r2 <= (0.25 * size) ** 2 or ray:
+                row += bytes((255, 200, 0, 255))
+            else:
+                row += bytes(4)
+        rows.append(bytes(row))
+
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+    return (b'\x89PNG\r\n\x1a\n' +
+            chunk(b'IHDR', struct.pack('>IIBBBBB', size, size, 8, 6, 0, 0, 0)) +
+            chunk(b'IDAT', zlib.compress(b''.join(rows), 9)) +
+            chunk(b'IEND', b''))
+
+
+# Text escaped the way simplekml's html.escape() plus minidom round trip leaves it
+def escape(text):
+    text = str(text)
+    if '\r' in text:
+        # xml parsers normalise line ends
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('"', '&quot;').replace('>', '&gt;')
+
+
+# The placemark of a point as one str.format() template, so each point takes a
+# single format() call: for _POINT ids {0} and {1} and the coordinates {2} to {4},
+# then the fields of the 'description' template, renumbered from 'offset' on
+def _point_template(description, snippet, point=_POINT, offset=5):
+    if description:
+        description = '<description>' + _shifted(escape(description), offset) + '</description>'
+    else:
+        description = '<description/>'
+    return point % {'description': description, 'snippet': snippet.replace('{', '{{').replace('}', '}}')}
+
+
+# str.format() template 'template' with its fields renumbered to start at 'offset'
+def _shifted(template, offset):
+    parts = []
+    auto = 0
+    for literal, field, spec, conversion in string.Formatter().parse(template):
+        parts.append(literal.replace('{', '{{').replace('}', '}}'))
+        if field is None:
+            continue
+        index, rest = re.match(r'(\d*)(.*)', field).groups()
+        if not index:
+            # '{}' numbers itself
+            index, auto = auto, auto + 1
+        parts.append('{' + str(int(index) + offset) + rest + ('!' + conversion if conversion else '') +
+                     (':' + spec if spec else '') + '}')
+    return ''.join(parts)
+
+
+# <tag>text</tag>, or <tag/> for empty text as minidom writes it
+def _element(tag, text, escaped=False):
+    if not text:
+        return '<{0}/>'.format(tag)
+    return '<{0}>{1}</{0}>'.format(tag, text if escaped else escape(text))
@@ -0,0 +1,196 @@
+#####################################################################################
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License v3 as published by
+# the Free Software Foundation.
+#####################################################################################
+# Live watch mode for a radiosonde still in flight.
+#
+# Re-running the converter every few minutes downloads and redraws the whole flight
+# each time.  A Watcher downloads the history once, then polls the SondeHub telemetry
+# endpoint for the last few minutes only, keeps the packets newer than the last one it
+# has seen and adds just those to the output, so each poll downloads and writes in
+# proportion to the new packets rather than the length of the flight:
+#
+#   <serial>.kml         the flight, as SondeHub_json2kml_v3-2.py draws it (every 50th
+#                        packet, duplicates merged); each poll's new track piece and
+#                        points are written over the end of the file (just its tail)
+#   <serial>_update.kml  every placemark added since the watch began, as a
+#                        <NetworkLinkControl><Update> that deletes them by id and then
+#                        creates them.  Earth can apply it any number of times, to
+#                        <serial>.kml as loaded at any point, and end up with each
+#                        placemark once: a refresh that runs late, early or twice
+#                        doesn't skip or double anything.
+#   <serial>_live.kml    open this one in Google Earth: it loads <serial>.kml and
+#                        re-reads the updates every poll interval
+#
+# The sampling position, the time of the newest packet, the end of the track and the
+# placemarks added so far (a few per poll) are carried from one poll to the next.
+# Watching stops once no new packet has come in for 'stale_after' seconds (the sonde
+# has landed or is out of range), or on Ctrl-C.
+#
+# Try it without the network against the stand-in server replaying a recorded flight:
+#
+#   python3 tools/sondehub_standin.py canned/ --replay 20 &
+#   SONDEHUB_API_URL=http://127.0.0.1:8000/sonde/ python3 SondeHub_json2kml_v3-2.py V3250858 --watch 10
+
+import io
+import os
+import time
+
+import sondehub_columns
+import sondehub_convert
+import sondehub_dedup
+import sondehub_fetch
+import sondehub_kmlwriter
+import sondehub_time
+
+DEFAULT_INTERVAL = 30
+DEFAULT_STALE_AFTER = 1800
+
+# 'duration' values the telemetry endpoint accepts, shortest first
+DURATIONS = (('1m', 60), ('15m', 900), ('30m', 1800), ('1h', 3600), ('3h', 3 * 3600),
+             ('6h', 6 * 3600), ('12h', 12 * 3600), ('1d', 86400), ('3d', 3 * 86400))
+
+
+class Watcher:
+    def __init__(self, serial, fetcher=None, step=50, outdir='', interval=DEFAULT_INTERVAL):
+        self.serial = serial
+        self.fetcher = fetcher or sondehub_fetch.Fetcher()
+        self.step = step
+        self.outdir = outdir
+        self.interval = interval
+        self.title = None
+        self.path = None
+        self.seen = 0  # packets taken in so far; every 'step'th is drawn
+        self.last_time = sondehub_time.MISSING
+        self.last_coord = None  # where the track drawn so far ends
+        self.next_id = None
+        self.first_id = None  # the id the placemarks added by poll() start from
+        self.added = []  # the placemarks text each poll added
+        self._polled = None
+
+    # Downloads the flight so far and writes the three kml files; returns the number
+    # of points drawn
+    def start(self):
+        polled = time.monotonic()
+        data = self.fetcher.packets(self.serial, select=self._take)
+        if not data:
+            raise sondehub_fetch.FetchError(self.serial + ': no packets found')
+        self._polled = polled
+        self.title = data.string('serial', 0)
+        self.path = os.path.join(self.outdir, self.title + '.kml')
+        with sondehub_kmlwriter.KmlWriter(self.path, self.title, sondehub_convert.ICON_HREF,
+                                          sondehub_convert.DESCRIPTION) as kml:
+            points = self._draw(kml, data, line=True)
+            self.next_id = self.first_id = kml.next_id
+        name = os.path.basename(self.path)
+        sondehub_kmlwriter.write_update(self._output('_update.kml'), name, '')
+        sondehub_kmlwriter.write_loader(self._output('_live.kml'), self.title, name,
+                                        self.title + '_update.kml', self.interval)
+        return points
+
+    # Fetches what came in since the last poll and adds it to the output; returns the
+    # number of new packets
+    def poll(self):
+        polled = time.monotonic()
+        # ask for a little more than the time since the last poll; older ones are skipped
+        packets = self.fetcher.recent(self.serial, duration(polled - self._polled + self.interval))
+        self._polled = polled
+        # the endpoint's answer is keyed by time, not in time order
+        packets.sort(key=lambda packet: str(packet.get('datetime')))
+        seen = self.seen
+        data = self._take(packets)
+        buf = io.StringIO()
+        kml = sondehub_kmlwriter.KmlWriter(buf, self.title, sondehub_convert.ICON_HREF,
+                                           sondehub_convert.DESCRIPTION, header=False, next_id=self.next_id)
+        self._draw(kml, data, line=False)
+        placemarks = buf.getvalue()
+        if placemarks:
+            sondehub_kmlwriter.append(self.path, placemarks)
+            self.added.append(placemarks)
+        self.next_id = kml.next_id
+        # each placemark takes two ids, its geometry's and (the odd one) its own
+        sondehub_kmlwriter.write_update(self._output('_update.kml'), os.path.basename(self.path),
+                                        ''.join(self.added), range(self.first_id + 1, self.next_id, 2))
+        return self.seen - seen
+
+    # Picks the packets to draw out of 'packets', skipping any not newer than those
+    # already taken in.  Returns a sondehub_columns.Packets.  The state only moves on
+    # once all of 'packets' has been read, so a download retried halfway is harmless.
+    def _take(self, packets):
+        kept = []
+        seen, last_time = self.seen, self.last_time
+        for packet in sondehub_dedup.dedup(packets):
+            micros = sondehub_time.parse(packet.get('datetime'))
+            if micros == sondehub_time.MISSING or micros <= last_time:
+                continue
+            last_time = micros
+            if seen % self.step == 0:
+                kept.append(packet)
+            seen += 1
+        self.seen, self.last_time = seen, last_time
+        return sondehub_columns.Packets.from_packets(kept)
+
+    # Writes the track of 'data' (carrying on from the end of the track so far) and
+    # its points; the first track goes in as the document's linestring.  Returns the
+    # number of points.
+    def _draw(self, kml, data, line):
+        track = data.take(data.present('lon') & data.present('lat') & data.present('alt'))
+        coords = list(zip(track.values('lon'), track.values('lat'), track.values('alt')))
+        if line:
+            kml.linestring(coords)
+        elif coords:
+            kml.segment(([self.last_coord] if self.last_coord else []) + coords)
+        if coords:
+            self.last_coord = coords[-1]
+        points = 0
+        for coord, values in sondehub_convert.wx_points(data, self.title):
+            kml.point(coord, values)
+            points += 1
+        return points
+
+    def _output(self, suffix):
+        return os.path.join(self.outdir, self.title + suffix)
+
+
+# The shortest telemetry 'duration' covering 'seconds'
+def duration(seconds):
+    for name, length in DURATIONS:
+        if length >= seconds:
+            return name
+    return DURATIONS[-1][0]
+
+
+# Watches 'serial' until it goes quiet for 'stale_after' seconds, 'polls' polls have
+# been made or Ctrl-C.  Returns an exit status for the scripts.
+def watch(serial, interval=DEFAULT_INTERVAL, step=50, outdir='', stale_after=DEFAULT_STALE_AFTER,
+          polls=None, fetcher=None):
+    watcher = Watcher(serial, fetcher, step, outdir, interval)
+    try:
+        points = watcher.start()
+    except sondehub_fetch.FetchError as e:
+        print('Failed "{0}": {1}'.format(serial, e))
+        return 1
+    print ('Saving file "{0}" ({1} points); open "{2}" to follow the flight'.format(
+        watcher.path, points, os.path.join(outdir, watcher.title + '_live.kml')))
+    quiet_since = time.monotonic()
+    try:
+        while polls is None or polls > 0:
+            time.sleep(interval)
+            try:
+                new = watcher.poll()
+            except sondehub_fetch.FetchError as e:
+                # keep watching; the next poll asks for a longer stretch
+                print('Poll failed: {0}'.format(e))
+                continue
+            if polls is not None:
+                polls -= 1
+            if new:
+                quiet_since = time.monotonic()
+                print('{0} new packets, {1} in all'.format(new, watcher.seen))
+            elif time.monotonic() - quiet_since > stale_after:
+                print('No new packets for {0:.0f} s; stopped watching'.format(stale_after))
+                break
+    except KeyboardInterrupt:
+        pass
+    return 0
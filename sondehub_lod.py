@@ -0,0 +1,123 @@
+#####################################################################################
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License v3 as published by
+# the Free Software Foundation.
+#####################################################################################
+# Level-of-detail output: every packet of a flight, without Google Earth drawing tens
+# of thousands of placemarks at once.
+#
+# The flight is cut into a tree of tiles.  The root document is the overview: the
+# whole track with at most 'max_points' points, always shown.  Each tile covers a
+# stretch of the flight 'fanout' times shorter than its parent's, at a 'fanout' times
+# finer stride, and is only loaded (a <NetworkLink> with a <Region>/<Lod>) once its
+# bounding box fills 'min_pixels' on screen.  Strides are powers of 'fanout', so a
+# tile only draws the points its ancestors left out and the leaves draw the rest:
+# every packet ends up as exactly one placemark.
+#
+# The tree is written as <serial>_lod/doc.kml plus one kml per tile next to it, or
+# zipped into <serial>.kmz (doc.kml first) with 'kmz'.  The kmz only zips the tiles:
+# unlike sondehub_kmlwriter.KmzWriter, it doesn't embed the icon or share a balloon
+# template, so every tile links the icon on maps.google.com and every point carries its
+# full description.
+#
+# Usage:
+#
+#   with sondehub_stream.open_source(inputFile) as jsonFile:
+#       data = sondehub_simplify.select(sondehub_stream.iter_packets(jsonFile), 1)
+#   sondehub_lod.convert(data)
+
+import io
+import os
+import urllib.parse
+import zipfile
+
+import numpy as np
+
+import sondehub_convert
+import sondehub_kmlwriter
+
+DEFAULT_MAX_POINTS = 500
+DEFAULT_FANOUT = 4
+DEFAULT_MIN_PIXELS = 256
+
+
+# Converts every packet of one radiosonde (a sondehub_columns.Packets in var 'data')
+# into a level-of-detail tree written to directory 'outdir'.  Returns the path of the
+# root kml (or of the kmz).
+def convert(data, outdir='', kmz=False, max_points=DEFAULT_MAX_POINTS, fanout=DEFAULT_FANOUT,
+            min_pixels=DEFAULT_MIN_PIXELS):
+    if max_points < 2 or fanout < 2:
+        raise ValueError('max_points and fanout must be at least 2')
+    title = data.string('serial', 0)
+    # only packets with a position take part; the rest can't be drawn anyway
+    data = data.take(data.present('lon') & data.present('lat') & data.present('alt'))
+
+    # the overview stride: the smallest power of 'fanout' leaving at most max_points
+    stride = 1
+    while (len(data) + stride - 1) // stride > max_points:
+        stride *= fanout
+
+    if kmz:
+        outputFile = os.path.join(outdir, title + '.kmz')
+        archive = zipfile.ZipFile(outputFile, 'w', zipfile.ZIP_DEFLATED)
+        opener = lambda name: io.TextIOWrapper(archive.open(name, 'w'), encoding='utf-8', newline='')
+    else:
+        directory = os.path.join(outdir, title + '_lod')
+        os.makedirs(directory, exist_ok=True)
+        outputFile = os.path.join(directory, 'doc.kml')
+        archive = None
+        opener = lambda name: os.path.join(directory, name)
+    print ('Saving file "'+outputFile+'"')
+
+    tiles = 0
+    try:
+        # depth first; each tile is written whole before its children, so only one
+        # file (or zip member) is ever open
+        pending = [('doc.kml', 0, len(data), stride, None)]
+        while pending:
+            name, lo, hi, stride, parent_stride = pending.pop()
+            children = _split(lo, hi, fanout) if stride > 1 else []
+            links = [('{0}-{1}-{2}.kml'.format(title, stride // fanout, clo), clo, chi) for clo, chi in children]
+            _write_tile(opener(name), title, data, lo, hi, stride, parent_stride, links, min_pixels)
+            tiles += 1
+            for child, clo, chi in reversed(links):
+                pending.append((child, clo, chi, stride // fanout, stride))
+    finally:
+        if archive is not None:
+            archive.close()
+    print ('{0} packets in {1} tiles'.format(len(data), tiles))
+    return outputFile
+
+
+# Writes the tile covering packets lo..hi-1 drawn every 'stride' packets, leaving out
+# those its parent (drawn every 'parent_stride') already has, plus links to 'links'
+def _write_tile(out, title, data, lo, hi, stride, parent_stride, links, min_pixels):
+    index = np.arange(-(-lo // stride) * stride, hi, stride)
+    # the line runs on to the next tile's first packet so the tiles join up
+    line_index = np.union1d(index, [lo, min(hi, len(data) - 1)]) if hi > lo else index
+    track = data.take(line_index)
+    line = list(zip(track.values('lon'), track.values('lat'), track.values('alt')))
+    if parent_stride:
+        index = index[index % parent_stride != 0]
+    with sondehub_kmlwriter.KmlWriter(out, title, sondehub_convert.ICON_HREF, sondehub_convert.DESCRIPTION) as kml:
+        kml.linestring(line)
+        for coord, values in sondehub_convert.wx_points(data.take(index), title):
+            kml.point(coord, values)
+        for href, clo, chi in links:
+            kml.network_link('{0} {1}-{2}'.format(title, clo, chi - 1), urllib.parse.quote(href),
+                             _region(data, clo, chi), min_pixels)
+
+
+# Splits lo..hi-1 into 'parts' runs of (nearly) the same length
+def _split(lo, hi, parts):
+    bounds = np.linspace(lo, hi, min(parts, hi - lo) + 1).astype(int).tolist()
+    return list(zip(bounds, bounds[1:]))
+
+
+# Bounding box (north, south, east, west, min_alt, max_alt) of packets lo..hi-1
+def _region(data, lo, hi):
+    lon = data['lon'][lo:hi]
+    lat = data['lat'][lo:hi]
+    alt = data['alt'][lo:hi]
+    return (float(lat.max()), float(lat.min()), float(lon.max()), float(lon.min()),
+            float(alt.min()), float(alt.max()))
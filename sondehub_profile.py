@@ -0,0 +1,223 @@
+#####################################################################################
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License v3 as published by
+# the Free Software Foundation.
+#####################################################################################
+# Per-stage timing, memory and counts for a conversion (--profile in v3-2).
+#
+# The stages of a conversion run interleaved (the json is decoded as it downloads, the
+# points are formatted as they are written), so each one is timed exclusively: entering
+# a stage pauses the one around it.  The stages are
+#
+#   fetch       opening sources, HTTP requests, reading raw bytes off the network/disk
+#   decompress  gzip/bzip2/xz/zstd
+#   decode      json parsing
+#   filter      de-duplication, sampling, columns, simplification
+#   points      working out the points and their descriptions
+#   write       building and serialising the kml/kmz
+#   export      writing the full-resolution csv/parquet/feather (sondehub_export.py)
+#   other       the rest (startup, messages)
+#
+# Counts are kept alongside: bytes downloaded and read, json bytes, packets seen, kept,
+# drawn and skipped (the records lacking a position, battery, frequency or time, which
+# the plotting loops used to drop without a word).  With 'memory', tracemalloc records
+# the peak of traced memory reached in each stage; it slows the run down noticeably.
+#
+# Usage:
+#
+#   profile = sondehub_profile.Profile()
+#   with profile.stage('filter'):
+#       data = sondehub_simplify.select(profile.iterate(packets, 'decode', 'packets seen'), 50)
+#   ...
+#   profile.report(sys.stderr)                 # or profile.report(f, 'json')
+#
+# Code that takes an optional profile uses OFF, which records nothing, when given None.
+
+import collections
+import contextlib
+import json
+import time
+
+# tracemalloc is imported by the Profiles that trace memory; the conversions only use OFF
+
+import sondehub_stream
+
+STAGES = ('fetch', 'decompress', 'decode', 'filter', 'points', 'write', 'export')
+FORMATS = ('text', 'json')
+
+# counts in the order they are reported
+COUNTS = ('sources', 'bytes downloaded', 'bytes read', 'json bytes', 'packets seen', 'duplicates',
+          'late', 'packets kept', 'track points', 'points', 'packets skipped')
+
+
+class Profile:
+    def __init__(self, memory=True):
+        self.memory = memory
+        self.seconds = collections.defaultdict(float)
+        self.peaks = collections.defaultdict(int)
+        self.counts = collections.Counter()
+        self._stack = ['other']
+        self._start = self._switched = time.perf_counter()
+        # tracing started here is stopped by uninstall(); a caller's own is left running
+        self._started_tracing = False
+        if memory:
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracing = True
+
+    # Charges the time (and memory peak) since the last switch to the current stage
+    def _switch(self):
+        now = time.perf_counter()
+        stage = self._stack[-1]
+        self.seconds[stage] += now - self._switched
+        self._switched = now
+        if self.memory:
+            import tracemalloc
+            peak = tracemalloc.get_traced_memory()[1]
+            if peak > self.peaks[stage]:
+                self.peaks[stage] = peak
+            tracemalloc.reset_peak()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        self._switch()
+        self._stack.append(name)
+        try:
+            yield
+        finally:
+            self._switch()
+            self._stack.pop()
+
+    def count(self, name, n=1):
+        self.counts[name] += n
+
+    # Yields the items of 'iterable', timing each step as 'stage' and counting the
+    # items as 'counter'
+    def iterate(self, iterable, stage, counter=None):
+        iterator = iter(iterable)
+        while True:
+            with self.stage(stage):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            if counter:
+                self.counts[counter] += 1
+            yield item
+
+    # Wraps a binary stream so its reads are timed as 'stage' and their bytes counted
+    # as 'counter'
+    def reader(self, fileobj, stage, counter):
+        return _Reader(self, fileobj, stage, counter)
+
+    # Has every raw stream sondehub_stream opens (files, responses, tar members) counted
+    # until uninstall()
+    def install(self):
+        sondehub_stream.raw_hook = self._raw
+
+    # Stops counting the streams, and tracing memory if this Profile started it; the
+    # report can still be written afterwards
+    def uninstall(self):
+        if sondehub_stream.raw_hook == self._raw:
+            sondehub_stream.raw_hook = None
+        if self._started_tracing:
+            import tracemalloc
+            self._switch()
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def _raw(self, fileobj):
+        import http.client
+        if isinstance(fileobj, http.client.HTTPResponse):
+            return self.reader(fileobj, 'fetch', 'bytes downloaded')
+        return self.reader(fileobj, 'fetch', 'bytes read')
+
+    # The figures so far as a dict: total seconds, overall peak, then per stage and counts
+    def results(self):
+        self._switch()
+        stages = {name: {'seconds': self.seconds[name], 'peak_bytes': self.peaks[name] if self.memory else None}
+                  for name in STAGES + ('other',)}
+        counts = {name: self.counts[name] for name in COUNTS if name in self.counts}
+        counts.update((name, n) for name, n in self.counts.items() if name not in counts)
+        return {'seconds': time.perf_counter() - self._start,
+                'peak_bytes': max(self.peaks.values(), default=0) if self.memory else None,
+                'stages': stages, 'counts': counts}
+
+    # Writes the results to 'out' as a human readable table ('text') or as json
+    def report(self, out, format='text'):
+        results = self.results()
+        if format == 'json':
+            json.dump(results, out, indent=1)
+            out.write('\n')
+            return
+        total = results['seconds']
+        out.write('Profile: {0:.3f} s'.format(total))
+        if self.memory:
+            out.write(', peak traced memory {0:.1f} MB'.format(results['peak_bytes'] / 1e6))
+        out.write('\n  {0:<11} {1:>9} {2:>6} {3:>9}\n'.format('stage', 'seconds', 'share', 'peak MB'))
+        for name, stage in results['stages'].items():
+            peak = '{0:9.1f}'.format(stage['peak_bytes'] / 1e6) if self.memory else '{0:>9}'.format('-')
+            out.write('  {0:<11} {1:9.3f} {2:6.1%} {3}\n'.format(
+                name, stage['seconds'], stage['seconds'] / total if total else 0, peak))
+        for name, n in results['counts'].items():
+            out.write('  {0:<17} {1:>12,}\n'.format(name, n))
+
+
+class _Reader:
+    def __init__(self, profile, fileobj, stage, counter):
+        self._profile = profile
+        self._fileobj = fileobj
+        self._stage = stage
+        self._counter = counter
+
+    def read(self, size=-1):
+        with self._profile.stage(self._stage):
+            data = self._fileobj.read(size)
+        self._profile.counts[self._counter] += len(data)
+        return data
+
+    def close(self):
+        self._fileobj.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# Stands in for a Profile when none is given; records nothing
+class _Off:
+    def stage(self, name):
+        return contextlib.nullcontext()
+
+    def count(self, name, n=1):
+        pass
+
+    def iterate(self, iterable, stage, counter=None):
+        return iterable
+
+    def reader(self, fileobj, stage, counter):
+        return fileobj
+
+
+OFF = _Off()
+
+
+# Stands in for a Profile when only the counts are wanted (the pool converter reports
+# the packets read); times nothing
+class Counts(_Off):
+    def __init__(self):
+        self.counts = collections.Counter()
+
+    def count(self, name, n=1):
+        self.counts[name] += n
+
+    def iterate(self, iterable, stage, counter=None):
+        return self._counting(iterable, counter) if counter else iterable
+
+    def _counting(self, iterable, counter):
+        for item in iterable:
+            self.counts[counter] += 1
+            yield item
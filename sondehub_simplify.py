@@ -0,0 +1,189 @@
+#####################################################################################
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License v3 as published by
+# the Free Software Foundation.
+#####################################################################################
+# Shape-preserving track simplification, an alternative to keeping every 50th packet.
+#
+# Taking every 50th packet keeps far too many points on the slow float down and drops
+# the burst and any sharp turns.  The two classic line simplifiers below work in 3D
+# (lon/lat are projected to metres around the launch site so they weigh the same as
+# altitude) and always keep launch, burst (highest point) and landing:
+#
+#  'vw'   Visvalingam-Whyatt: repeatedly drops the point spanning the smallest triangle
+#         with its neighbours.  A heap keeps this O(n log n).
+#  'rdp'  Ramer-Douglas-Peucker: repeatedly splits at the point furthest from the chord,
+#         biggest error first.  O(n log n) for real tracks (splits land near the
+#         middle), degrading towards O(n^2) only for pathological zig-zags.
+#
+# Stop at a target point count or at an error tolerance in metres (for 'vw' the triangle
+# area is compared against tolerance squared), whichever comes first.  With neither, the
+# track keeps as many points as every-50th sampling would.
+#
+# Usage:
+#
+#   data = sondehub_simplify.select(sondehub_stream.iter_packets(jsonFile), method='vw', target=500)
+
+import heapq
+import math
+
+import sondehub_columns
+import sondehub_stream
+
+METHODS = ('vw', 'rdp')
+
+# Metres per degree of latitude; longitude is scaled by cos(latitude) on top
+_M_PER_DEG = 111320.0
+
+
+# Projects (lon, lat, alt) tuples to (x, y, z) metres around the first point
+def project(coords):
+    if not coords:
+        return []
+    lon0, lat0 = coords[0][0], coords[0][1]
+    kx = _M_PER_DEG * math.cos(math.radians(lat0))
+    return [((lon - lon0) * kx, (lat - lat0) * _M_PER_DEG, alt) for lon, lat, alt in coords]
+
+
+# Returns the sorted indices of the points of 'coords' ((lon, lat, alt) tuples) to keep.
+# Launch, burst and landing are always kept, as are the indices in 'keep'.
+def simplify(coords, method='vw', target=None, tolerance=None, keep=()):
+    n = len(coords)
+    if method not in METHODS:
+        raise ValueError('Unknown simplification method "{0}"; use one of {1}'.format(method, ', '.join(METHODS)))
+    if n <= 2:
+        return list(range(n))
+    if target is None and tolerance is None:
+        target = (n + 49) // 50
+    burst = max(range(n), key=lambda i: coords[i][2])
+    fixed = {0, n - 1, burst}
+    fixed.update(i for i in keep if 0 <= i < n)
+    points = project(coords)
+    if method == 'vw':
+        return _visvalingam(points, fixed, target, tolerance)
+    return _douglas_peucker(points, fixed, target, tolerance)
+
+
+# Picks the packets worth drawing out of 'data' (a sondehub_columns.Packets).
+# Packets without a position are dropped first.
+def simplify_columns(data, method='vw', target=None, tolerance=None):
+    data = data.take(data.present('lon') & data.present('lat') & data.present('alt'))
+    coords = list(zip(data['lon'].tolist(), data['lat'].tolist(), data['alt'].tolist()))
+    return data.take(simplify(coords, method, target, tolerance))
+
+
+# select() for a flight already held as columns
+def select_columns(data, step=50, method=None, target=None, tolerance=None):
+    if method:
+        return simplify_columns(data, method, target, tolerance)
+    return data.take(slice(None, None, step))
+
+
+# The selection stage between parsing and the kml: every 'step'th packet, or the
+# simplified track when a 'method' is given.  Returns a sondehub_columns.Packets.
+# Only the packets kept by 'step' are ever turned into columns; simplifying needs the
+# whole flight, held as columns.
+def select(packets, step=50, method=None, target=None, tolerance=None):
+    if method:
+        return simplify_columns(sondehub_columns.Packets.from_packets(packets), method, target, tolerance)
+    return sondehub_columns.Packets.from_packets(sondehub_stream.sample(packets, step))
+
+
+def _sub(a, b):
+    return (a[0] - b[0], a[1] - b[1], a[2] - b[2])
+
+
+def _cross_norm(u, v):
+    cx = u[1] * v[2] - u[2] * v[1]
+    cy = u[2] * v[0] - u[0] * v[2]
+    cz = u[0] * v[1] - u[1] * v[0]
+    return math.sqrt(cx * cx + cy * cy + cz * cz)
+
+
+def _area(a, b, c):
+    return 0.5 * _cross_norm(_sub(b, a), _sub(c, a))
+
+
+def _visvalingam(points, fixed, target, tolerance):
+    n = len(points)
+    prev = list(range(-1, n - 1))
+    nxt = list(range(1, n + 1))
+    alive = [True] * n
+    # area currently on the heap for each point; stale heap entries are skipped
+    area = [0.0] * n
+    heap = []
+    for i in range(1, n - 1):
+        if i not in fixed:
+            area[i] = _area(points[i - 1], points[i], points[i + 1])
+            heap.append((area[i], i))
+    heapq.heapify(heap)
+    limit = tolerance * tolerance if tolerance is not None else None
+    remaining = n
+    while heap:
+        if target is not None and remaining <= target:
+            break
+        a, i = heapq.heappop(heap)
+        if not alive[i] or a != area[i]:
+            continue
+        if limit is not None and a >= limit:
+            break
+        alive[i] = False
+        remaining -= 1
+        p, q = prev[i], nxt[i]
+        nxt[p] = q
+        prev[q] = p
+        # the neighbours now span new triangles; never let them drop below the area just
+        # removed so the elimination order stays monotonic
+        for j in (p, q):
+            if j in fixed or prev[j] < 0 or nxt[j] >= n:
+                continue
+            area[j] = max(_area(points[prev[j]], points[j], points[nxt[j]]), a)
+            heapq.heappush(heap, (area[j], j))
+    return [i for i in range(n) if alive[i]]
+
+
+def _douglas_peucker(points, fixed, target, tolerance):
+    kept = set(fixed)
+    anchors = sorted(fixed)
+    # max-heap (negated) of segments by their furthest point: (-distance, start, end, index)
+    heap = []
+
+    def push(start, end):
+        if end - start < 2:
+            return
+        # squared distances to the chord, inlined: this loop is where RDP spends its time
+        ax, ay, az = points[start]
+        bx, by, bz = points[end]
+        dx, dy, dz = bx - ax, by - ay, bz - az
+        length2 = dx * dx + dy * dy + dz * dz
+        best, index = -1.0, -1
+        for i in range(start + 1, end):
+            px, py, pz = points[i]
+            px -= ax
+            py -= ay
+            pz -= az
+            t = (px * dx + py * dy + pz * dz) / length2 if length2 else 0.0
+            if t > 1.0:
+                t = 1.0
+            elif t < 0.0:
+                t = 0.0
+            px -= t * dx
+            py -= t * dy
+            pz -= t * dz
+            d2 = px * px + py * py + pz * pz
+            if d2 > best:
+                best, index = d2, i
+        heapq.heappush(heap, (-math.sqrt(best), start, end, index))
+
+    for start, end in zip(anchors, anchors[1:]):
+        push(start, end)
+    while heap:
+        if target is not None and len(kept) >= target:
+            break
+        d, start, end, index = heapq.heappop(heap)
+        if tolerance is not None and -d <= tolerance:
+            break
+        kept.add(index)
+        push(start, index)
+        push(index, end)
+    return sorted(kept)
@@ -0,0 +1,322 @@
+#####################################################################################
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License v3 as published by
+# the Free Software Foundation.
+#####################################################################################
+# Streaming ingest for the SondeHub_json2kml scripts.
+#
+# The sonde history served by the SondeHub API (and the json exported from Grafana)
+# is one big json array of packets.  json.load() has to parse the whole thing into a
+# list of dicts before the scripts look at a single record, and the scripts then keep
+# only every 50th packet.  The helpers here read the array one packet at a time from
+# the HTTP stream or a local file so memory stays bounded no matter how long the
+# flight is.
+#
+# Compressed input (gzip, bzip2, xz and, when the 'zstandard' module is installed, zstd)
+# is detected from its first bytes and decompressed as a stream straight into the json
+# reader; nothing is inflated to memory or a temp file first.  A directory or tarball of
+# per-sonde archives can be read in one run with open_sources().
+#
+# Usage from a script:
+#
+#   import sondehub_stream
+#   with sondehub_stream.open_source(inputFile) as jsonFile:
+#       data = list(sondehub_stream.sample(sondehub_stream.iter_packets(jsonFile), 50))
+
+import codecs
+import io
+import json
+import os
+from itertools import islice
+
+# The network, tarball and decompression modules are imported where they are first
+# needed: converting a plain local file shouldn't pay for loading urllib or lzma.
+
+# Url the v2/v3/v3-2 scripts pull a sonde history from; the serial is appended.
+# Set SONDEHUB_API_URL to point the scripts at a mirror or a local stand-in server.
+API_URL = os.environ.get('SONDEHUB_API_URL', "https://api.v2.sondehub.org/sonde/")
+
+# Recent packets of sondes in flight ('/sondes/telemetry?serial=...&duration=...'), used
+# by the live watch mode; it sits next to API_URL unless SONDEHUB_TELEMETRY_URL says otherwise.
+TELEMETRY_URL = os.environ.get('SONDEHUB_TELEMETRY_URL',
+                               API_URL.rstrip('/').rsplit('/', 1)[0] + '/sondes/telemetry')
+
+# Older flights are no longer served by the API; they live gz'd in the SondeHub archive.
+# Pointing SONDEHUB_API_URL elsewhere turns the archive off unless SONDEHUB_ARCHIVE_URL is set.
+ARCHIVE_URL = os.environ.get('SONDEHUB_ARCHIVE_URL',
+                             '' if 'SONDEHUB_API_URL' in os.environ else
+                             "https://sondehub-history.s3.amazonaws.com/serial/{0}.json.gz")
+
+# File name endings picked up when reading a directory or a tarball of archives
+JSON_SUFFIXES = ('.json', '.json.gz', '.json.bz2', '.json.xz', '.json.zst', '.gz', '.bz2', '.xz', '.zst')
+TAR_SUFFIXES = ('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+# Directories left out when reading a directory: flights saved by sondehub_flightcache.py
+# (its SUFFIX), whose flight.json is not a sonde history
+COLUMNS_SUFFIX = '.columns'
+
+# Leading bytes of each compressed format
+_GZIP_MAGIC = b'\x1f\x8b'
+_BZ2_MAGIC = b'BZh'
+_XZ_MAGIC = b'\xfd7zXZ\x00'
+_ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+# Bytes read from the stream per chunk
+CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = " \t\n\r"
+# what may follow a value in the array
+_DELIMITERS = _WHITESPACE + ",]"
+# a json error this close to the end of the buffer may only mean the packet goes on in
+# the next chunk (a literal, number or escape cut short); it is far longer than those
+_TRUNCATED = 64
+
+# open_source() default: use the cache configured by the environment
+_ENVIRONMENT = object()
+
+# When set, every raw stream read (file, HTTP response, tar member) is passed through
+# raw_hook(stream) first; sondehub_profile counts the bytes read and downloaded this way
+raw_hook = None
+
+
+# Opens a local json file, a url or a radiosonde serial (looked up on the SondeHub
+# API) and returns a binary file-like object with any compression already undone.
+# Use it in a 'with' block.  Serials go through the on-disk cache in sondehub_cache.py
+# (set up from the SONDEHUB_CACHE* environment variables) unless 'cache' is None.
+def open_source(source, cache=_ENVIRONMENT):
+    if os.path.exists(source):
+        return decompress(open(source, 'rb'))
+    if source.startswith(('http://', 'https://')):
+        return decompress(_urlopen(source))
+    import urllib.error
+    if cache is _ENVIRONMENT:
+        # imported here; sondehub_cache itself builds on this module
+        import sondehub_cache
+        cache = sondehub_cache.from_environment()
+    if cache is not None:
+        return _open_cached(source, cache)
+    jsonFile = decompress(_urlopen(API_URL + source))
+    # the API answers '[]' for flights that have been moved to the archive
+    if ARCHIVE_URL and _peek(jsonFile, 64).strip() in (b'', b'[]'):
+        jsonFile.close()
+        try:
+            return decompress(_urlopen(ARCHIVE_URL.format(source)))
+        except urllib.error.HTTPError:
+            return io.BytesIO(b'[]')
+    return jsonFile
+
+
+# open_source() for a serial when there is a cache: answers from the cache when the
+# sonde has landed or we're offline, otherwise revalidates or downloads into it
+def _open_cached(serial, cache):
+    import urllib.error
+    entry = cache.lookup(serial)
+    if cache.usable_offline(entry):
+        return cache.open(cache.revalidated(entry, checked=False))
+    if cache.offline:
+        raise FileNotFoundError('"' + serial + '" is not in the cache (offline mode)')
+    url = API_URL + serial
+    try:
+        response = _urlopen(url, cache.request_headers(entry))
+    except urllib.error.HTTPError as e:
+        if e.code == 304 and entry is not None:
+            return cache.open(cache.revalidated(entry))
+        raise
+    with response:
+        entry = cache.store(serial, _hooked(response), response.headers, url)
+    # the API answers '[]' for flights that have been moved to the archive
+    if entry.empty and ARCHIVE_URL:
+        url = ARCHIVE_URL.format(serial)
+        try:
+            with _urlopen(url) as response:
+                entry = cache.store(serial, _hooked(response), response.headers, url, immutable=True)
+        except urllib.error.HTTPError:
+            pass
+    return cache.open(entry)
+
+
+# Yields (name, file) for every flight in 'source': each json file in a directory,
+# each json member of a tarball (read as a stream, never unpacked to disk) or the
+# single file/url/serial handled by open_source().  Close each file when done with it.
+def open_sources(source):
+    if os.path.isdir(source):
+        for root, dirs, files in os.walk(source):
+            # flights saved as columns next to the json (--save-columns) aren't json
+            dirs[:] = sorted(name for name in dirs if not name.endswith(COLUMNS_SUFFIX))
+            for name in sorted(files):
+                if name.lower().endswith(JSON_SUFFIXES):
+                    path = os.path.join(root, name)
+                    yield path, decompress(open(path, 'rb'))
+    elif os.path.isfile(source) and source.lower().endswith(TAR_SUFFIXES):
+        import tarfile
+        # 'r|*' reads the tarball front to back with transparent decompression
+        with tarfile.open(source, mode='r|*') as tar:
+            for member in tar:
+                if member.isfile() and member.name.lower().endswith(JSON_SUFFIXES):
+                    yield member.name, decompress(tar.extractfile(member))
+    else:
+        yield source, open_source(source)
+
+
+# Wraps a binary file object so that gzip, bzip2, xz or zstd payloads come out as
+# plain json.  Uncompressed input is returned as it is.
+def decompress(fileobj):
+    fileobj = buffered(_hooked(fileobj))
+    magic = _peek(fileobj, 6)
+    if magic.startswith(_GZIP_MAGIC):
+        import gzip
+        reader = gzip.GzipFile(fileobj=fileobj, mode='rb')
+    elif magic.startswith(_BZ2_MAGIC):
+        import bz2
+        reader = bz2.BZ2File(fileobj)
+    elif magic.startswith(_XZ_MAGIC):
+        import lzma
+        reader = lzma.LZMAFile(fileobj)
+    elif magic.startswith(_ZSTD_MAGIC):
+        try:
+            import zstandard
+        except ImportError:
+            fileobj.close()
+            raise RuntimeError("zstd compressed input needs the 'zstandard' module (pip install zstandard)")
+        reader = zstandard.ZstdDecompressor().stream_reader(fileobj)
+    else:
+        return fileobj
+    # the decompressors leave the stream they read from open; close both together
+    return io.BufferedReader(_RawReader(reader, fileobj))
+
+
+# True when a buffered binary stream starts with one of the compressed formats above
+def is_compressed(fileobj):
+    return _peek(fileobj, 6).startswith((_GZIP_MAGIC, _BZ2_MAGIC, _XZ_MAGIC, _ZSTD_MAGIC))
+
+
+# Returns 'fileobj' with a peek() method, wrapping it in a buffer when it has none
+def buffered(fileobj):
+    if hasattr(fileobj, 'peek'):
+        return fileobj
+    return io.BufferedReader(_RawReader(fileobj))
+
+
+# Asks the server for a gzip'd response; decompress() undoes it as the data streams in
+def _urlopen(url, headers=None):
+    import urllib.request
+    request = urllib.request.Request(url, headers=dict(headers or {}, **{'Accept-Encoding': 'gzip'}))
+    return urllib.request.urlopen(request)
+
+
+def _hooked(fileobj):
+    return raw_hook(fileobj) if raw_hook is not None else fileobj
+
+
+# Returns up to 'size' bytes from the front of a buffered stream without consuming them
+def _peek(fileobj, size):
+    # peek does at most one read of the underlying stream and may hand back more than asked
+    return fileobj.peek(size)[:size]
+
+
+# Minimal raw-stream adapter so io.BufferedReader can sit on any object with read().
+# Closing it closes 'reader' and any streams passed after it.
+class _RawReader(io.RawIOBase):
+    def __init__(self, reader, *inner):
+        self._reader = reader
+        self._inner = inner
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        data = self._reader.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self._reader.close()
+            for fileobj in self._inner:
+                fileobj.close()
+        super().close()
+
+
+# Yields the packets (dicts) of a top-level json array one at a time.
+# 'jsonFile' may be opened in binary or text mode; binary is decoded as UTF-8.
+# Malformed json raises ValueError as soon as the bad part has been read, so a corrupt
+# file is never read into memory to the end first.
+def iter_packets(jsonFile, chunk_size=CHUNK_SIZE):
+    decoder = json.JSONDecoder()
+    incremental = codecs.getincrementaldecoder('utf-8')()
+    buf = ''
+    pos = 0
+    eof = False
+    started = False
+    # what comes next: a packet (or the ']' of an empty array), a ',' or ']', or after
+    # a ',' a packet only
+    expect = 'first'
+    count = 0
+
+    def more():
+        # Pulls the next chunk into 'buf'; returns False once the stream is exhausted
+        nonlocal buf, pos, eof
+        while True:
+            raw = jsonFile.read(chunk_size)
+            # a read can end inside a multibyte character, which then decodes to ''
+            # until the rest of it comes in; only an empty read is the end
+            chunk = incremental.decode(raw, final=not raw) if isinstance(raw, bytes) else raw
+            if chunk:
+                break
+            if not raw:
+                eof = True
+                return False
+        # drop what has already been parsed so the buffer never grows past a chunk or two
+        buf = buf[pos:] + chunk
+        pos = 0
+        return True
+
+    while True:
+        while pos < len(buf) and buf[pos] in _WHITESPACE:
+            pos += 1
+        if pos >= len(buf):
+            if more():
+                continue
+            if started:
+                raise ValueError("Unexpected end of json data; missing ']'")
+            return
+        if not started:
+            if buf[pos] != '[':
+                raise ValueError("Expected a json array of packets")
+            started = True
+            pos += 1
+            continue
+        if expect == 'separator':
+            if buf[pos] == ']':
+                return
+            if buf[pos] != ',':
+                raise ValueError("Expected ',' or ']' after packet {0}".format(count))
+            expect = 'packet'
+            pos += 1
+            continue
+        if buf[pos] == ']' and expect == 'first':
+            return
+        if buf[pos] in ',]':
+            raise ValueError("Expected a packet after packet {0}, found '{1}'".format(count, buf[pos]))
+        try:
+            packet, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError as e:
+            # the packet may just be split across chunks: the error is then at the end
+            # of what has been read, or in a string still open there.  Anywhere else the
+            # json is broken whatever follows.
+            if (e.pos >= len(buf) - _TRUNCATED or e.msg.startswith('Unterminated string')) and more():
+                continue
+            raise
+        # a number not followed by a delimiter may have been cut short ('2.' of '2.5e3')
+        if not eof and not isinstance(packet, (dict, list)) and (end == len(buf) or buf[end] not in _DELIMITERS):
+            if more():
+                continue
+        pos = end
+        expect = 'separator'
+        count += 1
+        yield packet
+
+
+# Keeps every 'step'th packet, starting with the first; the streaming equivalent of
+# 'for list in range(0,len(data),step)'.  Adjust step for more or less fidelity.
+def sample(packets, step=50):
+    return islice(packets, 0, None, step)
@@ -0,0 +1,91 @@
+#####################################################################################
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License v3 as published by
+# the Free Software Foundation.
+#####################################################################################
+# Fast timestamp parsing and formatting for SondeHub 'datetime' strings.
+#
+# v3 parsed every point's time with dateutil.parser.parse() and formatted it with
+# datetime.strftime(); dateutil is one of the slowest parsers around (~100 us a call)
+# and its import alone is noticeable.  SondeHub times are always ISO-8601 UTC in the
+# same shape ('2021-05-04T11:42:05.000000Z'), so:
+#
+#  * parse_many() converts a whole batch in one vectorised NumPy datetime64 call,
+#  * parse() handles one string with datetime.fromisoformat(),
+#  * dateutil is only imported for odd strings neither of those can read.
+#
+# Times are int64 microseconds since the epoch (UTC), a sortable numeric column;
+# MISSING (the NaT value) marks a missing or unreadable time.
+#
+# Run benchmarks/bench_timestamps.py for the per-packet cost of each path.
+
+import sys
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+MISSING = np.iinfo(np.int64).min
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+# fromisoformat() reads a trailing 'Z' itself from Python 3.11 on
+_FROMISO_Z = sys.version_info >= (3, 11)
+
+
+# One 'datetime' string -> microseconds since the epoch (MISSING if unreadable)
+def parse(text):
+    if type(text) is not str:
+        return MISSING
+    try:
+        dt = datetime.fromisoformat(text if _FROMISO_Z else text.replace('Z', '+00:00'))
+    except ValueError:
+        dt = _parse_slow(text)
+        if dt is None:
+            return MISSING
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    delta = dt - _EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+# A sequence of 'datetime' strings -> int64 array of microseconds since the epoch.
+# The usual '...Z' strings go through NumPy in one go; anything else through parse().
+def parse_many(texts):
+    clean = []
+    other = []
+    for i, text in enumerate(texts):
+        if type(text) is str and text.endswith('Z'):
+            clean.append(text[:-1])
+        else:
+            clean.append('NaT')
+            other.append(i)
+    try:
+        micros = np.array(clean, dtype='datetime64[us]').astype(np.int64)
+    except ValueError:
+        # something numpy can't read; do the lot one at a time
+        return np.array([parse(text) for text in texts], dtype=np.int64)
+    for i in other:
+        micros[i] = parse(texts[i])
+    return micros
+
+
+# int64 microseconds -> 'YYYY-MM-DD HH:MM:SS UTC' strings, the format the
+# descriptions have always used (strftime('%Y-%m-%d %H:%M:%S %Z') of a UTC time)
+def format_many(micros):
+    seconds = np.asarray(micros, dtype=np.int64).astype('datetime64[us]').astype('datetime64[s]')
+    return [text.replace('T', ' ') + ' UTC' for text in np.datetime_as_string(seconds).tolist()]
+
+
+# Microseconds since the epoch -> aware UTC datetime
+def to_datetime(micros):
+    return _EPOCH + timedelta(microseconds=int(micros))
+
+
+def _parse_slow(text):
+    try:
+        import dateutil.parser
+    except ImportError:
+        return None
+    try:
+        return dateutil.parser.parse(text)
+    except (ValueError, OverflowError):
+        return None
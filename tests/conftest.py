@@ -0,0 +1,54 @@
+#####################################################################################
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License v3 as published by
+# the Free Software Foundation.
+#####################################################################################
+# The sondehub_*.py modules sit next to the scripts, at the top of the checkout, and
+# the stand-in server and flight generator in tools/ and benchmarks/.  The fixtures
+# below serve synthetic flights from the stand-in server, so no test needs the network.
+#
+# Usage:
+#   python3 -m pytest tests
+
+import os
+import sys
+import threading
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+for path in (ROOT, os.path.join(ROOT, 'tools'), os.path.join(ROOT, 'benchmarks')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import flightgen
+import sondehub_standin
+
+
+# Directory of canned flights, as tools/sondehub_standin.py serves them: V0000001 and
+# V0000002, 600 packets each (duplicates and all, see benchmarks/flightgen.py)
+@pytest.fixture
+def canned(tmp_path):
+    directory = tmp_path / 'canned'
+    directory.mkdir()
+    for serial in ('V0000001', 'V0000002'):
+        flightgen.write_flight(str(directory / (serial + '.json')), 600, serial=serial)
+    return directory
+
+
+# Starts the stand-in SondeHub API on a free port; standin(directory, **options) returns
+# the server (its url is server.url), which is shut down after the test
+@pytest.fixture
+def standin():
+    servers = []
+
+    def start(directory, **options):
+        server = sondehub_standin.make_server(str(directory), **options)
+        server.url = 'http://{0}:{1}/sonde/'.format(*server.server_address)
+        threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+        servers.append(server)
+        return server
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
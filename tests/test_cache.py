@@ -0,0 +1,124 @@
+#####################################################################################
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License v3 as published by
+# the Free Software Foundation.
+#####################################################################################
+# sondehub_cache.Cache: storing without parsing, the newest packet time recorded while
+# the conversion reads the body, validators and 304s, landed sondes and LRU eviction.
+
+import gzip
+import io
+import json
+import time
+
+import sondehub_cache
+import sondehub_stream
+import sondehub_time
+
+# the newest packet is the second: compared as strings '...:05.123Z' < '...:05Z'
+PACKETS = [{'serial': 'S1', 'datetime': '2021-05-04T12:00:05Z', 'frame': 1},
+           {'serial': 'S1', 'datetime': '2021-05-04T12:00:05.123Z', 'frame': 2},
+           {'serial': 'S1', 'datetime': '2021-05-04T11:59:59.999999Z', 'frame': 3}]
+NEWEST = sondehub_time.parse('2021-05-04T12:00:05.123Z') / 1e6
+
+
+def body(packets=PACKETS):
+    return io.BytesIO(json.dumps(packets).encode())
+
+
+def read(cache, entry):
+    with cache.open(entry) as jsonFile:
+        return list(sondehub_stream.iter_packets(jsonFile))
+
+
+def test_round_trip(tmp_path):
+    cache = sondehub_cache.Cache(str(tmp_path))
+    entry = cache.store('S1', body(), {'ETag': '"abc"', 'Last-Modified': 'Tue, 04 May 2021 12:00:00 GMT'})
+    # plain json is gzip'd on the way to disk
+    with open(entry.path, 'rb') as f:
+        assert f.read(2) == b'\x1f\x8b'
+    assert read(cache, cache.lookup('S1')) == PACKETS
+    assert cache.request_headers(cache.lookup('S1')) == {
+        'If-None-Match': '"abc"', 'If-Modified-Since': 'Tue, 04 May 2021 12:00:00 GMT'}
+    assert cache.lookup('S2') is None
+    assert cache.request_headers(None) == {}
+
+
+def test_gzip_body_kept_as_is(tmp_path):
+    cache = sondehub_cache.Cache(str(tmp_path))
+    compressed = gzip.compress(json.dumps(PACKETS).encode())
+    entry = cache.store('S1', io.BytesIO(compressed))
+    with open(entry.path, 'rb') as f:
+        assert f.read() == compressed
+
+
+# store() doesn't parse the body; the newest time is taken as it is read back, and
+# compared as a time, not as a string
+def test_newest_packet_recorded_on_read(tmp_path):
+    cache = sondehub_cache.Cache(str(tmp_path))
+    entry = cache.store('S1', io.BytesIO(b'[{"datetime": "2021-05-04T12:00:05Z"}, not json at all'))
+    assert entry.meta['last_packet'] is None and not entry.empty
+
+    entry = cache.store('S1', body())
+    assert cache.lookup('S1').meta['last_packet'] is None
+    read(cache, entry)
+    meta = cache.lookup('S1').meta
+    assert meta['last_packet'] == NEWEST
+    # from 2021: landed long ago, never asked for again
+    assert meta['immutable']
+
+
+def test_newest_packet_across_chunks(tmp_path):
+    cache = sondehub_cache.Cache(str(tmp_path))
+    packets = [{'datetime': '2021-05-04T12:%02d:%02d.5Z' % (i // 60, i % 60), 'comment': 'x' * (i % 97)}
+               for i in range(3000)]
+    entry = cache.store('S1', body(packets))
+    with cache.open(entry) as jsonFile:
+        assert len(list(sondehub_stream.iter_packets(jsonFile, chunk_size=100))) == 3000
+    assert cache.lookup('S1').meta['last_packet'] == sondehub_time.parse(packets[-1]['datetime']) / 1e6
+
+
+def test_partial_read_records_nothing(tmp_path):
+    cache = sondehub_cache.Cache(str(tmp_path))
+    packets = [{'datetime': '2021-05-04T12:00:%02dZ' % (i % 60)} for i in range(5000)]
+    entry = cache.store('S1', body(packets))
+    with cache.open(entry) as jsonFile:
+        next(sondehub_stream.iter_packets(jsonFile, chunk_size=100))
+    assert cache.lookup('S1').meta['last_packet'] is None
+
+
+def test_empty(tmp_path):
+    cache = sondehub_cache.Cache(str(tmp_path))
+    assert cache.store('S1', io.BytesIO(b' [ ] ')).empty
+    assert not cache.store('S2', body()).empty
+
+
+def test_in_flight_then_landed(tmp_path):
+    cache = sondehub_cache.Cache(str(tmp_path))
+    now = time.time()
+    stamp = lambda t: time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(t))
+    entry = cache.store('S1', body([{'datetime': stamp(now - 60)}]))
+    read(cache, entry)
+    entry = cache.lookup('S1')
+    assert not entry.immutable and not cache.usable_offline(entry)
+    # a 304 some hours later finds the sonde landed
+    cache.immutable_after = 30
+    assert cache.revalidated(entry).immutable
+    assert cache.usable_offline(cache.lookup('S1'))
+    assert sondehub_cache.Cache(str(tmp_path), offline=True).usable_offline(cache.lookup('S1'))
+
+
+def test_least_recently_used_evicted(tmp_path):
+    cache = sondehub_cache.Cache(str(tmp_path))
+    entries = [cache.store(serial, body()) for serial in ('S1', 'S2', 'S3')]
+    size = entries[0].meta['size']
+    # S1 used again: S2 is now the least recently used
+    time.sleep(0.01)
+    cache.revalidated(cache.lookup('S1'), checked=False)
+    cache.max_bytes = 2 * size
+    cache.evict()
+    assert [cache.lookup(serial) is not None for serial in ('S1', 'S2', 'S3')] == [True, False, True]
+    # the entry just stored is never evicted, even over the cap
+    cache.max_bytes = 0
+    cache.store('S4', body())
+    assert cache.lookup('S4') is not None and cache.lookup('S1') is None
@@ -0,0 +1,54 @@
+#####################################################################################
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License v3 as published by
+# the Free Software Foundation.
+#####################################################################################
+# sondehub_cli.main(): a serial that can't be downloaded is a one-line failure and a
+# non-zero exit, not a traceback.
+
+import socket
+
+import pytest
+
+import sondehub_cli
+import sondehub_stream
+
+
+# A url nothing listens on
+@pytest.fixture
+def closed_url():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    return 'http://127.0.0.1:{0}/sonde/'.format(port)
+
+
+@pytest.mark.parametrize('cache', ['off', 'on'])
+def test_network_failure(tmp_path, monkeypatch, capsys, closed_url, cache):
+    monkeypatch.setattr(sondehub_stream, 'API_URL', closed_url)
+    monkeypatch.setattr(sondehub_stream, 'ARCHIVE_URL', '')
+    monkeypatch.setenv('SONDEHUB_CACHE', cache)
+    monkeypatch.setenv('SONDEHUB_CACHE_DIR', str(tmp_path / 'cache'))
+    monkeypatch.chdir(tmp_path)
+    assert sondehub_cli.main(['V0000001']) == 1
+    out = capsys.readouterr().out
+    assert out.splitlines()[-1].startswith('Failed "V0000001": ')
+
+
+def test_offline_miss(tmp_path, monkeypatch, capsys):
+    monkeypatch.setenv('SONDEHUB_OFFLINE', '1')
+    monkeypatch.delenv('SONDEHUB_CACHE', raising=False)
+    monkeypatch.setenv('SONDEHUB_CACHE_DIR', str(tmp_path / 'cache'))
+    monkeypatch.chdir(tmp_path)
+    assert sondehub_cli.main(['V0000001']) == 1
+    assert 'not in the cache' in capsys.readouterr().out
+
+
+def test_watch_network_failure(tmp_path, monkeypatch, capsys, closed_url):
+    monkeypatch.setattr(sondehub_stream, 'API_URL', closed_url)
+    monkeypatch.setattr(sondehub_stream, 'ARCHIVE_URL', '')
+    monkeypatch.setattr(sondehub_stream, 'TELEMETRY_URL', closed_url)
+    monkeypatch.setenv('SONDEHUB_CACHE', 'off')
+    monkeypatch.chdir(tmp_path)
+    assert sondehub_cli.main(['V0000001', '--watch', '1']) == 1
+    assert capsys.readouterr().out.splitlines()[-1].startswith('Failed "V0000001": ')
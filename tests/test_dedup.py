@@ -0,0 +1,95 @@
+#####################################################################################
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License v3 as published by
+# the Free Software Foundation.
+#####################################################################################
+# sondehub_dedup.dedup(): time order through the reorder window, merged copies, late
+# and untimed packets, and the buffer bound.
+
+import flightgen
+import sondehub_dedup
+import sondehub_time
+
+
+def packet(second, frame=None, callsign='A', **fields):
+    p = {'serial': 'S1', 'datetime': '2021-05-04T12:%02d:%02dZ' % (second // 60, second % 60),
+         'uploader_callsign': callsign}
+    if frame is not None:
+        p['frame'] = frame
+    p.update(fields)
+    return p
+
+
+# Seconds after 12:00 of each packet
+def seconds(packets):
+    noon = sondehub_time.parse('2021-05-04T12:00:00Z')
+    return [(sondehub_time.parse(p['datetime']) - noon) // 1000000 for p in packets]
+
+
+def test_reordered_within_window():
+    packets = [packet(s, frame=s) for s in (0, 3, 1, 2, 6, 4, 5)]
+    stats = {}
+    out = list(sondehub_dedup.dedup(packets, window=10, stats=stats))
+    assert seconds(out) == [0, 1, 2, 3, 4, 5, 6]
+    assert stats == {'packets': 7, 'duplicates': 0, 'late': 0, 'untimed': 0}
+
+
+def test_copies_merged():
+    packets = [packet(0, frame=1, callsign='A', snr=10, temp=None),
+               packet(1, frame=2, callsign='A'),
+               packet(0, frame=1, callsign='B', snr=20, temp=-5.5, humidity=40)]
+    stats = {}
+    out = list(sondehub_dedup.dedup(packets, window=10, stats=stats))
+    assert [p['frame'] for p in out] == [1, 2]
+    first = out[0]
+    assert [u['uploader_callsign'] for u in first['uploaders']] == ['A', 'B']
+    assert [u['snr'] for u in first['uploaders']] == [10, 20]
+    # telemetry the first copy lacked comes from the other; receiver fields don't
+    assert first['temp'] == -5.5 and first['humidity'] == 40
+    assert first['uploader_callsign'] == 'A' and first['snr'] == 10
+    assert stats['duplicates'] == 1
+
+
+def test_without_frame_numbers_the_time_is_the_key():
+    out = list(sondehub_dedup.dedup([packet(0, callsign='A'), packet(0, callsign='B'), packet(1)], window=10))
+    assert seconds(out) == [0, 1] and len(out[0]['uploaders']) == 2
+
+
+def test_late_and_recent_copies():
+    # the window is 5 s: seconds 0 to 2 are passed on once second 20 comes in, so a new
+    # frame at second 1 is late, while a copy of frame 1 is still recognised as one
+    packets = [packet(s, frame=s) for s in (0, 1, 2, 20)] + [packet(1, frame=1, callsign='B'), packet(1, frame=99)]
+    stats = {}
+    out = list(sondehub_dedup.dedup(packets, window=5, stats=stats))
+    assert seconds(out) == [0, 1, 2, 20]
+    assert stats['duplicates'] == 1 and stats['late'] == 1
+
+
+def test_untimed_passed_on():
+    packets = [packet(5, frame=5), {'serial': 'S1', 'frame': 9}, packet(1, frame=1), 'not a packet']
+    stats = {}
+    out = list(sondehub_dedup.dedup(packets, window=10, stats=stats))
+    assert out[0] == {'serial': 'S1', 'frame': 9}
+    assert seconds(out[1:]) == [1, 5]
+    assert stats['untimed'] == 1 and stats['packets'] == 4
+
+
+def test_bounded_buffer():
+    # at most 3 packets wait, whatever the window: the oldest is passed on early, and
+    # what turns up older than it afterwards is late
+    packets = [packet(s, frame=s) for s in (5, 4, 3, 2, 1, 0)]
+    stats = {}
+    out = list(sondehub_dedup.dedup(packets, window=100, max_buffered=3, stats=stats))
+    assert seconds(out) == [2, 3, 4, 5]
+    assert stats['late'] == 2
+
+
+def test_synthetic_flight():
+    packets = list(flightgen.packets(3000))
+    stats = {}
+    out = list(sondehub_dedup.dedup(packets, stats=stats))
+    times = seconds(out)
+    assert times == sorted(times)
+    # every frame once; flightgen's copies are never further out of order than the window
+    assert sorted(p['frame'] for p in out) == sorted({p['frame'] for p in packets})
+    assert len(out) + stats['duplicates'] == len(packets) and stats['late'] == 0
@@ -0,0 +1,92 @@
+#####################################################################################
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License v3 as published by
+# the Free Software Foundation.
+#####################################################################################
+# sondehub_fetch.Fetcher against the stand-in server: keep-alive, retries, 304s and
+# closing the connections of every thread.
+
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import sondehub_cache
+import sondehub_fetch
+
+
+def fetcher(server, **options):
+    return sondehub_fetch.Fetcher(api_url=server.url, backoff=0, **options)
+
+
+def test_packets(canned, standin):
+    f = fetcher(standin(canned))
+    with open(canned / 'V0000001.json') as jsonFile:
+        expected = json.load(jsonFile)
+    assert f.packets('V0000001', step=50) == expected[::50]
+    assert f.packets('V0000001', step=1) == expected
+    f.close()
+
+
+def test_keep_alive(canned, standin):
+    server = standin(canned)
+    f = fetcher(server)
+    for serial in ('V0000001', 'V0000002', 'V0000001'):
+        assert f.packets(serial)
+    f.close()
+    assert server.requests == 3
+    assert server.connections == 1
+
+
+def test_unknown_serial(canned, standin):
+    f = fetcher(standin(canned))
+    assert f.packets('NOSUCH') == []
+    f.close()
+
+
+def test_gives_up_after_retries(canned, standin):
+    server = standin(canned, fail_rate=1.0)
+    f = fetcher(server, retries=2)
+    with pytest.raises(sondehub_fetch.FetchError, match='gave up after 3 attempts'):
+        f.packets('V0000001')
+    f.close()
+    assert server.requests == 3
+
+
+def test_retries_until_success(canned, standin, monkeypatch):
+    server = standin(canned, fail_rate=0.5)
+    # the stand-in fails every other request, starting with the first
+    answers = iter([0.0, 1.0] * 10)
+    monkeypatch.setattr('sondehub_standin.random.random', lambda: next(answers))
+    f = fetcher(server, retries=3)
+    assert f.packets('V0000001')
+    f.close()
+    assert server.requests == 2
+
+
+def test_not_modified(canned, standin, tmp_path):
+    server = standin(canned)
+    # the flight is from 2021; a huge immutable_after keeps it from counting as landed
+    cache = sondehub_cache.Cache(str(tmp_path / 'cache'), immutable_after=1e12)
+    f = fetcher(server, cache=cache)
+    first = f.packets('V0000001', step=1)
+    assert cache.lookup('V0000001').meta['etag']
+    # revalidated with If-None-Match: the server answers 304 and the cached body is used
+    assert f.packets('V0000001', step=1) == first
+    f.close()
+    assert server.requests == 2
+
+
+def test_close_reaches_every_thread(canned, standin):
+    server = standin(canned)
+    f = fetcher(server)
+    with ThreadPoolExecutor(4) as pool:
+        list(pool.map(f.packets, ['V0000001', 'V0000002'] * 4))
+    opened = list(f._open)
+    assert opened
+    f.close()
+    assert not f._open
+    assert all(conn.sock is None for conn in opened)
+    # a later download opens a new connection
+    assert f.packets('V0000001')
+    f.close()
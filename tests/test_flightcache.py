@@ -0,0 +1,133 @@
+#####################################################################################
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License v3 as published by
+# the Free Software Foundation.
+#####################################################################################
+# sondehub_flightcache: a flight saved as .columns loads back the same (values, ints,
+# nulls, times and strings), only .columns directories count as saved flights, and
+# re-rendering a saved flight writes the kml the json gives.
+
+import json
+import os
+
+import numpy as np
+import pytest
+
+import flightgen
+import sondehub_cli
+import sondehub_columns
+import sondehub_flightcache
+
+
+def awkward():
+    packets = list(flightgen.packets(500, serial='V0000001'))
+    packets[0]['alt'] = 700  # an int
+    packets[1]['batt'] = None
+    del packets[2]['lat']
+    packets[3]['subtype'] = 'RS41-SGP ü <b>'
+    packets[4]['datetime'] = 'not a time'
+    del packets[5]['manufacturer']
+    return packets
+
+
+def assert_same(a, b):
+    assert len(a) == len(b)
+    for name in sondehub_columns.FLOAT_FIELDS:
+        np.testing.assert_array_equal(a.floats[name], b.floats[name])
+        np.testing.assert_array_equal(a.ints[name], b.ints[name])
+        np.testing.assert_array_equal(a.nulls[name], b.nulls[name])
+    np.testing.assert_array_equal(a.time, b.time)
+    for name in sondehub_columns.STRING_FIELDS:
+        assert [a.string(name, i) for i in range(len(a))] == [b.string(name, i) for i in range(len(b))]
+
+
+@pytest.mark.parametrize('mmap', [True, False])
+def test_round_trip(tmp_path, mmap):
+    data = sondehub_columns.Packets.from_packets(awkward())
+    path = sondehub_flightcache.save(data, sondehub_flightcache.path_for('V0000001', str(tmp_path)), 'x.json')
+    assert path.endswith('V0000001.columns')
+    loaded = sondehub_flightcache.load(path, mmap=mmap)
+    assert_same(loaded, data)
+    assert loaded.ints['alt'][0] and loaded.values('alt')[0] == 700
+    assert loaded.nulls['batt'][1] and not loaded.present('batt')[1]
+    assert not loaded.present('lat')[2] and not loaded.nulls['lat'][2]
+    assert loaded.string('subtype', 3) == 'RS41-SGP ü <b>'
+    assert not loaded.present('datetime')[4]
+    assert loaded.string('manufacturer', 5) is None
+    # the subsets the sampling takes work on the mapped columns
+    assert_same(loaded.take(slice(0, None, 50)), data.take(slice(0, None, 50)))
+
+
+def test_empty(tmp_path):
+    data = sondehub_columns.Packets.from_packets([])
+    path = sondehub_flightcache.save(data, str(tmp_path / 'empty.columns'))
+    assert len(sondehub_flightcache.load(path)) == 0
+
+
+def test_save_replaces(tmp_path):
+    path = str(tmp_path / 'V0000001.columns')
+    sondehub_flightcache.save(sondehub_columns.Packets.from_packets(awkward()), path)
+    sondehub_flightcache.save(sondehub_columns.Packets.from_packets(awkward()[:10]), path)
+    assert len(sondehub_flightcache.load(path)) == 10
+    assert os.listdir(str(tmp_path)) == ['V0000001.columns']
+
+
+def test_is_saved(tmp_path):
+    path = sondehub_flightcache.save(sondehub_columns.Packets.from_packets(awkward()[:10]),
+                                     str(tmp_path / 'V0000001.columns'))
+    assert sondehub_flightcache.is_saved(path)
+    assert sondehub_flightcache.is_saved(path + os.sep)
+    # a directory of json files that happens to hold a flight.json isn't one
+    plain = tmp_path / 'flights'
+    plain.mkdir()
+    (plain / 'flight.json').write_text('[]')
+    assert not sondehub_flightcache.is_saved(str(plain))
+    # nor is a .columns directory without its flight.json
+    (tmp_path / 'other.columns').mkdir()
+    assert not sondehub_flightcache.is_saved(str(tmp_path / 'other.columns'))
+
+
+@pytest.mark.parametrize('meta', [[1, 2], 'flight', {'version': 99}, None])
+def test_load_rejects(tmp_path, meta):
+    path = sondehub_flightcache.save(sondehub_columns.Packets.from_packets(awkward()[:10]),
+                                     str(tmp_path / 'V0000001.columns'))
+    with open(os.path.join(path, 'flight.json'), 'w') as f:
+        if meta is None:
+            f.write('{not json')
+        else:
+            json.dump(meta, f)
+    with pytest.raises(ValueError):
+        sondehub_flightcache.load(path)
+
+
+def test_load_rejects_other_fields(tmp_path):
+    path = sondehub_flightcache.save(sondehub_columns.Packets.from_packets(awkward()[:10]),
+                                     str(tmp_path / 'V0000001.columns'))
+    with open(os.path.join(path, 'flight.json')) as f:
+        meta = json.load(f)
+    meta['float_fields'] = meta['float_fields'][:-1]
+    with open(os.path.join(path, 'flight.json'), 'w') as f:
+        json.dump(meta, f)
+    with pytest.raises(ValueError):
+        sondehub_flightcache.load(path)
+
+
+@pytest.mark.parametrize('options', [{}, {'step': 7}, {'simplify': 'vw', 'points': 40}, {'kmz': True},
+                                     {'focus': {'phase': 'descent'}}, {'focus': {'min_alt': 5000, 'max_alt': 20000}}])
+def test_render_saved(tmp_path, options):
+    source = str(tmp_path / 'V0000001.json')
+    with open(source, 'w') as f:
+        json.dump(awkward(), f)
+    direct, saved, again = (str(tmp_path / name) for name in ('direct', 'saved', 'again'))
+    for outdir in (direct, saved, again):
+        os.mkdir(outdir)
+    sondehub_cli.convert_source(source, outdir=direct, **options)
+    sondehub_cli.convert_source(source, outdir=saved, save_columns=True)
+    columns = os.path.join(saved, 'V0000001.columns')
+    assert sondehub_flightcache.is_saved(columns)
+    written = sondehub_cli.convert_source(columns, outdir=again, **options)
+    assert written
+    for name in os.listdir(direct):
+        with open(os.path.join(direct, name), 'rb') as a, open(os.path.join(again, name), 'rb') as b:
+            assert a.read() == b.read(), name
+    assert sorted(os.listdir(direct)) == sorted(os.listdir(again))
@@ -0,0 +1,155 @@
+#####################################################################################
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License v3 as published by
+# the Free Software Foundation.
+#####################################################################################
+# sondehub_index: every FlightIndex query (time window, altitude band, box, across the
+# antimeridian too, and their combinations) returns what a plain scan of the packets
+# does, and focus() cuts the flight at burst and landing.
+
+import numpy as np
+import pytest
+
+import flightgen
+import sondehub_columns
+import sondehub_index
+
+MINUTE = 60 * 1000000
+
+
+def flight(count=3000, shift=0.0):
+    packets = list(flightgen.packets(count))
+    for packet in packets:
+        packet['lon'] = (packet['lon'] + shift + 180) % 360 - 180
+    # a packet without a position isn't indexed
+    packets.append(dict(packets[0], lat=None, datetime='2021-05-04T10:00:00Z'))
+    return sondehub_index.FlightIndex(sondehub_columns.Packets.from_packets(packets))
+
+
+@pytest.fixture(scope='module')
+def index():
+    return flight()
+
+
+# The rows a scan of every packet picks
+def scan(index, start=None, end=None, min_alt=None, max_alt=None, bbox=None):
+    time, lon, lat, alt = index.data.time, index.data['lon'], index.data['lat'], index.data['alt']
+    keep = np.ones(len(index), dtype=bool)
+    if start is not None:
+        keep &= time >= start
+    if end is not None:
+        keep &= time <= end
+    if min_alt is not None:
+        keep &= alt >= min_alt
+    if max_alt is not None:
+        keep &= alt <= max_alt
+    if bbox is not None:
+        west, south, east, north = bbox
+        keep &= ((lon >= west) | (lon <= east)) if west > east else ((lon >= west) & (lon <= east))
+        keep &= (lat >= south) & (lat <= north)
+    return np.flatnonzero(keep)
+
+
+def test_built(index):
+    assert len(index) == 3000
+    assert np.all(np.diff(index.data.time) >= 0)
+    assert index.burst == int(np.argmax(index.data['alt']))
+    assert index.position(index.burst)[2] > 29000
+    assert index.landing == len(index) - 1
+    assert 'Burst at' in index.summary()
+
+
+def test_no_filters(index):
+    assert np.array_equal(index.query(), np.arange(len(index)))
+
+
+@pytest.mark.parametrize('window', [(0, 10), (30, 31), (-5, 5), (140, 200), (None, 20), (100, None), (50, 40)])
+def test_time_window(index, window):
+    first = index.time(0)
+    start, end = (None if minutes is None else first + minutes * MINUTE for minutes in window)
+    rows = index.query(start=start, end=end)
+    assert np.array_equal(rows, scan(index, start=start, end=end))
+    if start is not None and end is not None and end >= start:
+        assert len(rows)
+
+
+def test_time_window_ends_included(index):
+    t = index.time(100)
+    rows = index.query(start=t, end=t)
+    assert len(rows) and all(index.time(i) == t for i in rows)
+
+
+@pytest.mark.parametrize('band', [(0, 1000), (10000, 12000), (30000, None), (None, 700), (5000, 4000), (40000, 50000)])
+def test_altitude_band(index, band):
+    rows = index.query(min_alt=band[0], max_alt=band[1])
+    assert np.array_equal(rows, scan(index, min_alt=band[0], max_alt=band[1]))
+
+
+@pytest.mark.parametrize('bbox', [(-3.6, 40.4, -3.4, 40.5), (-10, 30, 10, 50), (-3.0, 40.0, -2.0, 41.0),
+                                  (0, 0, 1, 1), (-3.58, 40.46, -3.58, 40.46)])
+def test_box(index, bbox):
+    lon, lat = index.data['lon'], index.data['lat']
+    assert np.array_equal(index.query(bbox=bbox), scan(index, bbox=bbox))
+    # a box around one packet finds it
+    i = 1234
+    around = (lon[i] - 1e-6, lat[i] - 1e-6, lon[i] + 1e-6, lat[i] + 1e-6)
+    assert i in index.query(bbox=around)
+
+
+def test_combined(index):
+    first = index.time(0)
+    options = dict(start=first + 20 * MINUTE, end=first + 120 * MINUTE, min_alt=8000, max_alt=25000,
+                   bbox=(-3.5, 40.0, -1.0, 41.0))
+    rows = index.query(**options)
+    assert len(rows)
+    assert np.array_equal(rows, scan(index, **options))
+
+
+def test_antimeridian():
+    index = flight(shift=183.5)
+    lon = index.data['lon']
+    assert lon.max() > 179 and lon.min() < -179
+    for bbox in [(179.0, 30, -179.0, 50), (179.9, 40.4, -179.9, 40.6), (170, -90, -170, 90), (179.5, 0, 179.9, 90)]:
+        rows = index.query(bbox=bbox)
+        assert np.array_equal(rows, scan(index, bbox=bbox))
+    assert len(index.query(bbox=(179.0, 30, -179.0, 50))) == len(index)
+
+
+def test_empty():
+    index = sondehub_index.FlightIndex(sondehub_columns.Packets.from_packets([]))
+    assert len(index) == 0 and index.burst is None
+    assert len(index.query(start=0, min_alt=0, bbox=(-180, -90, 180, 90))) == 0
+    assert len(sondehub_index.focus(index, phase='descent')) == 0
+    assert index.summary() == 'No positions'
+
+
+def test_focus_phases(index):
+    burst = index.time(index.burst)
+    ascent = sondehub_index.focus(index, phase='ascent')
+    descent = sondehub_index.focus(index, phase='descent')
+    assert index.burst in ascent and index.burst in descent
+    assert all(index.time(i) <= burst for i in ascent)
+    assert all(index.time(i) >= burst for i in descent)
+    assert descent[-1] == index.landing
+    assert len(np.union1d(ascent, descent)) == len(index)
+
+
+def test_focus_last(index):
+    landing = index.time(index.landing)
+    rows = sondehub_index.focus(index, last=600)
+    assert np.array_equal(rows, scan(index, start=landing - 600 * 1000000))
+    # the later of the two starts applies
+    assert np.array_equal(sondehub_index.focus(index, start=landing - 60 * 1000000, last=600),
+                          scan(index, start=landing - 60 * 1000000))
+
+
+def test_focus_combined(index):
+    rows = sondehub_index.focus(index, phase='descent', max_alt=5000, end=index.time(index.landing) - MINUTE)
+    assert np.array_equal(rows, scan(index, start=index.time(index.burst), max_alt=5000,
+                                     end=index.time(index.landing) - MINUTE))
+    assert len(rows) and rows[0] > index.burst
+
+
+def test_focus_unknown_phase(index):
+    with pytest.raises(ValueError):
+        sondehub_index.focus(index, phase='float')
@@ -0,0 +1,55 @@
+#####################################################################################
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License v3 as published by
+# the Free Software Foundation.
+#####################################################################################
+# The stream kml writer writes byte for byte what simplekml does, for both description
+# boxes, awkward values (markup, quotes, non-ASCII, nulls, missing fields, integers)
+# and several flights in one process.
+
+import pytest
+
+import flightgen
+import sondehub_columns
+import sondehub_convert
+import sondehub_stream
+
+pytest.importorskip('simplekml')
+
+
+# A sampled flight with the awkward values mixed in
+def flight(serial='V0000001', count=400):
+    packets = list(flightgen.packets(count, serial=serial))
+    for i, packet in enumerate(packets):
+        if i % 7 == 0:
+            packet['uploader_callsign'] = 'X&<\'"é]]> 東京'
+        if i % 11 == 0:
+            packet['batt'] = None
+        if i % 13 == 0:
+            packet.pop('temp', None)
+        if i % 17 == 0:
+            packet['alt'] = int(packet['alt'])
+        if i % 19 == 0:
+            packet['datetime'] = packet['datetime'].replace('T', ' ').replace('Z', '+00:00')
+        if i % 23 == 0:
+            packet.pop('lat')
+    return sondehub_columns.Packets.from_packets(sondehub_stream.sample(iter(packets), 3))
+
+
+@pytest.mark.parametrize('schema', [sondehub_convert.V32, sondehub_convert.V3], ids=['v3-2', 'v3'])
+def test_same_as_simplekml(tmp_path, schema, capsys):
+    outputs = {}
+    for writer in sondehub_convert.WRITERS:
+        outdir = tmp_path / writer
+        outdir.mkdir()
+        # several flights in one process: simplekml's ids are process-wide
+        for serial in ('V0000001', 'V0000002', 'V0000003'):
+            sondehub_convert.convert(flight(serial), str(outdir), writer=writer, schema=schema)
+        outputs[writer] = {path.name: path.read_bytes() for path in outdir.iterdir()}
+    assert len(outputs['stream']) == 3
+    assert outputs['stream'] == outputs['simplekml']
+
+
+def test_unknown_writer(tmp_path):
+    with pytest.raises(ValueError):
+        sondehub_convert.convert(flight(), str(tmp_path), writer='lxml')
@@ -0,0 +1,52 @@
+#####################################################################################
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License v3 as published by
+# the Free Software Foundation.
+#####################################################################################
+# sondehub_kmlwriter.KmzWriter: a well-formed doc.kml with the icon inside, the balloon
+# template built from the description (format specs applied to the point values) and
+# a title with markup kept out of the balloon's html.
+
+import zipfile
+from xml.dom import minidom
+
+import pytest
+
+import sondehub_kmlwriter
+
+DESCRIPTION = '<b>{0}</b> at {1:.0f} m, {2} V'
+FIELDS = (None, 'alt', 'batt')
+
+
+def write(path, title):
+    with sondehub_kmlwriter.KmzWriter(str(path), title, DESCRIPTION, FIELDS) as kmz:
+        kmz.linestring([(-3.5, 40.4, 1000.25), (-3.4, 40.5, 1200.75)])
+        kmz.point((-3.5, 40.4, 1000.25), (title, 1000.25, 2.9))
+        kmz.point((-3.4, 40.5, 1200.75), (title, 1200.75, None))
+    with zipfile.ZipFile(str(path)) as archive:
+        names = archive.namelist()
+        return names, minidom.parseString(archive.read('doc.kml'))
+
+
+def text(node):
+    return ''.join(child.data for child in node.childNodes if child.nodeType in (child.TEXT_NODE, child.CDATA_SECTION_NODE))
+
+
+def test_balloon_and_values(tmp_path):
+    names, doc = write(tmp_path / 'S1.kmz', 'S1')
+    assert names[0] == 'doc.kml' and 'files/wx.png' in names
+    balloon = text(doc.getElementsByTagName('BalloonStyle')[0].getElementsByTagName('text')[0])
+    assert balloon == '<b>S1</b> at $[alt] m, $[batt] V'
+    values = [(data.getAttribute('name'), text(data.getElementsByTagName('value')[0]))
+              for data in doc.getElementsByTagName('Data')]
+    # the '.0f' spec is applied to the value each point carries
+    assert values == [('alt', '1000'), ('batt', '2.9'), ('alt', '1201'), ('batt', 'None')]
+
+
+@pytest.mark.parametrize('title', ['X]]><script>alert(1)</script>', 'A&B "quoted" \'single\' 東京'])
+def test_title_with_markup(tmp_path, title):
+    names, doc = write(tmp_path / 'odd.kmz', title)
+    assert text(doc.getElementsByTagName('name')[0]) == title
+    balloon = text(doc.getElementsByTagName('BalloonStyle')[0].getElementsByTagName('text')[0])
+    # escaped for the html, so Earth shows the title as it is
+    assert balloon == '<b>{0}</b> at $[alt] m, $[batt] V'.format(sondehub_kmlwriter.escape(title))
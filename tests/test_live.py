@@ -0,0 +1,117 @@
+#####################################################################################
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License v3 as published by
+# the Free Software Foundation.
+#####################################################################################
+# sondehub_live against the stand-in server replaying a flight: the kml grows poll by
+# poll, and the update file, applied any number of times to the kml as loaded at any
+# point, ends up with the same placemarks as the kml itself.
+
+import time
+from xml.dom import minidom
+
+import pytest
+
+import sondehub_cli
+import sondehub_fetch
+import sondehub_live
+
+# the 9000 s synthetic flight plays back in 3 s
+REPLAY = 3000
+
+
+def placemark_ids(node):
+    return [p.getAttribute('id') for p in node.getElementsByTagName('Placemark')]
+
+
+# What Google Earth does with the <Update> at 'path' to a document holding the
+# placemarks 'ids': deletes and then creates by id
+def apply_update(path, ids):
+    update = minidom.parse(path).getElementsByTagName('Update')[0]
+    ids = list(ids)
+    for delete in update.getElementsByTagName('Delete'):
+        for p in delete.getElementsByTagName('Placemark'):
+            if p.getAttribute('targetId') in ids:
+                ids.remove(p.getAttribute('targetId'))
+    for create in update.getElementsByTagName('Create'):
+        ids.extend(placemark_ids(create))
+    return ids
+
+
+@pytest.fixture
+def watcher(tmp_path, canned, standin):
+    server = standin(canned, replay=REPLAY)
+    time.sleep(0.3)
+    fetcher = sondehub_fetch.Fetcher(api_url=server.url, retries=0)
+    yield sondehub_live.Watcher('V0000001', fetcher, step=5, outdir=str(tmp_path), interval=1)
+    fetcher.close()
+
+
+def test_update_is_cumulative_and_idempotent(tmp_path, watcher):
+    watcher.start()
+    kml = tmp_path / 'V0000001.kml'
+    update = str(tmp_path / 'V0000001_update.kml')
+    loaded = [placemark_ids(minidom.parse(str(kml)))]  # the kml as Earth may have loaded it
+    assert apply_update(update, loaded[0]) == loaded[0]
+    new = 0
+    for _ in range(4):
+        time.sleep(0.4)
+        new += watcher.poll()
+        document = minidom.parse(str(kml))
+        ids = placemark_ids(document)
+        assert len(set(ids)) == len(ids)
+        parsed = minidom.parse(update)
+        created = placemark_ids(parsed.getElementsByTagName('Create')[0])
+        deleted = [p.getAttribute('targetId') for delete in parsed.getElementsByTagName('Delete')
+                   for p in delete.getElementsByTagName('Placemark')]
+        assert deleted == created
+        loaded.append(ids)
+        for base in loaded:
+            once = apply_update(update, base)
+            assert sorted(once, key=int) == sorted(ids, key=int)
+            assert sorted(apply_update(update, once), key=int) == sorted(ids, key=int)
+    assert new > 0
+    assert watcher.seen > len(loaded[0])
+
+
+def test_nothing_new(tmp_path, canned, standin):
+    server = standin(canned)
+    fetcher = sondehub_fetch.Fetcher(api_url=server.url, retries=0)
+    watcher = sondehub_live.Watcher('V0000001', fetcher, outdir=str(tmp_path), interval=1)
+    watcher.start()
+    before = (tmp_path / 'V0000001.kml').read_bytes()
+    assert watcher.poll() == 0
+    assert (tmp_path / 'V0000001.kml').read_bytes() == before
+    assert apply_update(str(tmp_path / 'V0000001_update.kml'), ['6']) == ['6']
+    fetcher.close()
+
+
+def test_watch(tmp_path, canned, standin, capsys):
+    server = standin(canned, replay=REPLAY)
+    fetcher = sondehub_fetch.Fetcher(api_url=server.url, retries=0)
+    assert sondehub_live.watch('V0000001', 0.2, 5, str(tmp_path), polls=2, fetcher=fetcher) == 0
+    fetcher.close()
+    assert (tmp_path / 'V0000001_live.kml').exists()
+    assert 'V0000001_live.kml' in capsys.readouterr().out
+
+
+def test_watch_unknown_serial(tmp_path, canned, standin, capsys):
+    server = standin(canned)
+    fetcher = sondehub_fetch.Fetcher(api_url=server.url, retries=0)
+    assert sondehub_live.watch('V9999999', 0.2, outdir=str(tmp_path), polls=1, fetcher=fetcher) == 1
+    fetcher.close()
+    assert 'Failed "V9999999"' in capsys.readouterr().out
+
+
+@pytest.mark.parametrize('options', [['--kmz'], ['--simplify', 'vw'], ['--writer', 'simplekml'], ['--last', '10'],
+                                     ['--export', 'csv'], ['--merge', 'all.kml'], ['--profile']])
+def test_watch_rejects(options):
+    ap = sondehub_cli.parser()
+    args = ap.parse_args(['V0000001', '--watch'] + options)
+    with pytest.raises(SystemExit):
+        sondehub_cli.check_arguments(ap, args)
+
+
+def test_watch_accepts():
+    ap = sondehub_cli.parser()
+    sondehub_cli.check_arguments(ap, ap.parse_args(['V0000001', '--watch', '5', '--step', '10', '--dedup']))
@@ -0,0 +1,20 @@
+#####################################################################################
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License v3 as published by
+# the Free Software Foundation.
+#####################################################################################
+# SondeHub_json2kml_pool.py's source list: '-f -' reads stdin and leaves it open.
+
+import argparse
+import io
+import sys
+
+import SondeHub_json2kml_pool
+
+
+def test_sources_from_stdin(tmp_path, monkeypatch):
+    (tmp_path / 'a.json').write_text('[]')
+    monkeypatch.setattr(sys, 'stdin', io.StringIO('# serials\nV0000001\n\n{0}\n'.format(tmp_path)))
+    args = argparse.Namespace(sources=['V0000002'], file='-')
+    assert SondeHub_json2kml_pool.read_sources(args) == ['V0000002', 'V0000001', str(tmp_path / 'a.json')]
+    assert not sys.stdin.closed
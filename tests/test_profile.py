@@ -0,0 +1,49 @@
+#####################################################################################
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License v3 as published by
+# the Free Software Foundation.
+#####################################################################################
+# sondehub_profile: memory tracing ends with the Profile that started it, and
+# --profile-file is only taken with --profile.
+
+import io
+import tracemalloc
+
+import pytest
+
+import sondehub_cli
+import sondehub_profile
+
+
+def test_uninstall_stops_its_tracing():
+    assert not tracemalloc.is_tracing()
+    profile = sondehub_profile.Profile()
+    profile.install()
+    with profile.stage('decode'):
+        data = [str(n) for n in range(10000)]
+    profile.uninstall()
+    assert not tracemalloc.is_tracing()
+    out = io.StringIO()
+    profile.report(out)
+    assert 'peak traced memory' in out.getvalue()
+    assert profile.results()['stages']['decode']['peak_bytes'] > 0
+    del data
+
+
+def test_uninstall_leaves_callers_tracing():
+    tracemalloc.start()
+    try:
+        profile = sondehub_profile.Profile()
+        profile.install()
+        profile.uninstall()
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
+
+
+def test_profile_file_needs_profile(tmp_path):
+    ap = sondehub_cli.parser()
+    with pytest.raises(SystemExit):
+        sondehub_cli.check_arguments(ap, ap.parse_args(['V0000001', '--profile-file', str(tmp_path / 'p.txt')]))
+    sondehub_cli.check_arguments(ap, ap.parse_args(['V0000001', '--profile', 'json',
+                                                    '--profile-file', str(tmp_path / 'p.txt')]))
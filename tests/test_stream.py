@@ -0,0 +1,76 @@
+#####################################################################################
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License v3 as published by
+# the Free Software Foundation.
+#####################################################################################
+# sondehub_stream.iter_packets() against json.loads(), at tiny chunk sizes where every
+# read boundary falls somewhere awkward: inside a multibyte UTF-8 character (a read
+# that decodes to nothing is not the end of the stream) or inside a number ('2.'
+# followed by '5e3').  Malformed arrays must fail, and fail early.
+
+import io
+import json
+
+import pytest
+
+import sondehub_stream
+
+DOCUMENTS = [
+    '[{"serial": "S1", "uploader_callsign": "Zürich ☀ 東京 🎈", "alt": 2.5e3}]',
+    '[{"comment": "ñ"}, {"comment": "日本語"}, "é", "🎈🎈"]',
+    '[2.5e3, -7, 1E-2, 0.125, 12345678901234567890, 3]',
+    '[ 2.5 , -0.5 ,1e+3,\n4]',
+    '[{"a": [1, {"b": "x\\"]y"}]}, {"c": null, "d": true, "e": false}]',
+    '[]',
+    '  [ ]  ',
+]
+
+MALFORMED = ['[1 2 3]', '[,,1,,]', '[1,]', '[,]', '[1,,2]', '[{"a": 1}{"b": 2}]', '[{"a": 1},',
+             '[{"a": tru}]', '{"a": 1}', '[{"a": 1}']
+
+
+def read(document, chunk_size, binary):
+    stream = io.BytesIO(document.encode('utf-8')) if binary else io.StringIO(document)
+    return list(sondehub_stream.iter_packets(stream, chunk_size))
+
+
+@pytest.mark.parametrize('document', DOCUMENTS)
+@pytest.mark.parametrize('chunk_size', range(1, 9))
+@pytest.mark.parametrize('binary', [True, False])
+def test_same_as_json_loads(document, chunk_size, binary):
+    assert read(document, chunk_size, binary) == json.loads(document)
+
+
+@pytest.mark.parametrize('document', MALFORMED)
+@pytest.mark.parametrize('chunk_size', [1, 3, sondehub_stream.CHUNK_SIZE])
+def test_malformed(document, chunk_size):
+    with pytest.raises(ValueError):
+        read(document, chunk_size, True)
+
+
+# A syntax error near the start of a long stream is reported once the chunk holding it
+# is read, not after the rest of the file has been buffered
+def test_fails_early():
+    class Counting(io.BytesIO):
+        consumed = 0
+
+        def read(self, size=-1):
+            data = super().read(size)
+            Counting.consumed += len(data)
+            return data
+
+    stream = Counting(b'[{"a": 1}, {"a": bad}, ' + b'{"b": 2}, ' * 100000 + b'{}]')
+    with pytest.raises(ValueError):
+        list(sondehub_stream.iter_packets(stream, 4096))
+    assert Counting.consumed <= 2 * 4096
+
+
+def test_sample():
+    assert list(sondehub_stream.sample(iter(range(10)), 4)) == [0, 4, 8]
+
+
+def test_decompress_gzip():
+    import gzip
+    document = '[{"frame": 1}, {"frame": 2}]'
+    with sondehub_stream.decompress(io.BytesIO(gzip.compress(document.encode()))) as jsonFile:
+        assert list(sondehub_stream.iter_packets(jsonFile)) == json.loads(document)
@@ -0,0 +1,202 @@
+#####################################################################################
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License v3 as published by
+# the Free Software Foundation.
+#####################################################################################
+# Local stand-in for the SondeHub API, for trying the scripts without the network.
+#
+# Serves GET /sonde/<serial> from a directory of canned sonde json files named
+# <serial>.json or <serial>.json.gz.  Responses are gzip'd when the client asks for it,
+# carry ETag / Last-Modified validators (answering 304 to a matching If-None-Match) and
+# connections are kept alive (HTTP/1.1), like the real API.  --fail-rate makes a
+# share of requests answer 503 so retries can be exercised; --delay slows every reply.
+#
+# GET /sondes/telemetry?serial=<serial>&duration=<15m, 3h, ...> answers the packets of
+# the last 'duration' as {serial: {datetime: packet}}, like the API does for sondes in
+# flight.  With --replay SPEED the canned flights are played back as if launched when
+# the server started, SPEED times faster than real time: both endpoints only know the
+# packets "received" so far, which is what the live watch mode (--watch) is tried with.
+#
+# Usage:
+#   python3 tools/sondehub_standin.py canned/ --port 8000 &
+#   python3 SondeHub_json2kml_batch.py --api-url http://127.0.0.1:8000/sonde/ V3250858
+#   SONDEHUB_API_URL=http://127.0.0.1:8000/sonde/ python3 SondeHub_json2kml_v3-2.py V3250858
+#
+#   python3 tools/sondehub_standin.py canned/ --replay 20 &
+#   SONDEHUB_API_URL=http://127.0.0.1:8000/sonde/ python3 SondeHub_json2kml_v3-2.py V3250858 --watch 10
+
+import argparse
+import gzip
+import json
+import os
+import random
+import sys
+import threading
+import time
+import urllib.parse
+from datetime import datetime
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    # one handler per connection: counted so the tests can check keep-alive
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests += 1
+        if server.delay:
+            time.sleep(server.delay)
+        if server.fail_rate and random.random() < server.fail_rate:
+            return self.reply(503, b'{"message": "stand-in failure"}')
+        url = urllib.parse.urlsplit(self.path)
+        if url.path == '/sondes/telemetry':
+            return self.telemetry(urllib.parse.parse_qs(url.query))
+        if not url.path.startswith('/sonde/'):
+            return self.reply(404, b'{"message": "not found"}')
+        path = self.find(urllib.parse.unquote(url.path[len('/sonde/'):]))
+        if path is None:
+            # the API answers an empty list for serials it doesn't know
+            return self.reply(200, b'[]')
+        if server.replay:
+            packets = [packet for when, packet in self.flight(path) if when <= self.replay_time(path)]
+            return self.reply(200, json.dumps(packets).encode())
+        stat = os.stat(path)
+        etag = '"{0:x}-{1:x}"'.format(int(stat.st_mtime), stat.st_size)
+        validators = {'ETag': etag, 'Last-Modified': formatdate(stat.st_mtime, usegmt=True)}
+        if self.headers.get('If-None-Match') == etag:
+            return self.reply(304, b'', validators)
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rb') as f:
+            self.reply(200, f.read(), validators)
+
+    def telemetry(self, query):
+        serial = query.get('serial', [''])[0]
+        try:
+            duration = _seconds(query.get('duration', ['3h'])[0])
+        except ValueError:
+            return self.reply(400, b'{"message": "bad duration"}')
+        path = self.find(serial) if serial else None
+        answer = {}
+        if path is not None:
+            flight = self.flight(path)
+            if self.server.replay:
+                # clients count the duration in real time, which runs 'replay' times faster here
+                end = self.replay_time(path)
+                duration *= self.server.replay
+            else:
+                end = flight[-1][0] if flight else 0
+            recent = {packet['datetime']: packet for when, packet in flight if end - duration <= when <= end}
+            if recent:
+                answer[serial] = recent
+        self.reply(200, json.dumps(answer).encode())
+
+    # The packets of the canned json at 'path' as (time, packet) pairs in time order
+    def flight(self, path):
+        flights = self.server.flights
+        with self.server.lock:
+            if path not in flights:
+                opener = gzip.open if path.endswith('.gz') else open
+                with opener(path, 'rb') as f:
+                    packets = json.load(f)
+                timed = [(_timestamp(p.get('datetime')), p) for p in packets if isinstance(p, dict)]
+                flights[path] = sorted((pair for pair in timed if pair[0] is not None), key=lambda pair: pair[0])
+            return flights[path]
+
+    # The sonde time the replay of the flight at 'path' has reached
+    def replay_time(self, path):
+        flight = self.flight(path)
+        start = flight[0][0] if flight else 0
+        return start + (time.time() - self.server.started) * self.server.replay
+
+    # Path of the canned json for 'serial', or None when there isn't one
+    def find(self, serial):
+        base = os.path.join(self.server.directory, os.path.basename(serial))
+        for path in (base + '.json', base + '.json.gz'):
+            if os.path.exists(path):
+                return path
+        return None
+
+    def reply(self, status, body, headers=None):
+        gzipped = body and 'gzip' in self.headers.get('Accept-Encoding', '')
+        if gzipped:
+            body = gzip.compress(body, compresslevel=5)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if gzipped:
+            self.send_header('Content-Encoding', 'gzip')
+        if status != 304:
+            self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+
+# Epoch seconds of a SondeHub 'datetime' string, or None
+def _timestamp(text):
+    try:
+        return datetime.fromisoformat(str(text).replace('Z', '+00:00')).timestamp()
+    except ValueError:
+        return None
+
+
+# Seconds in a duration such as '30s', '15m', '3h' or '1d'
+def _seconds(duration):
+    units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+    if len(duration) < 2 or duration[-1] not in units:
+        raise ValueError(duration)
+    return float(duration[:-1]) * units[duration[-1]]
+
+
+def make_server(directory, host='127.0.0.1', port=0, fail_rate=0.0, delay=0.0, quiet=True, replay=0.0):
+    server = ThreadingHTTPServer((host, port), StandinHandler)
+    server.directory = directory
+    server.fail_rate = fail_rate
+    server.delay = delay
+    server.quiet = quiet
+    server.replay = replay
+    server.started = time.time()
+    server.flights = {}
+    server.lock = threading.Lock()
+    # connections accepted and requests answered so far
+    server.connections = 0
+    server.requests = 0
+    return server
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='Local stand-in for the SondeHub API')
+    ap.add_argument('directory', help='directory of <serial>.json / <serial>.json.gz files')
+    ap.add_argument('--host', default='127.0.0.1')
+    ap.add_argument('--port', type=int, default=8000)
+    ap.add_argument('--fail-rate', type=float, default=0.0, help='share of requests answered with 503')
+    ap.add_argument('--delay', type=float, default=0.0, help='seconds to wait before each reply')
+    ap.add_argument('--replay', type=float, default=0.0, metavar='SPEED',
+                    help='play the flights back from server start, SPEED times faster than real time')
+    ap.add_argument('--verbose', action='store_true', help='log every request')
+    args = ap.parse_args(argv)
+
+    server = make_server(args.directory, args.host, args.port, args.fail_rate, args.delay, not args.verbose,
+                         args.replay)
+    print('Serving {0} on http://{1}:{2}/sonde/'.format(args.directory, *server.server_address))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())